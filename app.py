@@ -1,7 +1,8 @@
 import os
 import sys
-from flask import Flask, request, render_template, send_file, redirect, url_for, send_from_directory
-import pandas as pd
+import logging
+from flask import (Flask, request, render_template, send_file, redirect, url_for, send_from_directory, session,
+                   jsonify, abort, Response)
 from werkzeug.utils import secure_filename
 
 # ---- Path Config ----
@@ -13,17 +14,79 @@ TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(RESULTS_DIR, exist_ok=True)
 
+# Headless rendering for the web workers and their plot pool (set before matplotlib loads)
+os.environ.setdefault("MPLBACKEND", "Agg")
+
 # Add src to path
 sys.path.append(BASE_DIR)
 
 # ---- Internal Imports ----
-from src.test_runner import run_tests_from_config
+# The test runner and plotting modules pull in scipy, matplotlib and seaborn;
+# they are imported on first use (or up front by `warm_imports` in preload mode)
+from src.dataset_store import DatasetStore, new_dataset_id
+from src.data_loader import read_csv_chunked
+from src.column_profile import build_profile
+from src.sampling import build_sample
+from src.job_queue import JobQueue, DONE
+from src.metrics import render_prometheus
+
+# Stage timings are logged as one JSON object per line by the "stats_court.metrics" logger
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"), format="%(asctime)s %(name)s %(levelname)s %(message)s")
+
+PLOTS_DIR = os.path.join(RESULTS_DIR, 'plots')
+# Uploads are kept per session; frames beyond the memory budget are reloaded from disk on demand
+dataset_store = DatasetStore()
+
+def run_job(job, progress):
+    """
+    Job handler: loads the job's dataset from the store and runs its config.
+    """
+    from src.test_runner import run_tests_from_config, referenced_columns
+    dataset_id = job["dataset_id"]
+    # Only the columns the config reads are opened (memory-mapped when not in memory)
+    outline = dataset_store.get_profile(dataset_id, columns=())
+    if outline is None:
+        df, profile = dataset_store.get(dataset_id), None
+    else:
+        columns = referenced_columns(job["config"], outline)
+        df = dataset_store.get_columns(dataset_id, columns)
+        profile = dataset_store.get_profile(dataset_id, columns)
+    if df is None:
+        raise ValueError("Dataset is no longer available")
+    # Every run writes to its own directory: results/jobs/<job_id>/report.html and plots/
+    run_tests_from_config(df, job["config"], defer_plots=True, profile=profile,
+                          report_path=job["report_path"], progress=progress,
+                          plot_dir=job_plots_dir(job), plot_prefix=f"/jobs/{job['id']}/plots/",
+                          accumulators=dataset_store.accumulators(dataset_id),
+                          sample=dataset_store.get_sample(dataset_id))
+
+def job_plots_dir(job):
+    return os.path.join(os.path.dirname(job["report_path"]), "plots")
+
+def store_sample(dataset_id, df, profile):
+    # Large uploads get a stratified preview sample for fast mode
+    sample, info = build_sample(df, profile)
+    if sample is not None:
+        dataset_store.put_sample(dataset_id, sample, info)
+
+def warm_imports():
+    """
+    Imports the heavy test and plotting modules now instead of on the first request.
+    Gunicorn's preload mode calls this in the master so forked workers share them.
+    """
+    import src.test_runner
+    import src.plot_renderer
+    import src.resampling
 
-RESULT_PATH = os.path.join(BASE_DIR, 'results', 'report.html')
-uploaded_data = {}
+# Test runs execute in the background; the request only submits them
+job_queue = JobQueue(run_job)
 
 app = Flask(__name__, template_folder='templates')
-app.config['UPLOAD_FOLDER'] = UPLOAD_DIR
+# All workers must share the key so any of them can read the session's upload ID; a
+# known default would let anyone sign a session with another dataset ID
+app.secret_key = os.environ.get("SECRET_KEY")
+if not app.secret_key:
+    raise RuntimeError("Set the SECRET_KEY environment variable before starting Stats Court")
 
 @app.route("/", methods=["GET", "POST"])
 def index():
@@ -34,30 +97,66 @@ def index():
             error = "Missing file"
         else:
             filename = secure_filename(file.filename)
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            # The raw file is kept with its dataset, so uploads with the same name never collide
+            dataset_id = new_dataset_id()
+            filepath = dataset_store.upload_path(dataset_id, "upload.csv")
             file.save(filepath)
             try:
-                df = pd.read_csv(filepath)
-                uploaded_data['df'] = df
-                uploaded_data['df_preview'] = df.head().to_html(classes="preview-table", index=False)
+                df, columns, preview = read_csv_chunked(filepath)
+                profile = build_profile(df, columns)
+                dataset_store.put(dataset_id, df, {
+                    "filename": filename,
+                    "preview": preview.to_html(classes="preview-table", index=False)
+                }, profile=profile)
+                store_sample(dataset_id, df, profile)
+                session["dataset_id"] = dataset_id
                 return redirect(url_for("select_test"))
             except Exception as e:
+                dataset_store.delete(dataset_id)
                 error = f"Error reading CSV: {e}"
-    return render_template("index.html", error=error, df_html=uploaded_data.get('df_preview'))
+    meta = dataset_store.get_meta(session.get("dataset_id"))
+    return render_template("index.html", error=error, df_html=meta.get("preview"))
+
+@app.route("/append", methods=["POST"])
+def append_rows():
+    # New rows for the session's dataset; tests then only scan what was added
+    dataset_id = session.get("dataset_id")
+    file = request.files.get("csv_file")
+    if dataset_store.get(dataset_id) is None:
+        return redirect(url_for("index"))
+    if not file:
+        return redirect(url_for("select_test", error="Missing file"))
+    filepath = dataset_store.upload_path(dataset_id, f"append-{new_dataset_id()}.csv")
+    file.save(filepath)
+    try:
+        new_rows, _, _ = read_csv_chunked(filepath)
+        df = dataset_store.append(dataset_id, new_rows)
+        profile = build_profile(df)
+        dataset_store.put_profile(dataset_id, profile)
+        store_sample(dataset_id, df, profile)
+    except Exception as e:
+        return redirect(url_for("select_test", error=f"Error appending CSV: {e}"))
+    return redirect(url_for("select_test"))
 
 @app.route("/select-test", methods=["GET", "POST"])
 def select_test():
-    df = uploaded_data.get("df")
-    df_preview = uploaded_data.get("df_preview")
-    error = None
-
-    if df is None:
+    dataset_id = session.get("dataset_id")
+    if not dataset_store.exists(dataset_id):
         return redirect(url_for("index"))
+    meta = dataset_store.get_meta(dataset_id)
+    df_preview = meta.get("preview")
+    error = request.args.get("error")
 
-    # Extract columns
-    cat_cols = df.select_dtypes(include="object").columns.tolist()
-    num_cols = df.select_dtypes(include="number").columns.tolist()
-    binary_cols = [col for col in cat_cols if df[col].nunique() == 2]
+    # Column lists come from the profile built at upload time; the frame is only
+    # loaded for datasets stored without one
+    profile = dataset_store.get_profile(dataset_id)
+    if profile is None:
+        profile = build_profile(dataset_store.get(dataset_id))
+        dataset_store.put_profile(dataset_id, profile)
+    has_sample = dataset_store.has_sample(dataset_id)
+    cat_cols = profile.categorical_cols
+    num_cols = profile.numeric_cols
+    binary_cols = profile.binary_cols
 
     if request.method == "POST":
         test_type = request.form.get("test_type")
@@ -81,7 +180,7 @@ def select_test():
             cat_col = request.form.get("cat_col")
             if not num_col or not cat_col:
                 error = "Please select both a numerical and a binary categorical column for T-test."
-            elif df[cat_col].nunique() != 2:
+            elif profile.nunique(cat_col) != 2:
                 error = "Selected categorical column must have exactly two unique values for T-test."
             else:
                 config = [{
@@ -105,34 +204,140 @@ def select_test():
                     "method": method,
                     "hypothesis": f"{corr1} is correlated with {corr2}"
                 }]
+        elif test_type == "anova":
+            num_col = request.form.get("anova_num")
+            cat_col = request.form.get("anova_cat")
+            method = request.form.get("anova_method", "anova")
+            if not num_col or not cat_col:
+                error = "Please select a numerical and a categorical column for ANOVA."
+            elif profile.nunique(cat_col) < 2:
+                error = "Selected categorical column must have at least two groups."
+            else:
+                config = [{
+                    "type": "anova",
+                    "num": num_col,
+                    "cat": cat_col,
+                    "method": method,
+                    "hypothesis": f"{num_col} differs across the groups of {cat_col}"
+                }]
         else:
             error = "Please select a test type."
 
         if config and not error:
-            run_tests_from_config(df, config)
-            return redirect(url_for("view_report"))
+            if request.form.get("fast") and has_sample:
+                for test in config:
+                    test["fast"] = True
+            job_id = job_queue.submit(dataset_id, config)
+            session["job_id"] = job_id
+            return redirect(url_for("job_page", job_id=job_id))
 
     return render_template("select_test.html",
                           df_html=df_preview,
                           cat_cols=cat_cols,
                           num_cols=num_cols,
                           binary_cols=binary_cols,
+                          has_sample=has_sample,
                           error=error)
 
+def send_plot(plots_dir, filename):
+    # Plots render in the background; draw this one now if the pool hasn't reached it yet
+    plot_path = os.path.join(plots_dir, filename)
+    if os.path.abspath(plot_path).startswith(plots_dir + os.sep) and not os.path.exists(plot_path):
+        from src.plot_renderer import ensure_plot, plot_error
+        if not ensure_plot(plot_path):
+            error = plot_error(plot_path)
+            if error is not None:
+                abort(500, description=f"The plot could not be rendered: {error}")
+    return send_from_directory(plots_dir, filename)
+
 @app.route('/plots/<path:filename>')
 def serve_plot(filename):
-    return send_from_directory(os.path.join('results', 'plots'), filename)
+    return send_plot(PLOTS_DIR, filename)
+
+@app.route('/jobs/<job_id>/plots/<path:filename>')
+def serve_job_plot(job_id, filename):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return send_plot(job_plots_dir(job), filename)
+
+@app.route("/jobs/<job_id>")
+def job_page(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        abort(404)
+    return render_template("job_status.html", job=status)
+
+@app.route("/jobs/<job_id>/status")
+def job_status(job_id):
+    status = job_queue.status(job_id)
+    if status is None:
+        abort(404)
+    return jsonify(status)
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def cancel_job(job_id):
+    job_queue.cancel(job_id)
+    return redirect(url_for("job_page", job_id=job_id))
+
+@app.route("/jobs/<job_id>/full", methods=["POST"])
+def full_precision_job(job_id):
+    # Re-runs a fast (sampled) job's config on the whole dataset
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    config = [{k: v for k, v in test.items() if k != "fast"} for test in job["config"]]
+    new_job_id = job_queue.submit(job["dataset_id"], config)
+    session["job_id"] = new_job_id
+    return redirect(url_for("job_page", job_id=new_job_id))
+
+@app.route("/jobs/<job_id>/report")
+def job_report(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    if job["status"] != DONE:
+        return redirect(url_for("job_page", job_id=job_id))
+    return send_file(job["report_path"])
+
+@app.route("/jobs/<job_id>/download")
+def job_download(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    if job["status"] != DONE:
+        return redirect(url_for("job_page", job_id=job_id))
+    return send_file(job["report_path"], as_attachment=True, download_name="report.html")
+
+@app.route("/metrics")
+def metrics():
+    # Prometheus text format; counters are per worker process
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+def latest_report_path():
+    # The session's most recent finished job; never another user's run
+    job = job_queue.get(session.get("job_id", ""))
+    if job is not None and job["status"] == DONE and os.path.exists(job["report_path"]):
+        return job["report_path"]
+    return None
 
 @app.route("/report")
 def view_report():
-    return send_file(RESULT_PATH)
+    report_path = latest_report_path()
+    if report_path is None:
+        return redirect(url_for("select_test"))
+    return send_file(report_path)
 
 @app.route("/download")
 def download_report():
-    return send_file(RESULT_PATH, as_attachment=True, download_name="report.html")
+    report_path = latest_report_path()
+    if report_path is None:
+        return redirect(url_for("select_test"))
+    return send_file(report_path, as_attachment=True, download_name="report.html")
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 10000))
+    job_queue.recover()
     app.run(host="0.0.0.0", port=port)
 
 
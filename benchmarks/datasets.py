@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+
+
+def make_dataset(rows, num_cols=4, cat_cols=3, cardinality=5, null_frac=0.01, seed=0):
+    """
+    Synthetic mixed-type dataset for benchmarking.
+
+    Numeric columns are `num_0..`, with `num_1` correlated to `num_0`.
+    Categorical columns are `cat_0..`; `cat_0` is always binary (for the t-test)
+    and the others have `cardinality` levels. About `null_frac` of each column is missing.
+    """
+    rng = np.random.default_rng(seed)
+    data = {}
+    base = rng.normal(size=rows)
+    for i in range(num_cols):
+        col = rng.normal(loc=i, scale=1 + i, size=rows)
+        if i == 1:
+            col += 0.5 * base
+        data[f"num_{i}"] = base if i == 0 else col
+    for i in range(cat_cols):
+        levels = 2 if i == 0 else cardinality
+        labels = np.array([f"L{j}" for j in range(levels)], dtype=object)
+        data[f"cat_{i}"] = labels[rng.integers(0, levels, rows)]
+    df = pd.DataFrame(data)
+    if null_frac:
+        for col in df.columns:
+            df.loc[rng.random(rows) < null_frac, col] = np.nan
+    return df
+
+
+def write_csv(df, path):
+    df.to_csv(path, index=False)
+    return path
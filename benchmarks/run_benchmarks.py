@@ -0,0 +1,241 @@
+"""
+Benchmarks for the hot paths: CSV ingestion, profiling, each hypothesis test,
+plot rendering, report writing and the whole upload -> job -> report flow
+through the Flask test client.
+
+    python -m benchmarks.run_benchmarks --rows 10000 100000 --output bench.json
+    python -m benchmarks.run_benchmarks --baseline bench.json --threshold 0.2
+
+Each stage is timed (best of --repeat runs) and then run once more under
+tracemalloc for its peak Python-heap allocation. With --baseline the run fails
+(exit code 1) if any stage is slower than the baseline by more than --threshold.
+"""
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import pickle
+import secrets
+import argparse
+import platform
+import tempfile
+import tracemalloc
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(BASE_DIR)
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.datasets import make_dataset, write_csv
+from src.data_loader import read_csv_chunked
+from src.column_profile import build_profile
+from src.hypothesis_tests import categorical_associations, t_test, correlation_test
+from src.batch_tests import correlation_matrix
+from src.plot_renderer import render_plot, SPEC_SUFFIX
+from src.report_generator import ReportBuilder, TestResult
+from src.utils import PLOT_FORMAT
+
+
+def measure(fn, repeat=3):
+    """
+    Best wall time of `repeat` calls, then one traced call for peak memory (MB).
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": min(times), "peak_mb": peak / 1024 ** 2}
+
+
+def test_stages(df, profile, workdir):
+    """
+    Statistics-only callables for each hypothesis test; plots are only recorded
+    as specs so the plotting stage can be timed on its own.
+    """
+    def plot_path(name):
+        return os.path.join(workdir, f"{name}.png")
+
+    return {
+        "chi2": lambda: categorical_associations(df, "cat_0", "cat_1", return_all=True,
+                                                 save_path=plot_path("chi2"), defer_plot=True, profile=profile),
+        "chi2_no_profile": lambda: categorical_associations(df, "cat_1", "cat_2", return_all=True,
+                                                            save_path=plot_path("chi2_raw"), defer_plot=True),
+        "ttest": lambda: t_test(df, "cat_0", "num_0", return_all=True,
+                                save_path=plot_path("ttest"), defer_plot=True, profile=profile),
+        "correlation_pearson": lambda: correlation_test(df, "num_0", "num_1", "pearson",
+                                                        save_path=plot_path("pearson"), defer_plot=True),
+        "correlation_spearman": lambda: correlation_test(df, "num_0", "num_1", "spearman",
+                                                         save_path=plot_path("spearman"), defer_plot=True),
+        # Every benchmark column has missing values, so this times the pairwise-complete re-ranking
+        "correlation_matrix_spearman": lambda: correlation_matrix(df, profile.numeric_cols, "spearman"),
+    }
+
+
+def report_stage(workdir, n_results):
+    def write_report():
+        report = ReportBuilder(os.path.join(workdir, "report.html"))
+        for i in range(n_results):
+            report.add_result(TestResult(
+                hypothesis=f"Hypothesis {i}", test_name="T-test", stat=1.2345, p_value=0.0123,
+                conclusion="Reject H₀", interpretation="Benchmark result",
+                plot_path=os.path.join(workdir, f"plot_{i}.png")
+            ), summary={"Hypothesis": f"Hypothesis {i}", "Test": "T-test", "p-value": 0.0123,
+                        "Verdict": "Reject H₀"})
+        report.write()
+    return write_report
+
+
+def end_to_end(df, seed, workdir):
+    """
+    Upload -> select test -> wait for the job -> fetch report and plots, through the
+    Flask test client. Each call perturbs the data so the result cache never hits.
+    Datasets, jobs and cached results go under `workdir`, not the app's own folders.
+    """
+    # The app refuses to start without a session key; any key works for the test client
+    os.environ.setdefault("SECRET_KEY", secrets.token_hex(32))
+    import app as app_module
+    import src.result_cache as result_cache
+    from src.dataset_store import DatasetStore
+    from src.job_queue import JobQueue
+    app_module.dataset_store = DatasetStore(os.path.join(workdir, "datasets"))
+    app_module.job_queue = JobQueue(app_module.run_job, db_path=os.path.join(workdir, "jobs", "jobs.sqlite3"))
+    result_cache.CACHE_DIR = os.path.join(workdir, "cache")
+    client = app_module.app.test_client()
+    calls = {"n": 0}
+
+    def run():
+        calls["n"] += 1
+        data = df.copy()
+        data.iloc[0, 0] = seed + calls["n"]
+        buffer = io.BytesIO(data.to_csv(index=False).encode())
+        client.post("/", data={"csv_file": (buffer, "benchmark.csv")}, content_type="multipart/form-data")
+        response = client.post("/select-test", data={"test_type": "ttest", "num_col": "num_0", "cat_col": "cat_0"})
+        job_url = response.location
+        while True:
+            status = client.get(job_url + "/status").get_json()
+            if status["status"] not in ("queued", "running"):
+                break
+            time.sleep(0.01)
+        if status["status"] != "done":
+            raise RuntimeError(f"Benchmark job ended as {status['status']}: {status['error']}")
+        client.get(job_url + "/report").close()
+        job = app_module.job_queue.get(job_url.rstrip("/").rsplit("/", 1)[-1])
+        for name in os.listdir(app_module.job_plots_dir(job)):
+            if name.startswith("ttest_num_0_by_cat_0") and name.endswith(f".{PLOT_FORMAT}"):
+                client.get(f"{job_url}/plots/{name}").close()
+
+    return run
+
+
+def run_scenario(rows, args, workdir):
+    df = make_dataset(rows, args.num_cols, args.cat_cols, args.cardinality, seed=args.seed)
+    csv_path = write_csv(df, os.path.join(workdir, "data.csv"))
+    results = {}
+
+    def record(stage, fn, repeat=args.repeat):
+        results[stage] = measure(fn, repeat)
+        print(f"⏱️ {rows} rows / {stage}: {results[stage]['seconds']:.4f}s, peak {results[stage]['peak_mb']:.1f} MB")
+
+    record("ingest_csv", lambda: read_csv_chunked(csv_path))
+    loaded, columns, _ = read_csv_chunked(csv_path)
+    record("profile", lambda: build_profile(loaded, columns))
+    profile = build_profile(loaded, columns)
+
+    for stage, fn in test_stages(loaded, profile, workdir).items():
+        record(stage, fn)
+
+    specs = [os.path.join(workdir, name) for name in os.listdir(workdir) if name.endswith(SPEC_SUFFIX)]
+    for spec_path in sorted(specs):
+        with open(spec_path, "rb") as f:
+            spec = pickle.load(f)
+        name = os.path.splitext(os.path.basename(spec["save_path"]))[0]
+        # render_plot saves through save_figure, like the deferred renderer
+        record(f"plot_{name}", lambda spec=spec: render_plot(spec["kind"], spec["save_path"], **spec["data"]))
+
+    record("report_write", report_stage(workdir, args.report_results))
+    if not args.skip_e2e:
+        record("end_to_end", end_to_end(df, args.seed, os.path.join(workdir, "app")),
+               repeat=max(1, args.repeat - 1))
+    return results
+
+
+def compare(current, baseline, threshold):
+    """
+    Stages whose time regressed by more than `threshold` (a fraction) against the baseline.
+    """
+    regressions = []
+    for scenario, stages in current["results"].items():
+        for stage, result in stages.items():
+            before = baseline.get("results", {}).get(scenario, {}).get(stage)
+            if not before or before["seconds"] <= 0:
+                continue
+            ratio = result["seconds"] / before["seconds"]
+            if ratio > 1 + threshold:
+                regressions.append({"scenario": scenario, "stage": stage, "baseline": before["seconds"],
+                                    "current": result["seconds"], "ratio": ratio})
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stats Court benchmarks")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--num-cols", type=int, default=4)
+    parser.add_argument("--cat-cols", type=int, default=3)
+    parser.add_argument("--cardinality", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--report-results", type=int, default=50, help="result blocks in the report stage")
+    parser.add_argument("--skip-e2e", action="store_true", help="skip the Flask end-to-end stage")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="earlier JSON output to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, e.g. 0.2 = 20%%")
+    args = parser.parse_args(argv)
+    if args.num_cols < 2 or args.cat_cols < 2:
+        parser.error("--num-cols and --cat-cols must be at least 2")
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "pandas": pd.__version__,
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": {},
+    }
+    for rows in args.rows:
+        workdir = tempfile.mkdtemp(prefix="stats_court_bench_")
+        try:
+            output["results"][f"rows={rows}"] = run_scenario(rows, args, workdir)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(output, json.load(f), args.threshold)
+        output["regressions"] = regressions
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"📝 Benchmark results written to: {args.output}")
+
+    for r in regressions:
+        print(f"❌ {r['scenario']} / {r['stage']}: {r['current']:.4f}s vs {r['baseline']:.4f}s ({r['ratio']:.2f}x)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
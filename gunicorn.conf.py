@@ -0,0 +1,31 @@
+"""
+Gunicorn settings, picked up automatically when started from the project root:
+
+    gunicorn app:app --bind 0.0.0.0:$PORT
+
+With STATS_COURT_PRELOAD=1 the master imports the app and its scientific and plotting
+modules once before forking, so workers share them copy-on-write instead of each
+importing them on its first test run.
+"""
+import os
+import gc
+
+preload_app = os.environ.get("STATS_COURT_PRELOAD", "0") == "1"
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before any worker is forked
+    if preload_app:
+        import app
+        app.warm_imports()
+        # Keep the collector from writing to (and so copying) the shared objects in every worker
+        gc.freeze()
+
+
+def post_worker_init(worker):
+    # Each worker's plot pool gets its share of the cores (`plot_renderer.plot_workers`)
+    os.environ["STATS_COURT_WEB_WORKERS"] = str(worker.cfg.workers)
+    # Jobs a dead worker left running are failed once their lease lapses, and queued ones
+    # are picked up by the new worker (`JobQueue.resume`)
+    from app import job_queue
+    job_queue.resume()
@@ -0,0 +1,357 @@
+"""
+Mergeable sufficient statistics for the single-pair tests.
+
+Each accumulator remembers how many rows it has consumed (`rows_seen`), so when a
+dataset only grows, `update_to(df)` scans just the appended rows. Accumulators built
+on disjoint shards can be combined with `merge`, and round-trip through `to_dict` /
+`from_dict` (plain JSON).
+"""
+import os
+import abc
+import json
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+from src.batch_tests import chi2_statistic, _t_pvalue
+from src.group_stats import GroupSummary
+
+
+def _plain(label):
+    # NumPy scalars -> Python values so labels survive a JSON round trip
+    return label.item() if isinstance(label, np.generic) else label
+
+
+def _level_codes(values, levels, index):
+    """
+    Codes of `values` against a growing level list (new labels are appended);
+    missing values get -1.
+    """
+    codes, uniques = pd.factorize(values)
+    mapping = np.empty(len(uniques), dtype=np.int64)
+    for j, label in enumerate(uniques):
+        label = _plain(label)
+        if label not in index:
+            index[label] = len(levels)
+            levels.append(label)
+        mapping[j] = index[label]
+    if len(mapping) == 0:
+        return np.full(len(codes), -1, dtype=np.int64)
+    return np.where(codes >= 0, mapping[np.maximum(codes, 0)], -1)
+
+
+def _map_levels(other_levels, levels, index):
+    # Positions of another accumulator's levels in ours, adding the ones we haven't seen
+    mapping = np.empty(len(other_levels), dtype=np.int64)
+    for j, label in enumerate(other_levels):
+        if label not in index:
+            index[label] = len(levels)
+            levels.append(label)
+        mapping[j] = index[label]
+    return mapping
+
+
+def _pad(array, shape):
+    return np.pad(array, [(0, s - d) for s, d in zip(shape, array.shape)])
+
+
+def combine_moments(n_a, mean_a, m2_a, n_b, mean_b, m2_b):
+    """
+    Chan et al. parallel update of (count, mean, sum of squared deviations).
+    Works element-wise; empty sides are handled.
+    """
+    n = n_a + n_b
+    with np.errstate(invalid="ignore", divide="ignore"):
+        delta = mean_b - mean_a
+        mean = np.where(n_a == 0, mean_b, np.where(n_b == 0, mean_a, mean_a + delta * n_b / n))
+        m2 = np.where(n_a == 0, m2_b, np.where(n_b == 0, m2_a, m2_a + m2_b + delta ** 2 * n_a * n_b / n))
+    return n, mean, m2
+
+
+class Accumulator(abc.ABC):
+    """
+    Base class of the accumulators: subclasses define `kind`, `update`, `merge`,
+    `to_dict` and `from_dict`.
+    """
+    kind = None
+
+    def __init__(self, col1, col2):
+        self.col1 = col1
+        self.col2 = col2
+        self.rows_seen = 0
+
+    @abc.abstractmethod
+    def update(self, df):
+        """
+        Adds the rows of `df` (a batch not seen before).
+        """
+
+    @abc.abstractmethod
+    def merge(self, other):
+        """
+        Adds the state of an accumulator built on other rows of the same columns.
+        """
+
+    def update_to(self, df):
+        """
+        Brings the state up to date with an append-only `df`, scanning only rows past `rows_seen`.
+        """
+        if len(df) < self.rows_seen:
+            raise ValueError("Dataset shrank; accumulated statistics no longer apply")
+        if len(df) > self.rows_seen:
+            self.update(df.iloc[self.rows_seen:])
+        return self
+
+    def key(self):
+        return hashlib.sha256(json.dumps([self.kind, self.col1, self.col2]).encode()).hexdigest()[:32]
+
+    def to_dict(self):
+        return {"kind": self.kind, "col1": self.col1, "col2": self.col2, "rows_seen": self.rows_seen}
+
+
+class ContingencyAccumulator(Accumulator):
+    """
+    Cross-tabulated counts of two categorical columns (for the chi-square test).
+    """
+    kind = "contingency"
+
+    def __init__(self, col1, col2):
+        super().__init__(col1, col2)
+        self.levels1, self.levels2 = [], []
+        self.counts = np.zeros((0, 0), dtype=np.int64)
+
+    def _indexes(self):
+        return ({label: i for i, label in enumerate(self.levels1)},
+                {label: i for i, label in enumerate(self.levels2)})
+
+    def update(self, df):
+        index1, index2 = self._indexes()
+        a = _level_codes(df[self.col1], self.levels1, index1)
+        b = _level_codes(df[self.col2], self.levels2, index2)
+        k1, k2 = len(self.levels1), len(self.levels2)
+        valid = (a >= 0) & (b >= 0)
+        batch = np.bincount(a[valid] * k2 + b[valid], minlength=k1 * k2).reshape(k1, k2)
+        self.counts = _pad(self.counts, (k1, k2)) + batch
+        self.rows_seen += len(df)
+        return self
+
+    def merge(self, other):
+        index1, index2 = self._indexes()
+        map1 = _map_levels(other.levels1, self.levels1, index1)
+        map2 = _map_levels(other.levels2, self.levels2, index2)
+        self.counts = _pad(self.counts, (len(self.levels1), len(self.levels2)))
+        self.counts[np.ix_(map1, map2)] += other.counts
+        self.rows_seen += other.rows_seen
+        return self
+
+    def table(self):
+        """
+        The contingency table as a DataFrame, empty rows/columns dropped and labels sorted
+        like `pd.crosstab`.
+        """
+        table = pd.DataFrame(self.counts, index=pd.Index(self.levels1, name=self.col1),
+                             columns=pd.Index(self.levels2, name=self.col2))
+        table = table.loc[table.sum(axis=1) > 0, table.sum(axis=0) > 0]
+        try:
+            return table.sort_index().sort_index(axis=1)
+        except TypeError:
+            return table
+
+    def chi2(self):
+        return chi2_statistic(self.table().to_numpy())
+
+    def to_dict(self):
+        state = super().to_dict()
+        state.update(levels1=self.levels1, levels2=self.levels2, counts=self.counts.tolist())
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        acc = cls(state["col1"], state["col2"])
+        acc.rows_seen = state["rows_seen"]
+        acc.levels1, acc.levels2 = list(state["levels1"]), list(state["levels2"])
+        acc.counts = np.array(state["counts"], dtype=np.int64).reshape(len(acc.levels1), len(acc.levels2))
+        return acc
+
+
+class GroupMomentsAccumulator(Accumulator):
+    """
+    Per-group count, mean and sum of squared deviations of `col2` by the levels of `col1`
+    (Welford/Chan updates; for the t-test and ANOVA).
+    """
+    kind = "group_moments"
+
+    def __init__(self, col1, col2):
+        super().__init__(col1, col2)
+        self.levels = []
+        self.n = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+
+    def update(self, df):
+        codes = _level_codes(df[self.col1], self.levels, {label: i for i, label in enumerate(self.levels)})
+        y = df[self.col2].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = (codes >= 0) & ~np.isnan(y)
+        c, v = codes[valid], y[valid]
+        k = len(self.levels)
+        n = np.bincount(c, minlength=k).astype(np.float64)
+        # Centre on the batch mean first so large offsets keep their precision
+        shift = v.mean() if len(v) else 0.0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            centered = np.where(n > 0, np.bincount(c, weights=v - shift, minlength=k) / n, 0.0)
+        m2 = np.bincount(c, weights=(v - shift - centered[c]) ** 2, minlength=k)
+        mean = centered + shift
+        self.n, self.mean, self.m2 = combine_moments(_pad(self.n, (k,)), _pad(self.mean, (k,)), _pad(self.m2, (k,)),
+                                                     n, mean, m2)
+        self.rows_seen += len(df)
+        return self
+
+    def merge(self, other):
+        mapping = _map_levels(other.levels, self.levels, {label: i for i, label in enumerate(self.levels)})
+        k = len(self.levels)
+        n, mean, m2 = np.zeros(k), np.zeros(k), np.zeros(k)
+        n[mapping], mean[mapping], m2[mapping] = other.n, other.mean, other.m2
+        self.n, self.mean, self.m2 = combine_moments(_pad(self.n, (k,)), _pad(self.mean, (k,)), _pad(self.m2, (k,)),
+                                                     n, mean, m2)
+        self.rows_seen += other.rows_seen
+        return self
+
+    def group_summary(self):
+        """
+        The state as a single-target `src.group_stats.GroupSummary`.
+        """
+        present = self.n > 0
+        return GroupSummary([l for l, p in zip(self.levels, present) if p], [self.col2],
+                            self.n[present][None, :], self.mean[present][None, :], self.m2[present][None, :])
+
+    def to_dict(self):
+        state = super().to_dict()
+        state.update(levels=self.levels, n=self.n.tolist(), mean=self.mean.tolist(), m2=self.m2.tolist())
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        acc = cls(state["col1"], state["col2"])
+        acc.rows_seen = state["rows_seen"]
+        acc.levels = list(state["levels"])
+        acc.n, acc.mean, acc.m2 = (np.array(state[k], dtype=np.float64) for k in ("n", "mean", "m2"))
+        return acc
+
+
+class CoMomentAccumulator(Accumulator):
+    """
+    Count, means, sums of squared deviations and the co-moment of two numeric columns
+    over their pairwise-complete rows (for the Pearson correlation).
+    """
+    kind = "comoments"
+
+    def __init__(self, col1, col2):
+        super().__init__(col1, col2)
+        self.n = 0.0
+        self.mean = np.zeros(2)
+        self.m2 = np.zeros(2)
+        self.cxy = 0.0
+
+    def _add(self, n, mean, m2, cxy):
+        if n == 0:
+            return
+        total = self.n + n
+        delta = mean - self.mean
+        self.cxy = self.cxy + cxy + delta[0] * delta[1] * self.n * n / total
+        self.n, self.mean, self.m2 = combine_moments(self.n, self.mean, self.m2, n, mean, m2)
+        self.n = float(total)
+
+    def update(self, df):
+        x = df[self.col1].to_numpy(dtype=np.float64, na_value=np.nan)
+        y = df[self.col2].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = ~np.isnan(x) & ~np.isnan(y)
+        x, y = x[valid], y[valid]
+        if len(x):
+            mean = np.array([x.mean(), y.mean()])
+            dx, dy = x - mean[0], y - mean[1]
+            self._add(float(len(x)), mean, np.array([dx @ dx, dy @ dy]), float(dx @ dy))
+        self.rows_seen += len(df)
+        return self
+
+    def merge(self, other):
+        self._add(other.n, other.mean, other.m2, other.cxy)
+        self.rows_seen += other.rows_seen
+        return self
+
+    def pearson(self):
+        """
+        Returns (r, p, n).
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r = self.cxy / np.sqrt(self.m2[0] * self.m2[1])
+        r = float(np.clip(r, -1.0, 1.0))
+        return r, float(_t_pvalue(np.array(r), np.array(self.n))), int(self.n)
+
+    def to_dict(self):
+        state = super().to_dict()
+        state.update(n=self.n, mean=self.mean.tolist(), m2=self.m2.tolist(), cxy=self.cxy)
+        return state
+
+    @classmethod
+    def from_dict(cls, state):
+        acc = cls(state["col1"], state["col2"])
+        acc.rows_seen = state["rows_seen"]
+        acc.n, acc.cxy = float(state["n"]), float(state["cxy"])
+        acc.mean, acc.m2 = np.array(state["mean"]), np.array(state["m2"])
+        return acc
+
+
+ACCUMULATORS = {cls.kind: cls for cls in (ContingencyAccumulator, GroupMomentsAccumulator, CoMomentAccumulator)}
+
+
+def from_dict(state):
+    return ACCUMULATORS[state["kind"]].from_dict(state)
+
+
+def accumulator_for(test):
+    """
+    A fresh accumulator for a single-pair test config, or None if the test
+    has no mergeable statistics (e.g. Spearman).
+    """
+    test_type = test.get("type")
+    if test_type == "chi2":
+        return ContingencyAccumulator(test["col1"], test["col2"])
+    if test_type == "ttest":
+        return GroupMomentsAccumulator(test["cat"], test["num"])
+    if test_type == "correlation" and test.get("method", "pearson") == "pearson":
+        return CoMomentAccumulator(test["col1"], test["col2"])
+    return None
+
+
+class AccumulatorStore:
+    """
+    Accumulator states of one dataset, kept as JSON files under `path`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _file(self, acc):
+        return os.path.join(self.path, f"{acc.key()}.json")
+
+    def get(self, test):
+        """
+        The stored accumulator for `test` (or a fresh one); None if the test isn't mergeable.
+        """
+        acc = accumulator_for(test)
+        if acc is None:
+            return None
+        try:
+            with open(self._file(acc), "r", encoding="utf-8") as f:
+                return from_dict(json.load(f))
+        except (FileNotFoundError, ValueError, KeyError):
+            return acc
+
+    def save(self, acc):
+        os.makedirs(self.path, exist_ok=True)
+        file_path = self._file(acc)
+        tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(acc.to_dict(), f)
+        os.replace(tmp_path, file_path)
@@ -0,0 +1,354 @@
+import numpy as np
+import pandas as pd
+import scipy.stats as stats
+
+# Column selectors accepted in batch configs
+ALL_NUMERIC = "all_numeric"
+ALL_CATEGORICAL = "all_categorical"
+
+
+def numeric_columns(df):
+    return df.select_dtypes(include="number").columns.tolist()
+
+
+def categorical_columns(df):
+    return df.select_dtypes(include=["object", "category", "string"]).columns.tolist()
+
+
+def expand_columns(df, spec, profile=None):
+    """
+    Resolves a column spec from a config ("all_numeric", "all_categorical",
+    a single column name or a list of names) into a list of column names.
+    """
+    if spec == ALL_NUMERIC:
+        return profile.numeric_cols if profile else numeric_columns(df)
+    if spec == ALL_CATEGORICAL:
+        return profile.categorical_cols if profile else categorical_columns(df)
+    if isinstance(spec, str):
+        return [spec]
+    return list(spec)
+
+
+def config_columns(df, test, profile=None):
+    """
+    Lists the dataset columns a single or batched test config reads.
+    """
+    test_type = test.get("type")
+    if is_batch_config(test):
+        if test_type == "ttest":
+            return (expand_columns(df, test.get("num", ALL_NUMERIC), profile)
+                    + expand_columns(df, test.get("cat", ALL_CATEGORICAL), profile))
+        if "pairs" in test:
+            return sorted({c for pair in test["pairs"] for c in pair})
+        default = ALL_NUMERIC if test_type == "correlation" else ALL_CATEGORICAL
+        return expand_columns(df, test.get("cols", default), profile)
+    if test_type == "anova":
+        # "num" may list several targets (or "all_numeric")
+        cols = [test.get("cat")] + expand_columns(df, test.get("num") or [], profile)
+    elif test_type == "ttest":
+        cols = [test.get("cat"), test.get("num")]
+    else:
+        cols = [test.get("col1"), test.get("col2")]
+    # Segmented runs ("by": <column>) also read the segment column
+    return cols + [test["by"]] if test.get("by") else cols
+
+
+def is_batch_config(test):
+    """
+    A config is batched when it targets several columns at once, e.g.
+    {"type": "correlation", "cols": "all_numeric"} or a t-test whose
+    "num"/"cat" entries are lists.
+    """
+    if "cols" in test or "pairs" in test:
+        return True
+    if test.get("type") == "ttest":
+        return any(
+            isinstance(test.get(key), (list, tuple)) or test.get(key) in (ALL_NUMERIC, ALL_CATEGORICAL)
+            for key in ("num", "cat")
+        )
+    return False
+
+
+def _t_pvalue(r, n):
+    """
+    Two-sided p-value for correlation coefficients using the t distribution
+    with n - 2 degrees of freedom (what pearsonr/spearmanr report).
+    """
+    r = np.clip(r, -1.0, 1.0)
+    dof = n - 2.0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = r * np.sqrt(dof / (1.0 - r * r))
+        p = 2 * stats.t.sf(np.abs(t), dof)
+    p = np.where(np.abs(r) >= 1.0, 0.0, p)
+    return np.where(dof > 0, p, np.nan)
+
+
+def _pearson_matrix(X):
+    """
+    Pairwise-complete Pearson matrix for a 2-D float array with NaNs.
+    Returns (r, n) where n[i, j] is the number of rows where both columns are present.
+    """
+    M = ~np.isnan(X)
+    # Shift by the column mean before forming sums of squares to keep them stable
+    X0 = np.where(M, X - np.nanmean(X, axis=0), 0.0)
+    if M.all():
+        n = np.full((X.shape[1], X.shape[1]), float(X.shape[0]))
+        cov = X0.T @ X0
+        var = np.diag(cov)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            r = cov / np.sqrt(np.outer(var, var))
+        return r, n
+
+    Mf = M.astype(np.float64)
+    n = Mf.T @ Mf
+    sx = X0.T @ Mf             # sx[i, j]: sum of x_i over rows where x_i and x_j are present
+    sxx = (X0 * X0).T @ Mf
+    sxy = X0.T @ X0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sx.T / n
+        var_i = sxx - sx * sx / n
+        var_j = var_i.T
+        r = cov / np.sqrt(var_i * var_j)
+    return r, n
+
+
+def _tie_bounds(sorted_values):
+    """
+    For each position of a sorted array, the start and end (exclusive) of its run of ties.
+    """
+    new = np.ones(len(sorted_values), dtype=bool)
+    new[1:] = sorted_values[1:] != sorted_values[:-1]
+    starts = np.flatnonzero(new)
+    ends = np.append(starts[1:], len(sorted_values))
+    group = np.cumsum(new) - 1
+    return starts[group], ends[group]
+
+
+def _pair_ranks(order, first, end, keep):
+    """
+    Average ranks of one column over its rows in `keep`, given its present rows in
+    sorted `order` and the tie run [first, end) of each sorted position. With K[k]
+    the number of kept rows before position k, a kept value ranks (K[first] + K[end] + 1) / 2.
+    Returns a full-length array that is NaN outside `keep`.
+    """
+    kept = keep[order]
+    K = np.zeros(len(kept) + 1)
+    np.cumsum(kept, out=K[1:])
+    out = np.full(len(keep), np.nan)
+    out[order[kept]] = (K[first[kept]] + K[end[kept]] + 1) / 2.0
+    return out
+
+
+def _spearman_matrix(X, ranks):
+    """
+    Pairwise-complete Spearman matrix from per-column `ranks` of X (NaN where missing).
+    Pairs touching a column with missing values reuse each column's sort order and
+    only discount the rows missing in the other column, instead of re-ranking each pair.
+    Returns (r, n) like _pearson_matrix.
+    """
+    r, n = _pearson_matrix(ranks)
+    M = ~np.isnan(X)
+    incomplete = ~M.all(axis=0)
+    if not incomplete.any():
+        return r, n
+    X = np.asfortranarray(X)
+    orders = [np.argsort(X[:, k], kind="stable")[:M[:, k].sum()] for k in range(X.shape[1])]
+    bounds = [_tie_bounds(X[order, k]) for k, order in enumerate(orders)]
+    for i in np.flatnonzero(incomplete):
+        for j in range(X.shape[1]):
+            # Pairs of two incomplete columns are visited once, from the lower index
+            if i == j or (incomplete[j] and j < i):
+                continue
+            if n[i, j] < 2:
+                r[i, j] = r[j, i] = np.nan
+                continue
+            ri = _pair_ranks(orders[i], *bounds[i], M[:, j])
+            rj = _pair_ranks(orders[j], *bounds[j], M[:, i])
+            valid = ~np.isnan(ri)
+            ri = ri[valid] - ri[valid].mean()
+            rj = rj[valid] - rj[valid].mean()
+            with np.errstate(divide="ignore", invalid="ignore"):
+                r[i, j] = r[j, i] = (ri @ rj) / np.sqrt((ri @ ri) * (rj @ rj))
+    return r, n
+
+
+def correlation_matrix(df, cols, method="pearson"):
+    """
+    Computes the full correlation matrix and its p-values over `cols` in one pass.
+    For Spearman the data is ranked once per column; see _spearman_matrix for pairs
+    with missing values.
+    Returns (r, p, n) as square NumPy arrays.
+    """
+    X = df[cols].to_numpy(dtype=np.float64, na_value=np.nan)
+    if method == "spearman":
+        ranks = df[cols].rank().to_numpy(dtype=np.float64, na_value=np.nan)
+        r, n = _spearman_matrix(X, ranks)
+    else:
+        r, n = _pearson_matrix(X)
+    np.fill_diagonal(r, 1.0)
+    return r, _t_pvalue(r, n), n
+
+
+def batch_correlation(df, cols, method="pearson", pairs=None):
+    """
+    Runs the correlation test on every pair of `cols`, or only on the given `pairs`
+    (the matrix then covers just the columns they name).
+    Returns one result dict per pair (col1, col2, stat, p, n).
+    """
+    if pairs is not None:
+        cols = list(dict.fromkeys(c for pair in pairs for c in pair))
+        index = {col: k for k, col in enumerate(cols)}
+        wanted = [(index[a], index[b]) for a, b in pairs]
+    else:
+        wanted = zip(*np.triu_indices(len(cols), k=1))
+    r, p, n = correlation_matrix(df, cols, method=method)
+    return [
+        {"type": "correlation", "method": method, "col1": cols[i], "col2": cols[j],
+         "stat": float(r[i, j]), "p": float(p[i, j]), "n": int(n[i, j])}
+        for i, j in wanted
+    ]
+
+
+def factorize_columns(df, cols):
+    """
+    Factorizes each column once. Returns {col: (codes, n_levels)} with -1 for missing values.
+    """
+    encoded = {}
+    for col in cols:
+        codes, uniques = pd.factorize(df[col])
+        encoded[col] = (codes, len(uniques))
+    return encoded
+
+
+def contingency_from_codes(codes1, k1, codes2, k2, drop_empty=True):
+    """
+    Builds a contingency table from two code arrays with np.bincount, dropping
+    missing values and (with `drop_empty`) categories that never occur with a valid partner.
+    """
+    # One int64 cell index per row, built in place; missing pairs go to an overflow bin
+    flat = codes1.astype(np.int64)
+    flat *= k2
+    flat += codes2
+    flat[(codes1 < 0) | (codes2 < 0)] = k1 * k2
+    table = np.bincount(flat, minlength=k1 * k2 + 1)[:-1].reshape(k1, k2)
+    if not drop_empty:
+        return table
+    return table[table.sum(axis=1) > 0][:, table.sum(axis=0) > 0]
+
+
+def chi2_statistic(table):
+    """
+    Pearson's chi-square statistic and degrees of freedom for a contingency table
+    without empty rows or columns, with Yates' correction for 2x2 tables
+    (the same defaults as scipy.stats.chi2_contingency).
+    """
+    observed = np.asarray(table, dtype=np.float64)
+    n = observed.sum()
+    expected = np.outer(observed.sum(axis=1), observed.sum(axis=0)) / n
+    dof = (observed.shape[0] - 1) * (observed.shape[1] - 1)
+    if dof == 1:
+        diff = expected - observed
+        observed = observed + np.sign(diff) * np.minimum(0.5, np.abs(diff))
+    return float(np.sum((observed - expected) ** 2 / expected)), int(dof)
+
+
+def batch_chi2(df, pairs, encoded=None):
+    """
+    Runs the Chi-square test of independence on every (col1, col2) pair,
+    factorizing each column only once.
+    """
+    if encoded is None:
+        encoded = factorize_columns(df, sorted({c for pair in pairs for c in pair}))
+    results = []
+    for col1, col2 in pairs:
+        codes1, k1 = encoded[col1]
+        codes2, k2 = encoded[col2]
+        table = contingency_from_codes(codes1, k1, codes2, k2)
+        if min(table.shape) < 2:
+            print(f"Chi2 {col1} vs {col2} needs at least two levels on each side. Skipping.")
+            continue
+        chi2, dof = chi2_statistic(table)
+        results.append({"type": "chi2", "col1": col1, "col2": col2,
+                        "stat": chi2, "n": int(table.sum()), "dof": dof})
+    # One survival-function call for the whole batch
+    p_values = stats.chi2.sf([r["stat"] for r in results], [r["dof"] for r in results])
+    for result, p in zip(results, np.atleast_1d(p_values)):
+        result["p"] = float(p)
+    return results
+
+
+def welch_from_moments(n1, m1, v1, n2, m2, v2):
+    """
+    Welch's t statistic, degrees of freedom and two-sided p-value from group moments.
+    Works element-wise on arrays.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a, b = v1 / n1, v2 / n2
+        se2 = a + b
+        t = (m1 - m2) / np.sqrt(se2)
+        dof = se2 ** 2 / (a ** 2 / (n1 - 1) + b ** 2 / (n2 - 1))
+        p = 2 * stats.t.sf(np.abs(t), dof)
+    return t, dof, p
+
+
+def batch_t_tests(df, num_cols, cat_cols, encoded=None):
+    """
+    Welch t-tests for every (numeric, binary categorical) pair.
+    The numeric block is converted once and per-group sums are taken with a
+    single indicator-matrix product per categorical column.
+    """
+    if encoded is None:
+        encoded = factorize_columns(df, cat_cols)
+    X = df[num_cols].to_numpy(dtype=np.float64, na_value=np.nan)
+    M = ~np.isnan(X)
+    X0 = np.where(M, X - np.nanmean(X, axis=0), 0.0)
+    Mf = M.astype(np.float64)
+
+    results = []
+    for cat in cat_cols:
+        codes, k = encoded[cat]
+        if k != 2:
+            print(f"T-test requires exactly 2 groups in {cat} (found {k}). Skipping.")
+            continue
+        G = np.vstack([codes == 0, codes == 1]).astype(np.float64)
+        n = G @ Mf
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = (G @ X0) / n
+            # Second pass around the group means keeps the variances exact for large offsets
+            D = np.where(M, X0 - np.nan_to_num(mean)[np.maximum(codes, 0)], 0.0)
+            var = (G @ (D * D)) / (n - 1)
+        t, _, p = welch_from_moments(n[0], mean[0], var[0], n[1], mean[1], var[1])
+        for j, num in enumerate(num_cols):
+            if num == cat:
+                continue
+            results.append({"type": "ttest", "num": num, "cat": cat,
+                            "stat": float(t[j]), "p": float(p[j]), "n": int(n[0, j] + n[1, j])})
+    return results
+
+
+def run_batch(df, test, profile=None):
+    """
+    Dispatches a batched config to the matching engine and returns a list of result dicts.
+    A ColumnProfile supplies the column lists and categorical codes when given.
+    """
+    test_type = test.get("type")
+    if test_type == "correlation":
+        if "pairs" in test:
+            return batch_correlation(df, None, method=test.get("method", "pearson"),
+                                     pairs=[tuple(pair) for pair in test["pairs"]])
+        cols = expand_columns(df, test.get("cols", ALL_NUMERIC), profile)
+        return batch_correlation(df, cols, method=test.get("method", "pearson"))
+    if test_type == "chi2":
+        if "pairs" in test:
+            pairs = [tuple(pair) for pair in test["pairs"]]
+        else:
+            cols = expand_columns(df, test.get("cols", ALL_CATEGORICAL), profile)
+            pairs = [(cols[i], cols[j]) for i in range(len(cols)) for j in range(i + 1, len(cols))]
+        encoded = profile.encoded(df, sorted({c for pair in pairs for c in pair})) if profile else None
+        return batch_chi2(df, pairs, encoded)
+    if test_type == "ttest":
+        num_cols = expand_columns(df, test.get("num", ALL_NUMERIC), profile)
+        cat_cols = expand_columns(df, test.get("cat", ALL_CATEGORICAL), profile)
+        encoded = profile.encoded(df, cat_cols) if profile else None
+        return batch_t_tests(df, num_cols, cat_cols, encoded)
+    raise ValueError(f"Batched mode is not supported for test type '{test_type}'")
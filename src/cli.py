@@ -0,0 +1,205 @@
+"""
+Headless runner: applies one test config to many datasets and writes a report per
+dataset plus a consolidated table of every statistic.
+
+    python -m src.cli tests.yaml data/*.csv more/*.parquet --output results/batch --workers 4
+
+The config is a JSON or YAML list of test configs (the same dicts the web UI builds),
+or a mapping with a "tests" list. Each dataset runs in its own worker process: it is
+loaded, profiled once, checked against the columns the config references and then
+tested with that shared profile. Results land in <output>/<dataset>/report.html (plots
+next to it) and in <output>/summary.csv and <output>/summary.json.
+"""
+import os
+import sys
+import glob
+import json
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# Headless rendering in the workers (set before matplotlib loads)
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+from src.data_loader import read_csv_chunked
+from src.column_profile import build_profile
+from src.batch_tests import config_columns
+from src.test_runner import run_tests_from_config
+
+DATA_EXTENSIONS = (".csv", ".parquet", ".pq")
+SUMMARY_COLUMNS = ["dataset", "path", "Hypothesis", "Test", "Statistic", "p-value", "Adjusted p-value",
+                   "Effect size", "Power", "Rows needed", "Verdict"]
+
+
+def load_config(path):
+    """
+    Reads a test config list from a .json, .yaml or .yml file.
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise RuntimeError("YAML configs need PyYAML (pip install pyyaml); or use a JSON config")
+            config = yaml.safe_load(f)
+        else:
+            config = json.load(f)
+    if isinstance(config, dict):
+        config = config.get("tests")
+    if not isinstance(config, list) or not all(isinstance(test, dict) for test in config):
+        raise ValueError(f"{path} must hold a list of test configs (or a mapping with a 'tests' list)")
+    return config
+
+
+def expand_inputs(patterns):
+    """
+    Resolves file names, globs and directories into a sorted, de-duplicated list of datasets.
+    """
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))
+                       if name.lower().endswith(DATA_EXTENSIONS)]
+        else:
+            matches = sorted(glob.glob(pattern, recursive=True))
+        if not matches:
+            print(f"⚠️ No datasets match: {pattern}")
+        paths.extend(os.path.abspath(p) for p in matches)
+    return list(dict.fromkeys(paths))
+
+
+def dataset_names(paths):
+    """
+    Output directory name per dataset: the file stem, suffixed when stems collide.
+    A suffixed name never takes another file's own stem (a.csv, a.tsv and a_2.csv
+    give a, a_3 and a_2).
+    """
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in paths]
+    taken, names = set(stems), []
+    for stem in stems:
+        name, n = stem, 1
+        while name in names or (name != stem and name in taken):
+            n += 1
+            name = f"{stem}_{n}"
+        names.append(name)
+    return names
+
+
+def load_dataset(path):
+    """
+    Loads a CSV (chunked, with dtype inference) or Parquet file. Returns (df, columns),
+    where `columns` is the CSV column description or None for Parquet.
+    """
+    if path.lower().endswith((".parquet", ".pq")):
+        try:
+            return pd.read_parquet(path), None
+        except ImportError:
+            raise RuntimeError("Reading Parquet needs pyarrow or fastparquet (pip install pyarrow)")
+    df, columns, _ = read_csv_chunked(path)
+    return df, columns
+
+
+def missing_columns(df, config, profile):
+    missing = []
+    for test in config:
+        for col in config_columns(df, test, profile):
+            if col is not None and col not in df.columns and col not in missing:
+                missing.append(col)
+    return missing
+
+
+def run_dataset(path, name, config, output_dir):
+    """
+    Worker: loads one dataset, profiles it once and runs the whole config on it.
+    Returns a dict with the dataset's summary rows or its error.
+    """
+    outcome = {"dataset": name, "path": path, "report": None, "rows": None, "error": None, "summaries": []}
+    try:
+        df, columns = load_dataset(path)
+        outcome["rows"] = len(df)
+        profile = build_profile(df, columns)
+        missing = missing_columns(df, config, profile)
+        if missing:
+            raise ValueError(f"Columns not in dataset: {', '.join(map(str, missing))}")
+        dataset_dir = os.path.join(output_dir, name)
+        plot_dir = os.path.join(dataset_dir, "plots")
+        os.makedirs(plot_dir, exist_ok=True)
+        report_path = os.path.join(dataset_dir, "report.html")
+        report = run_tests_from_config(df, config, profile=profile, report_path=report_path,
+                                       plot_dir=plot_dir, plot_prefix="plots/")
+        outcome["report"] = report_path
+        outcome["summaries"] = report.summaries
+    except Exception as e:
+        outcome["error"] = str(e)
+    return outcome
+
+
+def _plain(value):
+    # numpy scalars -> Python numbers for JSON
+    return value.item() if hasattr(value, "item") else value
+
+
+def write_summary(outcomes, output_dir):
+    """
+    Writes every summary row of every dataset to summary.csv and summary.json.
+    """
+    rows = []
+    for outcome in outcomes:
+        for summary in outcome["summaries"]:
+            row = {"dataset": outcome["dataset"], "path": outcome["path"]}
+            row.update({key: _plain(value) for key, value in summary.items()})
+            rows.append(row)
+    table = pd.DataFrame(rows, columns=SUMMARY_COLUMNS)
+    table["Rows needed"] = table["Rows needed"].astype("Int64")
+    csv_path = os.path.join(output_dir, "summary.csv")
+    json_path = os.path.join(output_dir, "summary.json")
+    tmp_path = csv_path + ".tmp"
+    table.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, csv_path)
+    datasets = [{key: outcome[key] for key in ("dataset", "path", "rows", "report", "error")} for outcome in outcomes]
+    tmp_path = json_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"datasets": datasets, "results": rows}, f, indent=2, default=str)
+    os.replace(tmp_path, json_path)
+    return csv_path, json_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a Stats Court test config over many datasets")
+    parser.add_argument("config", help="JSON or YAML test config")
+    parser.add_argument("datasets", nargs="+", help="CSV/Parquet files, globs or directories")
+    parser.add_argument("--output", "-o", default="batch_results", help="output directory")
+    parser.add_argument("--workers", "-j", type=int, default=os.cpu_count(),
+                        help="worker processes (one dataset per worker)")
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config)
+    paths = expand_inputs(args.datasets)
+    if not paths:
+        parser.error("no datasets found")
+    output_dir = os.path.abspath(args.output)
+    os.makedirs(output_dir, exist_ok=True)
+    names = dataset_names(paths)
+    print(f"🚀 Running {len(config)} tests over {len(paths)} datasets")
+
+    workers = max(1, min(args.workers or 1, len(paths)))
+    if workers == 1:
+        outcomes = [run_dataset(path, name, config, output_dir) for path, name in zip(paths, names)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run_dataset, path, name, config, output_dir) for path, name in zip(paths, names)]
+            outcomes = [future.result() for future in futures]
+
+    for outcome in outcomes:
+        if outcome["error"]:
+            print(f"❌ {outcome['dataset']}: {outcome['error']}")
+        else:
+            print(f"✅ {outcome['dataset']}: {len(outcome['summaries'])} results -> {outcome['report']}")
+    csv_path, json_path = write_summary(outcomes, output_dir)
+    print(f"📝 Consolidated results written to: {csv_path} and {json_path}")
+    return 1 if any(outcome["error"] for outcome in outcomes) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
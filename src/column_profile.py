@@ -0,0 +1,140 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, is_bool_dtype
+
+# Columns longer than this get a HyperLogLog cardinality estimate instead of an exact count
+HLL_THRESHOLD = 1_000_000
+HLL_PRECISION = 14
+# Categorical columns with at most this many levels keep their integer codes in the profile
+CODES_MAX_LEVELS = 1000
+
+
+def column_kind(dtype):
+    if is_bool_dtype(dtype):
+        return "other"
+    if is_numeric_dtype(dtype) and not isinstance(dtype, pd.CategoricalDtype):
+        return "numeric"
+    if dtype == object or isinstance(dtype, (pd.CategoricalDtype, pd.StringDtype)):
+        return "categorical"
+    return "other"
+
+
+def hyperloglog_estimate(s, precision=HLL_PRECISION):
+    """
+    Estimates the number of distinct non-null values in `s` with HyperLogLog
+    (2**precision registers, about 1% standard error at the default precision).
+    """
+    hashes = pd.util.hash_pandas_object(s.dropna(), index=False).to_numpy()
+    m = 1 << precision
+    if len(hashes) == 0:
+        return 0
+    idx = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    suffix = hashes << np.uint64(precision)
+    # The top 53 bits convert to float exactly, so frexp gives the exact bit length
+    _, bit_length = np.frexp((suffix >> np.uint64(11)).astype(np.float64))
+    rho = np.minimum(53 - bit_length + 1, 64 - precision + 1).astype(np.uint8)
+    registers = np.zeros(m, dtype=np.uint8)
+    np.maximum.at(registers, idx, rho)
+
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = int(np.count_nonzero(registers == 0))
+    if estimate <= 2.5 * m and zeros:
+        estimate = m * np.log(m / zeros)  # linear counting for small cardinalities
+    return int(round(estimate))
+
+
+def estimate_nunique(s, threshold=HLL_THRESHOLD):
+    """
+    Returns (nunique, exact). Exact below `threshold` rows, HyperLogLog above it.
+    """
+    if len(s) <= threshold:
+        return int(s.nunique()), True
+    return hyperloglog_estimate(s), False
+
+
+def describe_columns(df):
+    """
+    Per-column metadata used by the test selection page: kind, distinct values and nulls.
+    """
+    nulls = df.isna().sum()
+    columns = {}
+    for col in df.columns:
+        kind = column_kind(df[col].dtype)
+        nunique, exact = estimate_nunique(df[col]) if kind == "categorical" else (None, True)
+        columns[col] = {
+            "kind": kind,
+            "dtype": str(df[col].dtype),
+            "nunique": nunique,
+            "nunique_exact": exact,
+            "nulls": int(nulls[col])
+        }
+    return columns
+
+
+class ColumnProfile:
+    """
+    Column index built once per dataset: kind, cardinality, null counts and,
+    for low-cardinality categoricals, factorized integer codes with their labels.
+    Codes follow order of first appearance, like `Series.unique()`.
+    """
+
+    def __init__(self, columns, codes=None, levels=None):
+        self.columns = columns
+        self.codes = codes or {}
+        self.levels = levels or {}
+
+    def cols_of_kind(self, kind):
+        return [col for col, info in self.columns.items() if info["kind"] == kind]
+
+    @property
+    def categorical_cols(self):
+        return self.cols_of_kind("categorical")
+
+    @property
+    def numeric_cols(self):
+        return self.cols_of_kind("numeric")
+
+    @property
+    def binary_cols(self):
+        return [col for col in self.categorical_cols if self.columns[col]["nunique"] == 2]
+
+    def nunique(self, col):
+        return self.columns.get(col, {}).get("nunique")
+
+    def encoded(self, df, cols):
+        """
+        {col: (codes, n_levels)} for `cols`, factorizing only columns the profile has no codes for.
+        """
+        encoded = {}
+        for col in cols:
+            if col in self.codes:
+                encoded[col] = (self.codes[col], len(self.levels[col]))
+            else:
+                codes, uniques = pd.factorize(df[col])
+                encoded[col] = (codes, len(uniques))
+        return encoded
+
+
+def build_profile(df, columns=None):
+    """
+    Profiles every column of `df`. `columns` may carry metadata already gathered
+    during ingestion (see `data_loader.read_csv_chunked`), which is reused as-is.
+    """
+    columns = {col: dict(info) for col, info in columns.items()} if columns else describe_columns(df)
+    codes, levels = {}, {}
+    for col, info in columns.items():
+        if info["kind"] == "numeric" and info.get("nunique") is None:
+            info["nunique"], info["nunique_exact"] = estimate_nunique(df[col])
+        if info["kind"] != "categorical":
+            continue
+        if info.get("nunique") is not None and info["nunique"] > CODES_MAX_LEVELS:
+            continue
+        col_codes, uniques = pd.factorize(df[col])
+        if len(uniques) > CODES_MAX_LEVELS:
+            continue
+        codes[col] = col_codes.astype(np.int16 if len(uniques) < 2 ** 15 else np.int32)
+        levels[col] = [str(level) for level in uniques]
+        info["nunique"] = len(uniques)
+        info["nunique_exact"] = True
+    return ColumnProfile(columns, codes, levels)
@@ -0,0 +1,133 @@
+import os
+import json
+import shutil
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+
+# A columnar dataset is a directory with one .npy file per column plus a manifest:
+#   manifest.json   column names, storage kind and original dtype, row count, optional meta
+#   <i>.npy         raw values (numeric/bool/datetime), integer codes (everything else) or,
+#                   for sparse columns, the positions of the values that are not the fill value
+#   <i>.values.npy  those values, for sparse columns
+#   <i>.cats.pkl    the categories for coded columns
+# The manifest's generation goes up by one each time the same path is rewritten.
+MANIFEST = "manifest.json"
+
+
+def _code_dtype(n_levels):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_levels < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def write_columnar(df, path, meta=None):
+    """
+    Writes `df` to `path` as one .npy file per column (the index is not kept).
+    The manifest is written last, so a directory without one is incomplete.
+    `meta` is any JSON-serializable value kept in the manifest (e.g. where the data came from).
+    """
+    tmp_dir = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    columns = []
+    for i, col in enumerate(df.columns):
+        s = df[col]
+        entry = {"name": col, "file": f"{i}.npy", "dtype": str(s.dtype)}
+        if isinstance(s.dtype, pd.SparseDtype):
+            # Only the stored (non-fill) entries, so wide one-hot blocks stay small on disk
+            entry["kind"] = "sparse"
+            entry["fill_value"] = s.sparse.fill_value.item() if hasattr(s.sparse.fill_value, "item") \
+                else s.sparse.fill_value
+            np.save(os.path.join(tmp_dir, entry["file"]), s.array.sp_index.indices)
+            np.save(os.path.join(tmp_dir, f"{i}.values.npy"), s.sparse.sp_values)
+        elif isinstance(s.dtype, np.dtype) and s.dtype != object:
+            entry["kind"] = "raw"
+            np.save(os.path.join(tmp_dir, entry["file"]), s.to_numpy())
+        elif pd.api.types.is_numeric_dtype(s.dtype) and not isinstance(s.dtype, pd.CategoricalDtype):
+            # Nullable extension types (Int64, Float64, boolean) are stored as float with NaN
+            entry["kind"] = "masked"
+            np.save(os.path.join(tmp_dir, entry["file"]), s.to_numpy(dtype=np.float64, na_value=np.nan))
+        else:
+            entry["kind"] = "coded"
+            codes, uniques = pd.factorize(s)
+            if isinstance(s.dtype, pd.CategoricalDtype):
+                codes, uniques = s.cat.codes.to_numpy(), s.cat.categories
+                entry["ordered"] = bool(s.cat.ordered)
+            np.save(os.path.join(tmp_dir, entry["file"]), codes.astype(_code_dtype(len(uniques))))
+            with open(os.path.join(tmp_dir, f"{i}.cats.pkl"), "wb") as f:
+                pickle.dump(pd.Index(uniques), f, protocol=pickle.HIGHEST_PROTOCOL)
+        columns.append(entry)
+
+    try:
+        generation = read_manifest(path).get("generation", 0) + 1
+    except (FileNotFoundError, ValueError):
+        generation = 1
+    with open(os.path.join(tmp_dir, MANIFEST), "w", encoding="utf-8") as f:
+        json.dump({"nrows": len(df), "generation": generation, "columns": columns, "meta": meta}, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_dir, path)
+    return path
+
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_columnar(path):
+    return os.path.exists(os.path.join(path, MANIFEST))
+
+
+def columnar_version(path):
+    """
+    (row count, generation) of a columnar dataset, so a copy cached in memory can be
+    checked against the files before it is reused.
+    """
+    manifest = read_manifest(path)
+    return manifest["nrows"], manifest.get("generation", 0)
+
+
+def columnar_names(path):
+    return [entry["name"] for entry in read_manifest(path)["columns"]]
+
+
+def read_columnar(path, columns=None, mmap=True):
+    """
+    Loads a columnar dataset. Only the requested `columns` are opened, and raw
+    numeric columns are memory-mapped when `mmap` is set: nothing is read until their
+    values are used, and then only the pages touched. The mapping is copy-on-write, so
+    the frame can be modified without the changes reaching the files.
+    Coded columns come back with their original dtype.
+    """
+    manifest = read_manifest(path)
+    entries = {entry["name"]: entry for entry in manifest["columns"]}
+    names = list(entries) if columns is None else list(columns)
+    data = {}
+    for name in names:
+        entry = entries[name]
+        values = np.load(os.path.join(path, entry["file"]), mmap_mode="c" if mmap else None)
+        if entry["kind"] == "raw":
+            data[name] = pd.Series(values, name=name, copy=False)
+        elif entry["kind"] == "masked":
+            data[name] = pd.Series(values, name=name).astype(entry["dtype"])
+        elif entry["kind"] == "sparse":
+            sp_values = np.load(os.path.join(path, entry["file"].replace(".npy", ".values.npy")))
+            dense = np.full(manifest["nrows"], entry["fill_value"], dtype=sp_values.dtype)
+            dense[values] = sp_values
+            data[name] = pd.Series(pd.arrays.SparseArray(dense, fill_value=entry["fill_value"]), name=name)
+        else:
+            with open(os.path.join(path, entry["file"].replace(".npy", ".cats.pkl")), "rb") as f:
+                categories = pickle.load(f)
+            codes = np.asarray(values)
+            if entry["dtype"] == "category":
+                data[name] = pd.Series(pd.Categorical.from_codes(
+                    codes, categories, ordered=entry.get("ordered", False)), name=name)
+            else:
+                restored = categories.take(codes, allow_fill=True, fill_value=np.nan)
+                data[name] = pd.Series(restored, name=name).astype(entry["dtype"])
+    # copy=False keeps one block per column; the default would consolidate same-dtype
+    # columns into a new 2-D array and read every mapped page up front
+    return pd.DataFrame(data, columns=names, copy=False)
@@ -1,6 +1,13 @@
 # Load and clean datasets
 import os
+import hashlib
+import numpy as np
 import pandas as pd
+from pandas.api.types import union_categoricals, is_numeric_dtype, is_bool_dtype
+from src.column_profile import column_kind, describe_columns, estimate_nunique
+from src.columnar import write_columnar, read_columnar, read_manifest, is_columnar
+from src.preprocessing import Preprocessor
+from src.metrics import instrument, inc
 
 # Get project root whether in script or notebook
 try:
@@ -8,7 +15,29 @@ try:
 except NameError:
     BASE_DIR = os.path.abspath(os.path.join(os.getcwd(), ".."))
 
-def load_raw_data(file):
+# Columnar copies of raw CSVs (see `load_raw_data`)
+COLUMNAR_DIR = os.path.join(BASE_DIR, "data", "columnar")
+
+def columnar_copy_path(data_path):
+    """
+    Where the columnar copy of a raw CSV lives: its stem plus a hash of its full path,
+    so files with the same name in different folders don't share a copy.
+    """
+    stem = os.path.splitext(os.path.basename(data_path))[0]
+    digest = hashlib.sha1(os.path.abspath(data_path).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(COLUMNAR_DIR, f"{stem}-{digest}")
+
+def source_stamp(data_path):
+    stat = os.stat(data_path)
+    return {"path": os.path.abspath(data_path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+def load_raw_data(file, chunksize=None, columns=None):
+    """
+    Loads a raw CSV. The first load parses it and saves a columnar copy (see
+    `src.columnar`) under data/columnar/; later loads memory-map that copy instead of
+    parsing text again, opening only `columns` when given. The copy is rebuilt when
+    the CSV's size or modification time changes.
+    """
     if os.path.isabs(file):
         data_path = file
     else:
@@ -18,31 +47,192 @@ def load_raw_data(file):
     if not os.path.exists(data_path):
         raise FileNotFoundError(f"❌ File not found at: {data_path}")
 
-    df = pd.read_csv(data_path)
-    return df
+    copy_path = columnar_copy_path(data_path)
+    stamp = source_stamp(data_path)
+    if is_columnar(copy_path) and read_manifest(copy_path).get("meta") == stamp:
+        print(f"⚡ Using columnar copy: {copy_path}")
+        return read_columnar(copy_path, columns)
+
+    if chunksize:
+        df, _, _ = read_csv_chunked(data_path, chunksize=chunksize)
+    else:
+        df = pd.read_csv(data_path)
+    os.makedirs(COLUMNAR_DIR, exist_ok=True)
+    write_columnar(df, copy_path, meta=stamp)
+    print(f"💾 Saved columnar copy to: {copy_path}")
+    return df if columns is None else df[list(columns)]
+
+# Rows parsed per chunk by the streaming reader
+CHUNK_SIZE = 100_000
+# Text columns with at most this many distinct values are stored as category
+CATEGORY_MAX_LEVELS = 1000
+
+def downcast_numeric(s):
+    """
+    Shrinks integer columns to the smallest integer type, and float columns
+    to float32 only when that loses nothing.
+    """
+    if s.dtype.kind in "iu":
+        return pd.to_numeric(s, downcast="integer" if s.dtype.kind == "i" else "unsigned")
+    if s.dtype == np.float64:
+        small = s.to_numpy(dtype=np.float32)
+        if np.array_equal(small.astype(np.float64), s.to_numpy(), equal_nan=True):
+            return pd.Series(small, index=s.index, name=s.name)
+    return s
+
+def _value_kind(s):
+    """
+    "bool", "number" or "text" for a parsed chunk of a column (by its categories for
+    a categorical), or None if the chunk is all missing and so fits any kind.
+    """
+    if not s.notna().any():
+        return None
+    dtype = s.dtype.categories.dtype if isinstance(s.dtype, pd.CategoricalDtype) else s.dtype
+    if is_bool_dtype(dtype):
+        return "bool"
+    return "number" if is_numeric_dtype(dtype) else "text"
+
+
+@instrument("ingest_csv")
+def read_csv_chunked(path, chunksize=CHUNK_SIZE, category_max_levels=CATEGORY_MAX_LEVELS, preview_rows=5):
+    """
+    Streams a CSV in chunks, downcasting numbers and turning low-cardinality text
+    columns into categories as it goes, so peak memory stays close to the size of the
+    compacted frame rather than the raw text.
 
+    Returns (df, columns, preview) where `columns` is the `describe_columns` metadata
+    gathered during the same pass and `preview` is the first rows of the first chunk.
+    """
+    pieces = {}
+    # Text column -> distinct values seen so far, or None once it has too many to be a
+    # category. Columns join on their first text chunk, so one that is all missing (and so
+    # parsed as float) in the first chunks still becomes a category.
+    levels = {}
+    nulls = {}
+    preview = None
 
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        if preview is None:
+            preview = chunk.head(preview_rows)
+            pieces = {col: [] for col in chunk.columns}
+            nulls = {col: 0 for col in chunk.columns}
+        for col in chunk.columns:
+            s = chunk[col]
+            nulls[col] += int(s.isna().sum())
+            if _value_kind(s) == "text" and levels.get(col, ()) is not None:
+                seen = levels.setdefault(col, set())
+                seen.update(s.dropna().unique())
+                if len(seen) > category_max_levels:
+                    # Too many values to be worth a category; keep the column as plain text
+                    levels[col] = None
+                    pieces[col] = [p.astype(s.dtype) if isinstance(p.dtype, pd.CategoricalDtype) else p
+                                   for p in pieces[col]]
+                else:
+                    s = s.astype("category")
+            elif is_numeric_dtype(s.dtype) and not is_bool_dtype(s.dtype):
+                s = downcast_numeric(s)
+            pieces[col].append(s)
 
-def clean_raw_data(df):
-    # Drop rows with any missing values
-    df = df.dropna()
+    if preview is None:
+        # Header-only file: nothing to stream
+        df = pd.read_csv(path)
+        return df, describe_columns(df), df
 
-    # Fill missing values appropriately (if dropna isn't used)
+    # Chunks are typed on their own, so one can parse a column as numbers and another
+    # as text; those columns are read again as text, as a single read_csv would have
+    mixed = [i for i, col in enumerate(pieces) if len({_value_kind(p) for p in pieces[col]} - {None}) > 1]
+    if mixed:
+        text = pd.read_csv(path, usecols=mixed, dtype=str)
+        for col in text.columns:
+            s = text[col]
+            values = set(s.dropna().unique())
+            if len(values) > category_max_levels:
+                levels[col] = None
+                pieces[col] = [s]
+            else:
+                levels[col] = values
+                pieces[col] = [s.astype("category")]
+
+    data = {}
+    for col in list(pieces):
+        parts = pieces.pop(col)
+        if levels.get(col) is not None:
+            # All-missing chunks (parsed as float) become empty categoricals of the same kind
+            empty = next(p.cat.categories[:0] for p in parts if isinstance(p.dtype, pd.CategoricalDtype))
+            parts = [p if isinstance(p.dtype, pd.CategoricalDtype)
+                     else pd.Series(pd.Categorical.from_codes(np.full(len(p), -1), categories=empty))
+                     for p in parts]
+            try:
+                data[col] = pd.Series(union_categoricals(parts), name=col)
+            except TypeError:
+                # Chunks disagreed on the category type
+                data[col] = pd.concat([p.astype(object) for p in parts], ignore_index=True).astype("category")
+        else:
+            data[col] = pd.concat(parts, ignore_index=True)
+    df = pd.DataFrame(data)
+
+    columns = {}
     for col in df.columns:
-        if df[col].dtype == "object":
-            df[col].fillna(df[col].mode()[0], inplace=True)
+        kind = column_kind(df[col].dtype)
+        if levels.get(col) is not None:
+            nunique, exact = len(levels[col]), True
+        elif kind == "categorical":
+            nunique, exact = estimate_nunique(df[col])
         else:
-            df[col].fillna(df[col].median(), inplace=True)
+            nunique, exact = None, True
+        columns[col] = {
+            "kind": kind,
+            "dtype": str(df[col].dtype),
+            "nunique": nunique,
+            "nunique_exact": exact,
+            "nulls": nulls[col]
+        }
+    print(f"📥 Streamed {len(df)} rows in chunks of {chunksize}")
+    inc("rows_processed_total", len(df), stage="ingest_csv")
+    return df, columns, preview
+
+
 
-    # One-hot encode categorical columns
-    df_encoded = pd.get_dummies(df, drop_first=True)        
+def clean_raw_data(df, preprocessor=None):
+    """
+    Drops rows with a missing value in any column and one-hot encodes the categorical
+    columns without their first level, like df.dropna() then pd.get_dummies(drop_first=True);
+    wide categoricals become sparse columns instead of dense 0/1 blocks.
+
+    Pass a Preprocessor (see `src.preprocessing`) for other imputation or encoding
+    settings; a fitted one is applied as-is, so another dataset gets the same columns.
+    """
+    if preprocessor is None:
+        preprocessor = Preprocessor(numeric="drop", categorical="drop", other="drop", drop_first=True)
+    if not preprocessor.fitted:
+        preprocessor.fit(df)
+    df_encoded = preprocessor.transform(df)
     print(f"🧹 Cleaned data shape: {df_encoded.shape}")
     return df_encoded
 
-def save_preprocessed_data(df_encoded, filename="cleaned_data.csv"):
+def save_preprocessed_data(df_encoded, filename="cleaned_data"):
+    """
+    Saves the cleaned frame under data/processed/ in the columnar format; reload it
+    (or just some of its columns) with `load_preprocessed_data`. A file name ending in
+    .csv writes a CSV instead.
+    """
     process_path = os.path.join(BASE_DIR, "data", "processed", filename)
-    df_encoded.to_csv(process_path, index=False)
+    os.makedirs(os.path.dirname(process_path), exist_ok=True)
+    if filename.lower().endswith(".csv"):
+        df_encoded.to_csv(process_path, index=False)
+    else:
+        write_columnar(df_encoded, process_path)
     print(f"💾 Saved cleaned data to: {process_path}")
+    return process_path
+
+def load_preprocessed_data(filename="cleaned_data", columns=None):
+    """
+    Memory-maps a dataset saved by `save_preprocessed_data`, opening only `columns` when given.
+    """
+    process_path = os.path.join(BASE_DIR, "data", "processed", filename)
+    if not is_columnar(process_path):
+        raise FileNotFoundError(f"❌ No columnar dataset at: {process_path}")
+    return read_columnar(process_path, columns)
 
 
 
@@ -0,0 +1,310 @@
+import os
+import json
+import uuid
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+from src.columnar import write_columnar, read_columnar, is_columnar, columnar_names, columnar_version
+from src.column_profile import ColumnProfile
+
+try:
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+except NameError:
+    BASE_DIR = os.path.abspath(os.path.join(os.getcwd(), ".."))
+
+STORE_DIR = os.path.join(BASE_DIR, "uploads", "datasets")
+MEMORY_BUDGET = int(os.environ.get("STATS_COURT_MEMORY_BUDGET_MB", 512)) * 1024 * 1024
+
+
+def frame_nbytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def new_dataset_id():
+    return uuid.uuid4().hex
+
+
+def is_dataset_id(dataset_id):
+    """
+    True for IDs made by `new_dataset_id` (uuid4 hex). IDs come from the session cookie,
+    so anything else is rejected before it becomes part of a path.
+    """
+    if not isinstance(dataset_id, str) or len(dataset_id) != 32:
+        return False
+    try:
+        parsed = uuid.UUID(hex=dataset_id)
+    except ValueError:
+        return False
+    return parsed.hex == dataset_id and parsed.version == 4
+
+
+class DatasetStore:
+    """
+    Holds uploaded DataFrames keyed by upload ID within a memory budget.
+
+    Every dataset is written through to a columnar directory on disk when it is
+    stored, so frames evicted from memory (least recently used first) and
+    datasets uploaded through another worker process are reloaded lazily. Cached
+    frames and profiles remember the data version (row count and generation) they
+    were loaded at and are reloaded once another process has rewritten the data.
+    """
+
+    def __init__(self, root=STORE_DIR, memory_budget=MEMORY_BUDGET):
+        self.root = root
+        self.memory_budget = memory_budget
+        self._frames = OrderedDict()  # dataset_id -> (df, nbytes, version)
+        self._profiles = {}           # dataset_id -> (profile, version)
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _dir(self, dataset_id):
+        if not is_dataset_id(dataset_id):
+            raise ValueError(f"Invalid dataset ID: {dataset_id!r}")
+        return os.path.join(self.root, dataset_id)
+
+    def _version(self, dataset_id):
+        """
+        Version of the stored data (see `columnar_version`), or None if there is none.
+        """
+        try:
+            return columnar_version(os.path.join(self._dir(dataset_id), "data"))
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def upload_path(self, dataset_id, name):
+        """
+        Path for a raw uploaded file kept with the dataset (never shared between uploads).
+        """
+        path = os.path.join(self._dir(dataset_id), "raw")
+        os.makedirs(path, exist_ok=True)
+        return os.path.join(path, name)
+
+    def put(self, dataset_id, df, meta=None, profile=None):
+        path = self._dir(dataset_id)
+        os.makedirs(path, exist_ok=True)
+        write_columnar(df, os.path.join(path, "data"))
+        # Accumulated statistics only apply to the frame they were built from
+        shutil.rmtree(os.path.join(path, "accumulators"), ignore_errors=True)
+        if meta is not None:
+            self.set_meta(dataset_id, meta)
+        if profile is not None:
+            self.put_profile(dataset_id, profile)
+        self._remember(dataset_id, df, self._version(dataset_id))
+
+    def append(self, dataset_id, new_rows):
+        """
+        Appends rows to a stored dataset and returns the combined frame. Stored
+        accumulators stay valid (the old rows are unchanged); the profile is dropped
+        because its codes cover only the old rows, and so is the preview sample.
+        """
+        df = self.get(dataset_id)
+        if df is None:
+            raise KeyError(dataset_id)
+        if list(new_rows.columns) != list(df.columns):
+            raise ValueError("Appended rows must have the same columns as the dataset")
+        combined = pd.concat([df, new_rows], ignore_index=True)
+        path = self._dir(dataset_id)
+        # Drop what describes the old rows first, so no reader pairs it with the new data
+        for name in ("profile.json", "codes.npz", "sample.json"):
+            try:
+                os.remove(os.path.join(path, name))
+            except FileNotFoundError:
+                pass
+        shutil.rmtree(os.path.join(path, "sample"), ignore_errors=True)
+        shutil.rmtree(os.path.join(path, "codes"), ignore_errors=True)
+        with self._lock:
+            self._profiles.pop(dataset_id, None)
+        write_columnar(combined, os.path.join(path, "data"))
+        self._remember(dataset_id, combined, self._version(dataset_id))
+        return combined
+
+    def put_sample(self, dataset_id, sample, info):
+        """
+        Stores the preview sample used by fast mode (see `src.sampling`) with its info.
+        """
+        path = self._dir(dataset_id)
+        write_columnar(sample, os.path.join(path, "sample"))
+        info_path = os.path.join(path, "sample.json")
+        tmp_path = f"{info_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(info, f)
+        os.replace(tmp_path, info_path)
+
+    def has_sample(self, dataset_id):
+        return is_dataset_id(dataset_id) and os.path.exists(os.path.join(self._dir(dataset_id), "sample.json"))
+
+    def get_sample(self, dataset_id):
+        """
+        Returns (sample, info) for `dataset_id`, or None if it has no preview sample.
+        """
+        if not is_dataset_id(dataset_id):
+            return None
+        path = self._dir(dataset_id)
+        try:
+            with open(os.path.join(path, "sample.json"), "r", encoding="utf-8") as f:
+                info = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        return read_columnar(os.path.join(path, "sample"), mmap=False), info
+
+    def accumulators(self, dataset_id):
+        """
+        The AccumulatorStore holding this dataset's incremental test statistics.
+        """
+        from src.accumulators import AccumulatorStore
+        return AccumulatorStore(os.path.join(self._dir(dataset_id), "accumulators"))
+
+    def put_profile(self, dataset_id, profile):
+        """
+        Saves the column profile with the dataset: column info and labels as JSON,
+        categorical codes as one .npy file per column, so a run can map just the
+        columns it reads.
+        """
+        path = self._dir(dataset_id)
+        version = self._version(dataset_id)
+        codes_dir = os.path.join(path, "codes")
+        tmp_dir = f"{codes_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        for i, codes in enumerate(profile.codes.values()):
+            np.save(os.path.join(tmp_dir, f"c{i}.npy"), codes)
+        shutil.rmtree(codes_dir, ignore_errors=True)
+        os.replace(tmp_dir, codes_dir)
+        profile_path = os.path.join(path, "profile.json")
+        tmp_path = f"{profile_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"columns": profile.columns, "coded": list(profile.codes), "levels": profile.levels,
+                       "version": version}, f)
+        os.replace(tmp_path, profile_path)
+        with self._lock:
+            self._profiles[dataset_id] = (profile, version)
+
+    def get_profile(self, dataset_id, columns=None):
+        """
+        Returns the ColumnProfile stored with `dataset_id`, or None. With `columns`, a
+        profile loaded from disk only gets the categorical codes of those columns (and is
+        not kept in memory); its column info still covers the whole dataset. A profile
+        saved for an earlier version of the data counts as missing.
+        """
+        if not is_dataset_id(dataset_id):
+            return None
+        version = self._version(dataset_id)
+        with self._lock:
+            cached = self._profiles.get(dataset_id)
+            if cached is not None and cached[1] == version:
+                return cached[0]
+        path = self._dir(dataset_id)
+        try:
+            with open(os.path.join(path, "profile.json"), "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            # Profiles saved before versions were recorded are trusted as they are
+            if saved.get("version") is not None and tuple(saved["version"]) != version:
+                return None
+            wanted = [(i, col) for i, col in enumerate(saved["coded"]) if columns is None or col in columns]
+            codes_dir = os.path.join(path, "codes")
+            if os.path.isdir(codes_dir):
+                codes = {col: np.load(os.path.join(codes_dir, f"c{i}.npy"), mmap_mode="r") for i, col in wanted}
+            else:
+                # Profiles saved before codes were stored per column
+                with np.load(os.path.join(path, "codes.npz")) as archive:
+                    codes = {col: archive[f"c{i}"] for i, col in wanted}
+        except (FileNotFoundError, ValueError):
+            return None
+        profile = ColumnProfile(saved["columns"], codes, saved["levels"])
+        if columns is None:
+            with self._lock:
+                self._profiles[dataset_id] = (profile, version)
+        return profile
+
+    def exists(self, dataset_id):
+        """
+        True if `dataset_id` has a stored frame; checks the manifest without loading it.
+        """
+        return is_dataset_id(dataset_id) and is_columnar(os.path.join(self._dir(dataset_id), "data"))
+
+    def get(self, dataset_id):
+        """
+        Returns the DataFrame for `dataset_id`, or None if it was never stored.
+        """
+        if not is_dataset_id(dataset_id):
+            return None
+        version = self._version(dataset_id)
+        if version is None:
+            return None
+        cached = self._cached_frame(dataset_id, version)
+        if cached is not None:
+            return cached
+        df = read_columnar(os.path.join(self._dir(dataset_id), "data"), mmap=False)
+        self._remember(dataset_id, df, version)
+        return df
+
+    def get_columns(self, dataset_id, columns):
+        """
+        Returns the dataset's `columns` (those it has) for a run that reads only them.
+        A frame already in memory is returned whole; otherwise the columns are
+        memory-mapped from the columnar copy, so opening is independent of the dataset's
+        size and only the pages the tests touch are read. Mapped frames do not count
+        against the memory budget. Returns None if the dataset was never stored.
+        """
+        if not is_dataset_id(dataset_id):
+            return None
+        version = self._version(dataset_id)
+        if version is None:
+            return None
+        cached = self._cached_frame(dataset_id, version)
+        if cached is not None:
+            return cached
+        data_path = os.path.join(self._dir(dataset_id), "data")
+        names = set(columnar_names(data_path))
+        return read_columnar(data_path, [col for col in dict.fromkeys(columns) if col in names], mmap=True)
+
+    def _cached_frame(self, dataset_id, version):
+        # The frame in memory, unless the data on disk has changed since it was loaded
+        with self._lock:
+            cached = self._frames.get(dataset_id)
+            if cached is None:
+                return None
+            if cached[2] != version:
+                del self._frames[dataset_id]
+                return None
+            self._frames.move_to_end(dataset_id)
+            return cached[0]
+
+    def _remember(self, dataset_id, df, version):
+        with self._lock:
+            self._frames[dataset_id] = (df, frame_nbytes(df), version)
+            self._frames.move_to_end(dataset_id)
+            self._evict()
+
+    def _evict(self):
+        # The most recently used frame always stays, even if it alone exceeds the budget
+        while len(self._frames) > 1 and self.memory_usage() > self.memory_budget:
+            dataset_id, _ = self._frames.popitem(last=False)
+            self._profiles.pop(dataset_id, None)
+            print(f"📤 Evicted dataset {dataset_id} from memory")
+
+    def memory_usage(self):
+        return sum(nbytes for _, nbytes, _ in self._frames.values())
+
+    def get_meta(self, dataset_id):
+        try:
+            with open(os.path.join(self._dir(dataset_id), "meta.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError, TypeError):
+            return {}
+
+    def set_meta(self, dataset_id, meta):
+        meta_path = os.path.join(self._dir(dataset_id), "meta.json")
+        tmp_path = f"{meta_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, meta_path)
+
+    def delete(self, dataset_id):
+        with self._lock:
+            self._frames.pop(dataset_id, None)
+            self._profiles.pop(dataset_id, None)
+        shutil.rmtree(self._dir(dataset_id), ignore_errors=True)
@@ -0,0 +1,199 @@
+"""
+Effect sizes and power for the single-pair and grouped tests.
+
+Each test returns an effect dict built from the statistics it already computed
+(group moments, the contingency table, r and its n); `power_analysis` then takes the
+effects of a whole config and answers "what power did this run have" and "how many
+rows would reach the target power" for all of them in one vectorized call per test kind.
+"""
+import numpy as np
+from scipy import stats
+
+ALPHA = 0.05
+TARGET_POWER = 0.8
+# Upper bound for the sample-size search; effects needing more rows are reported as unreachable
+MAX_ROWS = 1e12
+
+
+def cohens_d(summary, confidence=0.95):
+    """
+    Cohen's d (pooled SD) per target of a two-group GroupSummary, with its approximate
+    CI. Returns (d, low, high, n, share of the first group).
+    """
+    n1, n2 = summary.n[:, 0], summary.n[:, 1]
+    mean, ss = summary.mean, summary.ss
+    with np.errstate(invalid="ignore", divide="ignore"):
+        d = (mean[:, 0] - mean[:, 1]) / np.sqrt((ss[:, 0] + ss[:, 1]) / (n1 + n2 - 2))
+        se = np.sqrt((n1 + n2) / (n1 * n2) + d ** 2 / (2 * (n1 + n2)))
+    half = stats.norm.ppf(0.5 + confidence / 2) * se
+    return d, d - half, d + half, n1 + n2, n1 / (n1 + n2)
+
+
+def cramers_v(table):
+    """
+    Cramér's V, Cohen's w, n and degrees of freedom of a contingency table without
+    empty rows or columns. Uses the chi-square statistic without Yates' correction.
+    """
+    observed = np.asarray(table, dtype=np.float64)
+    n = observed.sum()
+    expected = np.outer(observed.sum(axis=1), observed.sum(axis=0)) / n
+    chi2 = float(((observed - expected) ** 2 / expected).sum())
+    k = min(observed.shape)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        v = np.sqrt(chi2 / (n * (k - 1)))
+    dof = (observed.shape[0] - 1) * (observed.shape[1] - 1)
+    return float(v), float(np.sqrt(chi2 / n)), int(n), dof
+
+
+def fisher_ci(r, n, confidence=0.95, method="pearson"):
+    """
+    Fisher z confidence interval for a correlation; Spearman uses the 1.06 variance
+    factor of Fieller et al.
+    """
+    factor = 1.06 if method == "spearman" else 1.0
+    half = stats.norm.ppf(0.5 + confidence / 2) * np.sqrt(factor / (np.asarray(n) - 3))
+    z = np.arctanh(np.clip(r, -1 + 1e-15, 1 - 1e-15))
+    return np.tanh(z - half), np.tanh(z + half)
+
+
+def eta_squared(summary):
+    """
+    Share of variance explained by the groups, per target of a GroupSummary.
+    """
+    n, mean, ss = summary.n, summary.mean, summary.ss
+    present = n > 0
+    grand = np.sum(np.where(present, n * mean, 0), axis=1) / n.sum(axis=1)
+    between = np.sum(np.where(present, n * (mean - grand[:, None]) ** 2, 0), axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return between / (between + ss.sum(axis=1))
+
+
+def ttest_effect(summary, i=0):
+    d, low, high, n, share = (float(a[i]) for a in cohens_d(summary))
+    return {"kind": "ttest", "label": "Cohen's d", "effect": d, "ci": [low, high], "n": n, "param": share}
+
+
+def chi2_effect(table):
+    v, w, n, dof = cramers_v(table)
+    # Power is computed from Cohen's w = V * sqrt(min(r, c) - 1)
+    return {"kind": "chi2", "label": "Cramér's V", "effect": v, "power_effect": w, "n": n, "param": dof}
+
+
+def correlation_effect(r, n, method="pearson"):
+    low, high = fisher_ci(r, n, method=method)
+    return {"kind": "correlation", "label": "r", "effect": float(r), "ci": [float(low), float(high)],
+            "n": int(n), "param": None}
+
+
+def anova_effect(summary, i=0, method="anova", stat=None):
+    n = float(summary.n[i].sum())
+    k = int((summary.n[i] > 0).sum())
+    if method == "kruskal":
+        # Epsilon squared from H; the power model treats it like eta squared
+        label, share = "ε²", stat / (n - 1)
+    else:
+        label, share = "η²", float(eta_squared(summary)[i])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        f = np.sqrt(share / (1 - share))
+    return {"kind": "anova", "label": label, "effect": float(share), "power_effect": float(f), "n": n, "param": k}
+
+
+def _power_ttest(d, n, share, alpha):
+    dof = n - 2
+    ncp = np.abs(d) * np.sqrt(n * share * (1 - share))
+    crit = stats.t.isf(alpha / 2, dof)
+    # The far tail underflows (and nct.cdf can return nan there) once the effect is clearly detectable
+    return stats.nct.sf(crit, dof, ncp) + np.nan_to_num(stats.nct.cdf(-crit, dof, ncp))
+
+
+def _power_chi2(w, n, dof, alpha):
+    return stats.ncx2.sf(stats.chi2.isf(alpha, dof), dof, np.maximum(n * w ** 2, 1e-12))
+
+
+def _power_correlation(r, n, _, alpha):
+    z = np.abs(np.arctanh(np.clip(r, -1 + 1e-15, 1 - 1e-15))) * np.sqrt(n - 3)
+    crit = stats.norm.isf(alpha / 2)
+    return stats.norm.sf(crit - z) + stats.norm.cdf(-crit - z)
+
+
+def _power_anova(f, n, k, alpha):
+    dfn, dfd = k - 1, n - k
+    return stats.ncf.sf(stats.f.isf(alpha, dfn, dfd), dfn, dfd, np.maximum(n * f ** 2, 1e-12))
+
+
+# kind -> (power(effect, n, param, alpha), smallest usable n given param)
+POWER_MODELS = {
+    "ttest": (_power_ttest, lambda param: 4.0),
+    "chi2": (_power_chi2, lambda param: 2.0),
+    "correlation": (_power_correlation, lambda param: 4.0),
+    "anova": (_power_anova, lambda param: param + 2.0),
+}
+
+
+def required_rows(power_at, low, target, steps=64):
+    """
+    Smallest n (per element) with power_at(n) >= target, by a vectorized bisection on
+    log n between `low` and MAX_ROWS. Unreachable targets give inf.
+    """
+    low = np.array(low, dtype=np.float64)
+    high = np.full_like(low, MAX_ROWS)
+    reachable = power_at(high) >= target
+    for _ in range(steps):
+        mid = np.sqrt(low * high)
+        enough = power_at(mid) >= target
+        high = np.where(enough, mid, high)
+        low = np.where(enough, low, mid)
+    return np.where(reachable, np.ceil(high), np.inf)
+
+
+def power_analysis(effects, alpha=ALPHA, power=TARGET_POWER):
+    """
+    Achieved power and the rows needed for `power` for a list of effect dicts (None
+    entries are skipped). Effects of the same kind are solved together in one call.
+    Returns two float arrays aligned with `effects`.
+    """
+    achieved = np.full(len(effects), np.nan)
+    needed = np.full(len(effects), np.nan)
+    for kind, (model, smallest) in POWER_MODELS.items():
+        idx = [i for i, e in enumerate(effects) if e and e["kind"] == kind]
+        if not idx:
+            continue
+        effect = np.array([effects[i].get("power_effect", effects[i]["effect"]) for i in idx], dtype=np.float64)
+        n = np.array([effects[i]["n"] for i in idx], dtype=np.float64)
+        param = np.array([np.nan if effects[i]["param"] is None else effects[i]["param"] for i in idx])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            achieved[idx] = model(effect, n, param, alpha)
+            rows = required_rows(lambda m: model(effect, m, param, alpha),
+                                 [smallest(p) for p in param], power)
+        needed[idx] = np.where(np.isfinite(effect) & (effect != 0), rows, np.nan)
+    return achieved, needed
+
+
+def effect_details(effect, achieved, needed, alpha=ALPHA, power=TARGET_POWER):
+    """
+    Report rows for an effect and its power analysis.
+    """
+    details = {}
+    if effect.get("ci"):
+        low, high = effect["ci"]
+        if effect["kind"] == "correlation":
+            details["95% CI for r"] = f"[{low:.4f}, {high:.4f}]"
+        else:
+            details[effect["label"]] = f"{effect['effect']:.4f} (95% CI [{low:.4f}, {high:.4f}])"
+    else:
+        details[effect["label"]] = f"{effect['effect']:.4f}"
+    details[f"Power at α = {alpha:g}"] = f"{achieved:.3f}" if np.isfinite(achieved) else "-"
+    details[f"Rows for {power:.0%} power"] = format_rows(needed)
+    return details
+
+
+def format_rows(needed):
+    if np.isnan(needed):
+        return "-"
+    if np.isinf(needed):
+        return f"more than {MAX_ROWS:,.0f}"
+    return f"{int(needed):,}"
+
+
+def effect_label(effect):
+    return f"{effect['label']} = {effect['effect']:.3f}"
@@ -0,0 +1,190 @@
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.stats import rankdata
+
+from src.batch_tests import welch_from_moments
+
+GROUP_METHODS = {
+    "anova": "One-way ANOVA",
+    "welch_anova": "Welch ANOVA",
+    "kruskal": "Kruskal–Wallis",
+}
+
+
+def group_codes(df, group_col, profile=None):
+    """
+    Integer group codes (-1 for missing) and level labels, in order of first appearance.
+    Reuses the profile's codes when the column has them.
+    """
+    if profile is not None and group_col in profile.codes:
+        return profile.codes[group_col], list(profile.levels[group_col])
+    codes, levels = pd.factorize(df[group_col])
+    return codes, list(levels)
+
+
+class GroupSummary:
+    """
+    Per-group sufficient statistics of one or more numeric targets.
+    Arrays are shaped (targets, groups): count `n`, `mean` and `ss`, the sum of squared
+    deviations from the group mean. With ranks, `rank_sum` holds each group's rank sum
+    and `tie_sum` the per-target sum of t^3 - t over tied runs (for Kruskal–Wallis).
+    """
+
+    def __init__(self, levels, targets, n, mean, ss, rank_sum=None, tie_sum=None):
+        self.levels = levels
+        self.targets = list(targets)
+        self.n = n
+        self.mean = mean
+        self.ss = ss
+        self.rank_sum = rank_sum
+        self.tie_sum = tie_sum
+
+    @property
+    def k(self):
+        return len(self.levels)
+
+    def index(self, target):
+        return self.targets.index(target)
+
+
+def group_moments(codes, y, k):
+    """
+    Count, mean and sum of squared deviations of `y` for each code 0..k-1, skipping rows
+    with a negative code or a missing value. Also returns the valid codes and values.
+    """
+    valid = (codes >= 0) & ~np.isnan(y)
+    # Complete columns are used as they are (a view for float64), without a masked copy
+    c, v = (codes, y) if valid.all() else (codes[valid], y[valid])
+    n = np.bincount(c, minlength=k).astype(np.float64)
+    # Sums around the pooled mean and deviations from the group mean, so large
+    # offsets don't swamp small group differences
+    shift = v.mean() if len(v) else 0.0
+    d = v - shift
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centered_mean = np.bincount(c, weights=d, minlength=k) / n
+    d -= centered_mean[c]
+    ss = np.bincount(c, weights=np.square(d, out=d), minlength=k)
+    return n, centered_mean + shift, ss, c, v
+
+
+def group_summary(df, group_col, targets, profile=None, ranks=False):
+    """
+    Computes GroupSummary for every target in one factorized pass over the group column:
+    the codes are built once and each target needs only a few bincounts.
+    """
+    codes, levels = group_codes(df, group_col, profile)
+    k = len(levels)
+    m = len(targets)
+    n = np.zeros((m, k))
+    mean = np.full((m, k), np.nan)
+    ss = np.zeros((m, k))
+    rank_sum = np.zeros((m, k)) if ranks else None
+    tie_sum = np.zeros(m) if ranks else None
+    for i, target in enumerate(targets):
+        y = df[target].to_numpy(dtype=np.float64, na_value=np.nan)
+        n[i], mean[i], ss[i], c, v = group_moments(codes, y, k)
+        if ranks:
+            r = rankdata(v)
+            rank_sum[i] = np.bincount(c, weights=r, minlength=k)
+            _, ties = np.unique(v, return_counts=True)
+            tie_sum[i] = float(np.sum(ties.astype(np.float64) ** 3 - ties))
+    return GroupSummary(levels, targets, n, mean, ss, rank_sum, tie_sum)
+
+
+def one_way_anova(summary):
+    """
+    Classic one-way ANOVA F per target. Returns (F, p, (df_between, df_within)).
+    Groups without observations are ignored.
+    """
+    n, mean, ss = summary.n, summary.mean, summary.ss
+    present = n > 0
+    k = present.sum(axis=1)
+    total = n.sum(axis=1)
+    grand = np.nansum(n * np.where(present, mean, 0), axis=1) / total
+    between = np.sum(np.where(present, n * (mean - grand[:, None]) ** 2, 0), axis=1)
+    within = ss.sum(axis=1)
+    df_between, df_within = k - 1, total - k
+    with np.errstate(invalid="ignore", divide="ignore"):
+        f = (between / df_between) / (within / df_within)
+    return f, stats.f.sf(f, df_between, df_within), (df_between, df_within)
+
+
+def welch_anova(summary):
+    """
+    Welch's heteroscedastic one-way ANOVA per target. Returns (F, p, (df1, df2)).
+    """
+    n, mean, ss = summary.n, summary.mean, summary.ss
+    present = n > 0
+    k = present.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = ss / (n - 1)
+        w = np.where(present, n / var, 0)
+        w_total = w.sum(axis=1)
+        weighted_mean = np.sum(np.where(present, w * mean, 0), axis=1) / w_total
+        a = np.sum(np.where(present, w * (mean - weighted_mean[:, None]) ** 2, 0), axis=1) / (k - 1)
+        tmp = np.sum(np.where(present, (1 - w / w_total[:, None]) ** 2 / (n - 1), 0), axis=1)
+        b = 1 + 2 * (k - 2) / (k ** 2 - 1) * tmp
+        f = a / b
+        df1, df2 = k - 1, (k ** 2 - 1) / (3 * tmp)
+    return f, stats.f.sf(f, df1, df2), (df1, df2)
+
+
+def kruskal_wallis(summary):
+    """
+    Kruskal–Wallis H per target, tie-corrected. Needs a summary built with ranks=True.
+    Returns (H, p, df).
+    """
+    if summary.rank_sum is None:
+        raise ValueError("Kruskal–Wallis needs a group summary built with ranks=True")
+    n = summary.n
+    present = n > 0
+    k = present.sum(axis=1)
+    total = n.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        h = 12 / (total * (total + 1)) * np.sum(np.where(present, summary.rank_sum ** 2 / n, 0), axis=1) \
+            - 3 * (total + 1)
+        h = h / (1 - summary.tie_sum / (total ** 3 - total))
+    return h, stats.chi2.sf(h, k - 1), k - 1
+
+
+def welch_t(summary):
+    """
+    Welch two-sample t per target from a two-group summary. Returns (t, p, dof).
+    """
+    if summary.k != 2:
+        raise ValueError("T-test requires exactly 2 groups")
+    n, mean = summary.n, summary.mean
+    with np.errstate(invalid="ignore", divide="ignore"):
+        var = summary.ss / (n - 1)
+    t, dof, p = welch_from_moments(n[:, 0], mean[:, 0], var[:, 0], n[:, 1], mean[:, 1], var[:, 1])
+    return t, p, dof
+
+
+GROUP_TESTS = {
+    "anova": one_way_anova,
+    "welch_anova": welch_anova,
+    "kruskal": kruskal_wallis,
+}
+
+
+def grouped_tests(df, group_col, targets, method="anova", profile=None, summary=None):
+    """
+    Runs one grouped test for several numeric targets from a single group summary.
+    Returns result dicts with type, method, cat, num, stat, p and dof.
+    """
+    if method not in GROUP_TESTS:
+        raise ValueError(f"Unknown grouped test '{method}'")
+    if summary is None:
+        summary = group_summary(df, group_col, targets, profile, ranks=method == "kruskal")
+    stat, p, dof = GROUP_TESTS[method](summary)
+    dof = dof if isinstance(dof, tuple) else (dof,)
+    results = []
+    for target in targets:
+        i = summary.index(target)
+        results.append({
+            "type": "anova", "method": method, "cat": group_col, "num": target,
+            "stat": float(stat[i]), "p": float(p[i]),
+            "dof": [float(d[i]) for d in dof],
+        })
+    return results
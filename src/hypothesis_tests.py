@@ -1,10 +1,13 @@
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
+import numpy as np
 import pandas as pd
 import scipy.stats as stats
-from scipy.stats import ttest_ind, pearsonr, spearmanr
-from src.utils import save_plot_if_needed
+from scipy.stats import rankdata
+from src.plot_renderer import render_plot, defer_plot as queue_plot, boxplot_stats
+from src.batch_tests import contingency_from_codes, _t_pvalue
+from src.metrics import instrument
+from src.group_stats import group_codes, group_summary, grouped_tests, welch_t, GROUP_METHODS
+from src.effect_sizes import ttest_effect, chi2_effect, correlation_effect, anova_effect
 
 try:
     BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -13,8 +16,69 @@ except NameError:
 
 PLOT_PATH = os.path.join(BASE_DIR, "results", "plots")
 
-def categorical_associations(df, col1, col2, return_all=False, save_path=None):
-    contingency = pd.crosstab(df[col1], df[col2])
+def make_plot(kind, save_path, defer, **data):
+    """
+    Draws the plot now, or only records it for the deferred renderer when `defer` is set.
+    """
+    if defer:
+        return queue_plot(kind, save_path, **data)
+    return render_plot(kind, save_path, **data)
+
+def group_plot(df, group_col, target_col, save_path, defer, title, fast=False):
+    """
+    Boxplot of a numeric column by group; with `fast` the boxes come from per-group
+    quantiles so only the summary is drawn (and pickled, when deferred).
+    """
+    if fast:
+        return make_plot("quantile_boxplot", save_path, defer, box_stats=boxplot_stats(df, group_col, target_col),
+                         x=group_col, y=target_col, title=title)
+    return make_plot("boxplot", save_path, defer, data=df[[group_col, target_col]],
+                     x=group_col, y=target_col, title=title)
+
+def contingency_table(df, col1, col2, profile=None):
+    """
+    Crosstab of two categorical columns, counted with np.bincount over integer codes
+    (the profile's when available, otherwise factorized here) rather than `pd.crosstab`.
+    """
+    codes1, levels1 = group_codes(df, col1, profile)
+    codes2, levels2 = group_codes(df, col2, profile)
+    table = contingency_from_codes(codes1, len(levels1), codes2, len(levels2), drop_empty=False)
+    contingency = pd.DataFrame(table, index=pd.Index(levels1, name=col1), columns=pd.Index(levels2, name=col2))
+    contingency = contingency.loc[contingency.sum(axis=1) > 0, contingency.sum(axis=0) > 0]
+    return contingency.sort_index().sort_index(axis=1)
+
+def paired_values(df, col1, col2):
+    """
+    Two columns as float arrays over the rows where both are present (pairwise-complete).
+    Float64 columns are read as views and nothing is copied unless a value is missing.
+    """
+    x = df[col1].to_numpy(dtype=np.float64, na_value=np.nan)
+    y = df[col2].to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = ~np.isnan(x)
+    valid &= ~np.isnan(y)
+    if not valid.all():
+        x, y = x[valid], y[valid]
+    return x, y
+
+def pearson_r(x, y):
+    """
+    Pearson's r and its two-sided p-value (as scipy.stats.pearsonr reports them) from two
+    complete arrays, with one centered temporary per array.
+    """
+    xm = x - x.mean()
+    ym = y - y.mean()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        r = np.dot(xm, ym) / np.sqrt(np.dot(xm, xm) * np.dot(ym, ym))
+    return float(r), float(_t_pvalue(r, len(x)))
+
+@instrument("test_chi2")
+def categorical_associations(df, col1, col2, return_all=False, save_path=None, defer_plot=False, profile=None,
+                             accumulator=None):
+    if accumulator is not None:
+        # Stored counts plus only the rows appended since (see `src.accumulators`)
+        contingency = accumulator.update_to(df).table()
+    else:
+        contingency = contingency_table(df, col1, col2, profile)
     chi2, p, dof, expected = stats.chi2_contingency(contingency)
     if p < 0.05:
         verdict = "Reject H₀"
@@ -22,48 +86,93 @@ def categorical_associations(df, col1, col2, return_all=False, save_path=None):
     else:
         verdict = "Fail to Reject H₀"
         interpretation = f"Significant association found between {col1} and {col2} (p={p:.4f})"
-    plt.figure(figsize=(10, 6))
-    sns.heatmap(contingency, annot=True, fmt='d', cmap='Blues')
-    plt.title(f"{col1} vs {col2}")
-    save_plot_if_needed(save_path)
-    plt.close()
+    make_plot("heatmap", save_path, defer_plot, contingency=contingency, title=f"{col1} vs {col2}")
     rel_path = os.path.relpath(save_path, os.path.join(BASE_DIR, "results"))
     if return_all:
-        return chi2, p, verdict, interpretation, rel_path
+        return chi2, p, verdict, interpretation, rel_path, chi2_effect(contingency)
 
-def t_test(df, group_col, target_col, return_all=False, save_path=None):
-    groups = df[group_col].dropna().unique()
-    if len(groups) != 2:
+@instrument("test_ttest")
+def t_test(df, group_col, target_col, return_all=False, save_path=None, defer_plot=False, profile=None,
+           accumulator=None, fast_plot=False, plot_df=None):
+    """
+    Welch's t-test of `target_col` between the two groups of `group_col`. With an
+    accumulator the statistics come from its stored state plus the appended rows, and
+    the plot from `plot_df` (the preview sample) when given, so old rows are not read.
+    """
+    plot_title = f"Boxplot of {target_col} by {group_col}"
+    if accumulator is not None:
+        summary = accumulator.update_to(df).group_summary()
+        if plot_df is not None:
+            df, plot_title = plot_df, f"{plot_title} (preview sample)"
+    else:
+        # Group moments from one factorized pass instead of a boolean-mask scan per group
+        summary = group_summary(df, group_col, [target_col], profile)
+    if summary.k != 2:
         raise ValueError("T-test requires exactly 2 groups")
-    group1 = df[df[group_col] == groups[0]][target_col].dropna()
-    group2 = df[df[group_col] == groups[1]][target_col].dropna()
-    t_stat, p = ttest_ind(group1, group2, equal_var=False)
+    t_stat, p, _ = welch_t(summary)
+    t_stat, p = float(t_stat[0]), float(p[0])
     if p < 0.05:
         verdict = "Reject H₀"
         interpretation = f"Means do not differ significantly between groups of {group_col} on {target_col}"
     else:
         verdict = "Fail to Reject H₀"
         interpretation = f"Significant mean difference found between groups of {group_col} on {target_col}"
-    plt.figure(figsize=(10, 6))
-    sns.boxplot(data=df, x=group_col, y=target_col)
-    plt.title(f"Boxplot of {target_col} by {group_col}")
-    save_plot_if_needed(save_path)
-    plt.close()
+    group_plot(df, group_col, target_col, save_path, defer_plot, plot_title, fast_plot)
     rel_path = os.path.relpath(save_path, os.path.join(BASE_DIR, "results"))
     if return_all:
-        return t_stat, p, verdict, interpretation, rel_path
-
-def correlation_test(df, col1, col2, method="pearson", save_path=None):
-    x = df[col1].dropna()
-    y = df[col2].dropna()
-    idx = x.index.intersection(y.index)
-    x, y = x.loc[idx], y.loc[idx]
-    if method == "pearson":
-        stat, p = pearsonr(x, y)
+        return t_stat, p, verdict, interpretation, rel_path, ttest_effect(summary)
+
+@instrument("test_anova")
+def anova_test(df, group_col, target_col, method="anova", return_all=False, save_path=None, defer_plot=False,
+               profile=None, summary=None, fast_plot=False):
+    """
+    One-way ANOVA, Welch ANOVA or Kruskal–Wallis of `target_col` across the levels of `group_col`.
+    `summary` may be a GroupSummary already computed for several targets at once.
+    """
+    if summary is None:
+        summary = group_summary(df, group_col, [target_col], profile, ranks=method == "kruskal")
+    result = grouped_tests(df, group_col, [target_col], method, profile, summary)[0]
+    stat, p = result["stat"], result["p"]
+    if p < 0.05:
+        verdict = "Reject H₀"
+        interpretation = f"{target_col} differs significantly across the groups of {group_col} (p={p:.4f})"
+    else:
+        verdict = "Fail to Reject H₀"
+        interpretation = f"No significant difference in {target_col} across the groups of {group_col} (p={p:.4f})"
+    rel_path = None
+    if save_path:
+        group_plot(df, group_col, target_col, save_path, defer_plot,
+                   f"{GROUP_METHODS[method]}: {target_col} by {group_col}", fast_plot)
+        rel_path = os.path.relpath(save_path, os.path.join(BASE_DIR, "results"))
+    if return_all:
+        return stat, p, verdict, interpretation, rel_path, anova_effect(summary, summary.index(target_col), method, stat)
+
+@instrument("test_correlation")
+def correlation_test(df, col1, col2, method="pearson", save_path=None, defer_plot=False, accumulator=None,
+                     fast_plot=False, plot_df=None):
+    """
+    Pearson or Spearman correlation of two numeric columns. With an accumulator (Pearson
+    only) the statistics come from its stored co-moments plus the appended rows, and the
+    plot from `plot_df` (the preview sample) when given, so old rows are not read.
+    """
+    title = f"{col1} vs {col2} ({method.title()} Correlation)"
+    if method == "pearson" and accumulator is not None:
+        stat, p, n = accumulator.update_to(df).pearson()
         desc = "linear"
+        x = y = None
+        if save_path:
+            if plot_df is not None:
+                df, title = plot_df, f"{title} (preview sample)"
+            x, y = paired_values(df, col1, col2)
     else:
-        stat, p = spearmanr(x, y)
-        desc = "monotonic"
+        x, y = paired_values(df, col1, col2)
+        n = len(x)
+        if method == "pearson":
+            stat, p = pearson_r(x, y)
+            desc = "linear"
+        else:
+            stat, p = pearson_r(rankdata(x), rankdata(y))
+            desc = "monotonic"
     if p < 0.05:
         verdict = "Reject H₀"
         interpretation = f"No significant {desc} relationship between {col1} and {col2} (p={p:.4f})"
@@ -72,13 +181,10 @@ def correlation_test(df, col1, col2, method="pearson", save_path=None):
         interpretation = f"There is significant {desc} relationship between {col1} and {col2} (p={p:.4f})"
     rel_path = None
     if save_path:
-        plt.figure(figsize=(10, 6))
-        sns.scatterplot(x=x, y=y)
-        plt.title(f"{col1} vs {col2} ({method.title()} Correlation)")
-        save_plot_if_needed(save_path)
-        plt.close()
+        make_plot("hexbin" if fast_plot else "scatter", save_path, defer_plot, x=x, y=y,
+                  title=title, xlabel=col1, ylabel=col2)
         rel_path = os.path.relpath(save_path, os.path.join(BASE_DIR, "results"))
-    return stat, p, verdict, interpretation, rel_path
+    return stat, p, verdict, interpretation, rel_path, correlation_effect(stat, n, method)
 
 
 
@@ -0,0 +1,305 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+except NameError:
+    BASE_DIR = os.path.abspath(os.path.join(os.getcwd(), ".."))
+
+JOBS_DIR = os.path.join(BASE_DIR, "results", "jobs")
+JOBS_DB = os.path.join(JOBS_DIR, "jobs.sqlite3")
+MAX_CONCURRENT_JOBS = int(os.environ.get("STATS_COURT_MAX_JOBS", 2))
+# A running job renews its lease (the row's `updated` time) several times per period;
+# a job whose lease lapses belonged to a worker that died and is failed, freeing its slot
+JOB_LEASE = float(os.environ.get("STATS_COURT_JOB_LEASE_SECONDS", 60))
+# Finished runs (report and plots) are removed past this age or once all runs exceed the size cap
+RUN_MAX_AGE = float(os.environ.get("STATS_COURT_RUN_MAX_AGE_HOURS", 24)) * 3600
+RUNS_MAX_BYTES = int(os.environ.get("STATS_COURT_RUNS_MAX_MB", 512)) * 1024 * 1024
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    dataset_id TEXT,
+    config TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    report_path TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+)
+"""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+class JobQueue:
+    """
+    Background test runs backed by a SQLite file, so every worker process sees
+    the same jobs without any outside service.
+
+    `handler(job, progress)` does the work; it must call `progress(index)` before
+    each test, which records progress and raises JobCancelled once cancellation
+    has been requested. At most `max_concurrent` jobs run at once across all
+    processes sharing the database; running jobs hold a lease of `lease` seconds
+    that their process renews until they finish.
+    """
+
+    def __init__(self, handler, db_path=JOBS_DB, max_concurrent=MAX_CONCURRENT_JOBS, lease=JOB_LEASE):
+        self.handler = handler
+        self.db_path = db_path
+        self.max_concurrent = max_concurrent
+        self.lease = lease
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent)
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        conn = self._connect()
+        try:
+            conn.execute(SCHEMA)
+        finally:
+            conn.close()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _update(self, job_id, **fields):
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._connect()
+        try:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+        finally:
+            conn.close()
+
+    def submit(self, dataset_id, config):
+        job_id = uuid.uuid4().hex
+        report_path = os.path.join(os.path.dirname(self.db_path), job_id, "report.html")
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, status, dataset_id, config, total, report_path, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, dataset_id, json.dumps(config), len(config), report_path, now, now)
+            )
+        finally:
+            conn.close()
+        self._executor.submit(self._work)
+        print(f"📬 Queued job {job_id} ({len(config)} tests)")
+        return job_id
+
+    def _claim(self):
+        """
+        Atomically moves the oldest queued job to running if a slot is free, after
+        failing running jobs whose lease has lapsed.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            self._expire_leases(conn)
+            running = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (RUNNING,)).fetchone()[0]
+            row = None
+            if running < self.max_concurrent:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute("UPDATE jobs SET status = ?, updated = ? WHERE id = ?",
+                                 (RUNNING, time.time(), row["id"]))
+            conn.execute("COMMIT")
+            return dict(row) if row is not None else None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def _expire_leases(self, conn):
+        now = time.time()
+        return conn.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE status = ? AND updated < ?",
+                            (FAILED, "The worker running this job stopped", now, RUNNING, now - self.lease)).rowcount
+
+    def _heartbeat(self, job_id, stop):
+        # Renews the running job's lease until `stop` is set
+        while not stop.wait(self.lease / 4):
+            self._update(job_id)
+
+    def _work(self):
+        while True:
+            job = self._claim()
+            if job is None:
+                return
+            job["config"] = json.loads(job["config"])
+            self._run(job)
+
+    def _run(self, job):
+        job_id = job["id"]
+
+        def progress(index):
+            self._update(job_id, completed=index)
+            if self._cancel_requested(job_id):
+                raise JobCancelled(job_id)
+
+        stop = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job_id, stop), daemon=True).start()
+        try:
+            self.handler(job, progress)
+            self._update(job_id, status=DONE, completed=job["total"])
+            print(f"✅ Job {job_id} finished")
+        except JobCancelled:
+            self._update(job_id, status=CANCELLED)
+            print(f"🛑 Job {job_id} cancelled")
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e))
+            print(f"Error in job {job_id}:\n   {e}")
+        finally:
+            stop.set()
+        self.collect_garbage()
+
+    def _cancel_requested(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return bool(row and row["cancel_requested"])
+
+    def cancel(self, job_id):
+        """
+        Cancels a queued job immediately; a running job stops before its next test.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE jobs SET status = ?, updated = ? WHERE id = ? AND status = ?",
+                         (CANCELLED, time.time(), job_id, QUEUED))
+            conn.execute("UPDATE jobs SET cancel_requested = 1, updated = ? WHERE id = ? AND status = ?",
+                         (time.time(), job_id, RUNNING))
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        job = dict(row)
+        job["config"] = json.loads(job["config"])
+        return job
+
+    def status(self, job_id):
+        """
+        JSON-friendly job status with one entry per test in the config.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return None
+        tests = []
+        for index, test in enumerate(job["config"]):
+            if index < job["completed"] or job["status"] == DONE:
+                state = "done"
+            elif index == job["completed"] and job["status"] == RUNNING:
+                state = "running"
+            elif job["status"] in FINISHED:
+                state = job["status"]
+            else:
+                state = "pending"
+            tests.append({"test": test.get("hypothesis") or test.get("type"), "status": state})
+        return {
+            "id": job["id"],
+            "status": job["status"],
+            "completed": job["completed"],
+            "total": job["total"],
+            "error": job["error"],
+            "tests": tests,
+            # Sampled previews can be re-run at full precision
+            "fast": any(test.get("fast") for test in job["config"]),
+        }
+
+    def collect_garbage(self, max_age=RUN_MAX_AGE, max_bytes=RUNS_MAX_BYTES):
+        """
+        Deletes finished runs older than `max_age` seconds, then the oldest remaining
+        ones until the finished runs fit in `max_bytes`. Queued and running jobs are
+        never touched. Returns the number of runs removed.
+        """
+        conn = self._connect()
+        try:
+            finished = conn.execute(
+                f"SELECT id, report_path, updated FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED))}) "
+                "ORDER BY updated", FINISHED
+            ).fetchall()
+            total = sum(directory_size(os.path.dirname(row["report_path"])) for row in finished)
+            cutoff = time.time() - max_age
+            removed = []
+            for row in finished:
+                if row["updated"] >= cutoff and total <= max_bytes:
+                    break
+                run_dir = os.path.dirname(row["report_path"])
+                total -= directory_size(run_dir)
+                shutil.rmtree(run_dir, ignore_errors=True)
+                removed.append(row["id"])
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in removed])
+        finally:
+            conn.close()
+        if removed:
+            print(f"🧹 Removed {len(removed)} old runs")
+        return len(removed)
+
+    def recover(self):
+        """
+        Marks jobs left running by a dead process as failed and resumes queued ones.
+        Call once at startup, before any worker of this deployment claims jobs.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("UPDATE jobs SET status = ?, error = ?, updated = ? WHERE status = ?",
+                         (FAILED, "Interrupted by a restart", time.time(), RUNNING))
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        finally:
+            conn.close()
+        for _ in range(min(queued, self.max_concurrent)):
+            self._executor.submit(self._work)
+
+    def resume(self):
+        """
+        Fails jobs whose lease has lapsed and starts working on queued jobs. Safe to call
+        from every worker process at any time (gunicorn calls it as each worker starts),
+        unlike `recover`, which assumes no other process is running jobs.
+        """
+        conn = self._connect()
+        try:
+            expired = self._expire_leases(conn)
+            queued = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = ?", (QUEUED,)).fetchone()[0]
+        finally:
+            conn.close()
+        if expired:
+            print(f"⚠️ Failed {expired} jobs left running by a stopped worker")
+        for _ in range(min(queued, self.max_concurrent)):
+            self._executor.submit(self._work)
@@ -0,0 +1,163 @@
+import os
+import json
+import time
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+# Structured (one JSON object per line) stage logs
+logger = logging.getLogger("stats_court.metrics")
+
+PREFIX = "stats_court_"
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+ENABLED = os.environ.get("STATS_COURT_METRICS", "1") != "0"
+
+HELP = {
+    "stage_seconds": "Time spent in each instrumented stage",
+    "stage_errors_total": "Stages that raised an exception",
+    "rows_processed_total": "Rows processed, by stage",
+    "cache_requests_total": "Result cache lookups, by outcome",
+}
+
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """
+    Adds `value` to the counter `name` with the given labels.
+    """
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """
+    Records one observation (e.g. a duration in seconds) in the histogram `name`.
+    """
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = {"buckets": [0] * len(BUCKETS), "count": 0, "sum": 0.0}
+        hist["count"] += 1
+        hist["sum"] += value
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                hist["buckets"][i] += 1
+                break
+
+
+def log_event(event, **fields):
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({"event": event, **fields}, default=str))
+
+
+@contextmanager
+def timed(stage, rows=None, **fields):
+    """
+    Times the enclosed block as `stage`, logs it and records it in the histogram.
+    `rows` (if known) is added to the rows-processed counter.
+    """
+    if not ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        record_stage(stage, time.perf_counter() - start, status, rows=rows, **fields)
+
+
+def record_stage(stage, seconds, status="ok", rows=None, **fields):
+    """
+    Records a stage that took `seconds` like `timed` does; for work timed elsewhere,
+    such as in a worker process whose own metrics this process never sees.
+    """
+    if not ENABLED:
+        return
+    if status == "error":
+        inc("stage_errors_total", stage=stage)
+    observe("stage_seconds", seconds, stage=stage)
+    if rows is not None:
+        inc("rows_processed_total", rows, stage=stage)
+    log_event("stage", stage=stage, seconds=round(seconds, 6), status=status, rows=rows, **fields)
+
+
+def instrument(stage):
+    """
+    Decorator form of `timed`; a DataFrame first argument's length is counted as rows.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            rows = len(args[0]) if args and hasattr(args[0], "columns") else None
+            with timed(stage, rows=rows):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = []
+    for k, v in pairs:
+        value = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        escaped.append(f'{k}="{value}"')
+    return "{" + ",".join(escaped) + "}"
+
+
+def render_prometheus():
+    """
+    All counters and histograms in the Prometheus text exposition format.
+    Values are per process; each gunicorn worker reports its own.
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {k: {"buckets": list(v["buckets"]), "count": v["count"], "sum": v["sum"]}
+                      for k, v in _histograms.items()}
+    lines = []
+    for name in sorted({k[0] for k in counters}):
+        lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {PREFIX}{name} counter")
+        for (metric, labels), value in sorted(counters.items()):
+            if metric == name:
+                lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+    for name in sorted({k[0] for k in histograms}):
+        lines.append(f"# HELP {PREFIX}{name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {PREFIX}{name} histogram")
+        for (metric, labels), hist in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(BUCKETS, hist["buckets"]):
+                cumulative += count
+                lines.append(f"{PREFIX}{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{PREFIX}{name}_bucket{_labels(labels, [('le', '+Inf')])} {hist['count']}")
+            lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {hist['sum']}")
+            lines.append(f"{PREFIX}{name}_count{_labels(labels)} {hist['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
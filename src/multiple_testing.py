@@ -0,0 +1,68 @@
+import numpy as np
+from src.batch_tests import run_batch, ALL_NUMERIC, ALL_CATEGORICAL
+
+CORRECTIONS = {
+    "fdr_bh": "Benjamini–Hochberg",
+    "bonferroni": "Bonferroni",
+}
+
+
+def adjust_pvalues(p_values, method="fdr_bh"):
+    """
+    Multiple-testing adjusted p-values. NaN p-values are ignored and stay NaN.
+    "fdr_bh" controls the false discovery rate, "bonferroni" the family-wise error rate.
+    """
+    p = np.asarray(p_values, dtype=np.float64)
+    adjusted = np.full_like(p, np.nan)
+    valid = ~np.isnan(p)
+    m = int(valid.sum())
+    if m == 0:
+        return adjusted
+    pv = p[valid]
+    if method == "bonferroni":
+        adjusted[valid] = np.minimum(pv * m, 1.0)
+    elif method == "fdr_bh":
+        order = np.argsort(pv)
+        scaled = pv[order] * m / np.arange(1, m + 1)
+        # Enforce monotonicity from the largest p-value down
+        q = np.minimum.accumulate(scaled[::-1])[::-1]
+        out = np.empty(m)
+        out[order] = np.minimum(q, 1.0)
+        adjusted[valid] = out
+    else:
+        raise ValueError(f"Unknown correction '{method}'")
+    return adjusted
+
+
+def screening_batch(test):
+    """
+    The batched config a screening config expands to. Column selectors
+    ("cols", "num", "cat", "pairs") default to every eligible column.
+    """
+    batch = {k: v for k, v in test.items() if k not in ("type", "test", "correction", "alpha", "top_k")}
+    batch["type"] = test.get("test", "correlation")
+    if batch["type"] == "ttest":
+        batch.setdefault("num", ALL_NUMERIC)
+        batch.setdefault("cat", ALL_CATEGORICAL)
+    elif "pairs" not in batch:
+        batch.setdefault("cols", ALL_NUMERIC if batch["type"] == "correlation" else ALL_CATEGORICAL)
+    return batch
+
+
+def screen(df, test, profile=None):
+    """
+    Runs one hypothesis type over every eligible column pair and corrects the
+    p-values over the whole batch.
+
+    `test` is a screening config such as
+    {"type": "screen", "test": "chi2", "correction": "fdr_bh", "alpha": 0.05}.
+    Returns the results sorted by adjusted p-value, each with "q" and "significant".
+    """
+    results = run_batch(df, screening_batch(test), profile)
+    alpha = test.get("alpha", 0.05)
+    q = adjust_pvalues([r["p"] for r in results], test.get("correction", "fdr_bh"))
+    for result, q_value in zip(results, q):
+        result["q"] = float(q_value)
+        result["significant"] = bool(q_value < alpha)
+    results.sort(key=lambda r: (np.isnan(r["q"]), r["q"]))
+    return results
@@ -0,0 +1,457 @@
+import os
+import json
+import time
+import pickle
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pandas as pd
+import seaborn as sns
+from matplotlib.figure import Figure
+from src.utils import save_figure, process_context
+from src.metrics import record_stage, inc
+
+# A deferred plot is stored next to its target image as "<image>.spec.pkl"
+SPEC_SUFFIX = ".spec.pkl"
+# A spec being rendered is renamed to "<spec>.rendering" first, so only one process draws it
+CLAIM_SUFFIX = ".rendering"
+# How long a request waits for a plot that another process is rendering
+PLOT_WAIT_SECONDS = 30
+# A spec whose render fails is dropped and "<spec>.failed" records the error: at once for
+# errors from the plot itself, after this many attempts for memory or disk errors and dead workers
+FAILED_SUFFIX = ".failed"
+PLOT_MAX_ATTEMPTS = 3
+FIGSIZE = (10, 6)
+# Small multiples: panels per row and the size of each panel
+SMALL_MULTIPLES_COLUMNS = 4
+PANEL_SIZE = (4, 3)
+# Above these sizes a plot switches to a summarized representation (see `fit_to_size`),
+# so render time and image size stay bounded whatever the size of the data
+HEATMAP_MAX_LEVELS = 20          # rows/columns shown; the others are summed into "Other"
+HEATMAP_ANNOTATE_CELLS = 150     # cell counts are written only on heatmaps up to this size
+SCATTER_MAX_POINTS = 20_000      # larger scatters become a 2-D histogram
+BOXPLOT_MAX_POINTS = 50_000      # larger boxplots are drawn from per-group quantiles
+HIST2D_BINS = 100
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Each draw function fills the Axes it is given; figures are created per plot (never
+# through pyplot's global state), so several plots can render in parallel threads.
+
+
+def draw_heatmap(ax, contingency, title, vmax=None):
+    annot = contingency.size <= HEATMAP_ANNOTATE_CELLS
+    sns.heatmap(contingency, annot=annot, fmt='d', cmap='Blues', vmax=vmax, ax=ax)
+    ax.set_title(title)
+
+
+def draw_boxplot(ax, data, x, y, title):
+    sns.boxplot(data=data, x=x, y=y, ax=ax)
+    ax.set_title(title)
+
+
+def draw_scatter(ax, x, y, title, xlabel=None, ylabel=None):
+    # Markers are rasterized in vector formats; axes and text stay vector
+    sns.scatterplot(x=x, y=y, ax=ax, rasterized=True)
+    ax.set(title=title, xlabel=xlabel, ylabel=ylabel)
+
+
+def draw_hexbin(ax, x, y, title, gridsize=60, xlabel=None, ylabel=None):
+    # Binned density instead of one marker per point
+    bins = ax.hexbin(x, y, gridsize=gridsize, cmap="Blues", mincnt=1, rasterized=True)
+    ax.figure.colorbar(bins, ax=ax, label="count")
+    ax.set(title=title, xlabel=xlabel, ylabel=ylabel)
+
+
+def draw_hist2d(ax, counts, xedges, yedges, title, xlabel=None, ylabel=None):
+    # Pre-binned density (see `binned_counts`); empty bins stay blank
+    mesh = ax.pcolormesh(xedges, yedges, np.ma.masked_equal(counts.T, 0), cmap="Blues",
+                         norm="log" if counts.max() > 1 else None, rasterized=True)
+    ax.figure.colorbar(mesh, ax=ax, label="count")
+    ax.set(title=title, xlabel=xlabel, ylabel=ylabel)
+
+
+def draw_quantile_boxplot(ax, box_stats, x, y, title):
+    # Boxes drawn from precomputed quantiles (see `boxplot_stats`), no raw points needed
+    ax.bxp(box_stats, showfliers=False)
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    ax.set_title(title)
+
+
+def boxplot_stats(data, x, y):
+    """
+    Quartiles and 1.5 IQR whiskers of `y` per group of `x`, in the form `Axes.bxp` takes.
+    """
+    grouped = data[[x, y]].dropna().groupby(x, observed=True, sort=True)[y]
+    quantiles = grouped.quantile([0.0, 0.25, 0.5, 0.75, 1.0]).unstack()
+    box_stats = []
+    for label, (low, q1, med, q3, high) in quantiles.iterrows():
+        iqr = q3 - q1
+        box_stats.append({"label": str(label), "q1": q1, "med": med, "q3": q3,
+                          "whislo": max(low, q1 - 1.5 * iqr), "whishi": min(high, q3 + 1.5 * iqr)})
+    return box_stats
+
+
+def binned_counts(x, y, bins=HIST2D_BINS):
+    """
+    2-D histogram of the finite (x, y) pairs on a `bins` x `bins` grid over their range,
+    counted with one bincount. Returns (counts, xedges, yedges) for `draw_hist2d`.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.isfinite(x) & np.isfinite(y)
+    if not valid.all():
+        x, y = x[valid], y[valid]
+    edges, cells = [], []
+    for values in (x, y):
+        low, high = (values.min(), values.max()) if len(values) else (0.0, 1.0)
+        if high <= low:
+            low, high = low - 0.5, high + 0.5
+        edges.append(np.linspace(low, high, bins + 1))
+        cell = ((values - low) * (bins / (high - low))).astype(np.intp)
+        cells.append(np.minimum(cell, bins - 1, out=cell))
+    counts = np.bincount(cells[0] * bins + cells[1], minlength=bins * bins).reshape(bins, bins)
+    return counts, edges[0], edges[1]
+
+
+def collapse_levels(contingency, max_levels=HEATMAP_MAX_LEVELS):
+    """
+    Keeps the `max_levels - 1` largest rows and columns of a crosstab, in their order, and
+    sums the others into one "Other (n)" row or column. Small tables are returned as-is.
+    """
+    if max(contingency.shape) <= max_levels:
+        return contingency
+    values = contingency.to_numpy()
+    labels = [list(contingency.index), list(contingency.columns)]
+    for axis in (0, 1):
+        totals = values.sum(axis=1 - axis)
+        if len(totals) <= max_levels:
+            continue
+        keep = np.zeros(len(totals), dtype=bool)
+        keep[np.argsort(-totals, kind="stable")[:max_levels - 1]] = True
+        other = np.compress(~keep, values, axis=axis).sum(axis=axis, keepdims=True)
+        values = np.concatenate([np.compress(keep, values, axis=axis), other], axis=axis)
+        labels[axis] = [str(label) for label, kept in zip(labels[axis], keep) if kept] + [f"Other ({(~keep).sum()})"]
+    return pd.DataFrame(values, index=pd.Index(labels[0], name=contingency.index.name),
+                        columns=pd.Index(labels[1], name=contingency.columns.name))
+
+
+PLOT_KINDS = {
+    "heatmap": draw_heatmap,
+    "boxplot": draw_boxplot,
+    "scatter": draw_scatter,
+    "hexbin": draw_hexbin,
+    "hist2d": draw_hist2d,
+    "quantile_boxplot": draw_quantile_boxplot,
+}
+
+
+def _fit_panel(kind, data, bins=HIST2D_BINS, max_points=SCATTER_MAX_POINTS, max_levels=HEATMAP_MAX_LEVELS):
+    if kind == "heatmap":
+        contingency = data["contingency"]
+        collapsed = collapse_levels(contingency, max_levels)
+        if collapsed is contingency:
+            return kind, data
+        # The colors scale with the cells shown individually; the "Other" sums saturate
+        rows = slice(-1) if contingency.shape[0] > max_levels else slice(None)
+        cols = slice(-1) if contingency.shape[1] > max_levels else slice(None)
+        return kind, dict(data, contingency=collapsed, vmax=collapsed.to_numpy()[rows, cols].max())
+    if kind == "scatter" and len(data["x"]) > max_points:
+        counts, xedges, yedges = binned_counts(data["x"], data["y"], bins)
+        rest = {key: value for key, value in data.items() if key not in ("x", "y")}
+        return "hist2d", dict(rest, counts=counts, xedges=xedges, yedges=yedges)
+    if kind == "boxplot" and len(data["data"]) > BOXPLOT_MAX_POINTS:
+        rest = {key: value for key, value in data.items() if key != "data"}
+        return "quantile_boxplot", dict(rest, box_stats=boxplot_stats(data["data"], data["x"], data["y"]))
+    return kind, data
+
+
+def fit_to_size(kind, data):
+    """
+    Picks a plot's representation by the size of its data: heatmaps keep their largest
+    levels, large scatters become 2-D histograms and large boxplots are drawn from
+    quantiles. Returns (kind, data); plots within the limits come back unchanged.
+    Applied before a plot is recorded or drawn, so deferred specs stay small too.
+    """
+    if kind == "small_multiples":
+        panels, panel_kind = data["panels"], data["panel_kind"]
+        if panel_kind == "scatter":
+            # The points of all panels count towards one limit
+            if sum(len(panel["x"]) for _, panel in panels) <= SCATTER_MAX_POINTS:
+                return kind, data
+            fitted = [(label, _fit_panel(panel_kind, panel, HIST2D_BINS // 2, max_points=0)) for label, panel in panels]
+        else:
+            # Panels are a fraction of a full figure, so heatmap panels keep fewer levels
+            fitted = [(label, _fit_panel(panel_kind, panel, max_levels=HEATMAP_MAX_LEVELS // 2))
+                      for label, panel in panels]
+        if fitted:
+            panel_kind = fitted[0][1][0]
+        return kind, dict(data, panel_kind=panel_kind, panels=[(label, panel) for label, (_, panel) in fitted])
+    if kind == "heatmap" and max(data["contingency"].shape) > HEATMAP_MAX_LEVELS:
+        data = dict(data, title=f"{data['title']} (largest {HEATMAP_MAX_LEVELS - 1} levels)")
+    return _fit_panel(kind, data)
+
+
+def draw_small_multiples(fig, panel_kind, panels, title, columns=SMALL_MULTIPLES_COLUMNS, **shared):
+    """
+    One figure with a grid of `panel_kind` plots, one per (label, panel data) in `panels`;
+    `shared` arguments (axis labels, column names) are passed to every panel.
+    """
+    rows = max(1, -(-len(panels) // columns))
+    cols = min(columns, max(1, len(panels)))
+    fig.set_size_inches(PANEL_SIZE[0] * cols, PANEL_SIZE[1] * rows)
+    # Shared y-axes make box and scatter panels comparable; heatmaps keep their own levels
+    sharey = panel_kind != "heatmap"
+    axes = fig.subplots(rows, cols, squeeze=False, sharey=sharey).ravel()
+    for ax, (label, data) in zip(axes, panels):
+        PLOT_KINDS[panel_kind](ax, title=str(label), **data, **shared)
+    for ax in axes[len(panels):]:
+        ax.set_axis_off()
+    fig.suptitle(title)
+
+
+# Kinds that lay out their own Axes on the figure
+FIGURE_KINDS = {
+    "small_multiples": draw_small_multiples,
+}
+
+
+def render_plot(kind, save_path, **data):
+    """
+    Draws a plot of the given kind and writes it to `save_path` immediately.
+    """
+    kind, data = fit_to_size(kind, data)
+    fig = Figure(figsize=FIGSIZE)
+    if kind in FIGURE_KINDS:
+        FIGURE_KINDS[kind](fig, **data)
+    else:
+        PLOT_KINDS[kind](fig.subplots(), **data)
+    save_figure(fig, save_path)
+    return save_path
+
+
+def defer_plot(kind, save_path, **data):
+    """
+    Records everything needed to draw a plot later, without touching matplotlib.
+    The spec lives on disk next to the target image so any worker process can render it.
+    """
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    kind, data = fit_to_size(kind, data)
+    spec = {"kind": kind, "save_path": save_path, "data": data}
+    spec_path = save_path + SPEC_SUFFIX
+    tmp_path = f"{spec_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(spec, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, spec_path)
+    # Drop any image from an earlier run so the report never shows a stale plot
+    try:
+        os.remove(save_path)
+    except FileNotFoundError:
+        pass
+    return save_path
+
+
+def render_spec_file(spec_path):
+    """
+    Claims a deferred plot's spec (an atomic rename, so no other process draws it too),
+    renders it and removes the spec. Raises FileNotFoundError if another worker already
+    claimed it (or the spec has failed for good, see `plot_error`).
+    """
+    claimed_path = spec_path + CLAIM_SUFFIX
+    os.rename(spec_path, claimed_path)
+    os.utime(claimed_path)  # the claim's mtime is when rendering started
+    try:
+        with open(claimed_path, "rb") as f:
+            spec = pickle.load(f)
+        render_plot(spec["kind"], spec["save_path"], **spec["data"])
+    except (MemoryError, OSError) as e:
+        # Possibly transient: the spec goes back for another try, up to PLOT_MAX_ATTEMPTS
+        give_up(claimed_path, spec_path, e)
+        raise
+    except Exception as e:
+        # Drawing the same spec again would fail the same way
+        give_up(claimed_path, spec_path, e, final=True)
+        raise
+    except BaseException:
+        # Interrupted, not the plot's fault: put the spec back so it can still be drawn
+        os.replace(claimed_path, spec_path)
+        raise
+    os.remove(claimed_path)
+    try:
+        os.remove(spec_path + FAILED_SUFFIX)
+    except FileNotFoundError:
+        pass
+    return spec["save_path"]
+
+
+def give_up(claimed_path, spec_path, error, final=False):
+    """
+    Records a failed render of a claimed spec. The spec is put back for another try
+    unless `final` or it has failed PLOT_MAX_ATTEMPTS times; then the claim is removed.
+    Returns True if the spec was dropped.
+    """
+    failed_path = spec_path + FAILED_SUFFIX
+    try:
+        with open(failed_path, "r", encoding="utf-8") as f:
+            attempts = json.load(f)["attempts"]
+    except (FileNotFoundError, ValueError, KeyError):
+        attempts = 0
+    attempts += 1
+    tmp_path = f"{failed_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"attempts": attempts, "error": f"{type(error).__name__}: {error}"}, f)
+    os.replace(tmp_path, failed_path)
+    dropped = final or attempts >= PLOT_MAX_ATTEMPTS
+    try:
+        if dropped:
+            os.remove(claimed_path)
+        else:
+            os.replace(claimed_path, spec_path)
+    except FileNotFoundError:
+        pass
+    if dropped:
+        print(f"Error rendering plot {spec_path[:-len(SPEC_SUFFIX)]}:\n   {type(error).__name__}: {error}")
+    return dropped
+
+
+def plot_error(plot_path):
+    """
+    The error of a plot whose spec failed for good, or None.
+    """
+    spec_path = plot_path + SPEC_SUFFIX
+    if os.path.exists(spec_path) or os.path.exists(spec_path + CLAIM_SUFFIX):
+        return None
+    try:
+        with open(spec_path + FAILED_SUFFIX, "r", encoding="utf-8") as f:
+            return json.load(f)["error"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def render_timed(spec_path):
+    """
+    `render_spec_file` returning (save_path, seconds), so a pool worker can hand its
+    render time back to the web process, whose /metrics never sees the worker's own.
+    """
+    start = time.perf_counter()
+    save_path = render_spec_file(spec_path)
+    return save_path, time.perf_counter() - start
+
+
+def _record_render(future):
+    # Done-callback for pool renders; a spec another process claimed first is not a render
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error is None:
+        record_stage("render_plot", future.result()[1])
+    elif not isinstance(error, (FileNotFoundError, BrokenProcessPool)):
+        inc("stage_errors_total", stage="render_plot")
+
+
+def _submit(executor, plot_paths):
+    futures = [executor.submit(render_timed, path + SPEC_SUFFIX) for path in plot_paths]
+    for future in futures:
+        future.add_done_callback(_record_render)
+    return futures
+
+
+def plot_workers():
+    """
+    Size of this process's render pool: STATS_COURT_PLOT_WORKERS if set, otherwise the
+    cores shared out between the web workers (STATS_COURT_WEB_WORKERS, which
+    gunicorn.conf.py sets for each worker), so N web workers don't start N x cores renderers.
+    """
+    configured = os.environ.get("STATS_COURT_PLOT_WORKERS")
+    if configured:
+        return max(1, int(configured))
+    web_workers = max(1, int(os.environ.get("STATS_COURT_WEB_WORKERS", 1)))
+    return max(1, (os.cpu_count() or 1) // web_workers)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            return _executor
+        _executor = ProcessPoolExecutor(max_workers=plot_workers(),
+                                        mp_context=process_context(["src.plot_renderer"]))
+        return _executor
+
+
+def reset_executor(broken):
+    """
+    Drops the pool if it is still `broken`, so the next get_executor() starts a new one.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is broken:
+            _executor = None
+    broken.shutdown(wait=False)
+
+
+def render_deferred(plot_paths, wait=False):
+    """
+    Renders deferred plots in a process pool (one task per plot, see `plot_workers`).
+    Returns the futures; pass wait=True to block until every image is written.
+    A pool broken by a dead worker is replaced once; plots it never finished are
+    rendered in this process when waiting, otherwise by ensure_plot when requested.
+    """
+    executor = get_executor()
+    try:
+        futures = _submit(executor, plot_paths)
+    except BrokenProcessPool:
+        reset_executor(executor)
+        executor = get_executor()
+        futures = _submit(executor, plot_paths)
+    if wait:
+        for path, future in zip(plot_paths, futures):
+            try:
+                future.result()
+            except FileNotFoundError:
+                pass
+            except BrokenProcessPool:
+                reset_executor(executor)
+                ensure_plot(path)
+    return futures
+
+
+def ensure_plot(plot_path, timeout=PLOT_WAIT_SECONDS):
+    """
+    Makes sure the image at `plot_path` exists, rendering its deferred spec
+    in the current process if the pool has not reached it yet, or waiting up to
+    `timeout` seconds if another process is rendering it. A claim older than `timeout`
+    (left by a worker that died) is taken over, and counts as a failed attempt.
+    Returns True if the image is available; False if it is not (yet), or if its
+    spec failed (see `plot_error`).
+    """
+    if os.path.exists(plot_path):
+        return True
+    spec_path = plot_path + SPEC_SUFFIX
+    claimed_path = spec_path + CLAIM_SUFFIX
+    try:
+        record_stage("render_plot", render_timed(spec_path)[1])
+    except FileNotFoundError:
+        deadline = time.monotonic() + timeout
+        while not os.path.exists(plot_path) and time.monotonic() < deadline:
+            try:
+                stale = time.time() - os.path.getmtime(claimed_path) > timeout
+            except FileNotFoundError:
+                break
+            if stale:
+                try:
+                    if not give_up(claimed_path, spec_path, RuntimeError("The process rendering it stopped")):
+                        record_stage("render_plot", render_timed(spec_path)[1])
+                except FileNotFoundError:
+                    pass
+                except Exception:
+                    inc("stage_errors_total", stage="render_plot")
+                break
+            time.sleep(0.05)
+    except Exception:
+        inc("stage_errors_total", stage="render_plot")
+    return os.path.exists(plot_path)
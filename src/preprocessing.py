@@ -0,0 +1,334 @@
+"""
+Preprocessing pipeline: missing-value imputation and categorical encoding with a
+fit/transform split.
+
+A Preprocessor learns its fill values and category levels once (`fit`) and applies
+exactly those to any dataset with the same columns (`transform`), so a training set
+and later datasets get identical encodings. Fitting and transforming both work on a
+DataFrame or on a stream of chunks (see `preprocess_csv`), and the fitted state saves
+to JSON for reuse in another process.
+"""
+import os
+import json
+import threading
+
+import numpy as np
+import pandas as pd
+
+from src.column_profile import column_kind
+
+NUMERIC_STRATEGIES = ("median", "mean", "zero", "drop", "keep")
+CATEGORICAL_STRATEGIES = ("mode", "missing", "drop", "keep")
+OTHER_STRATEGIES = ("keep", "drop")
+ENCODINGS = ("onehot", "codes", "none")
+# Label used for missing categories with the "missing" strategy
+MISSING_LABEL = "missing"
+# One-hot blocks with more columns than this are stored sparse (with sparse="auto")
+SPARSE_MIN_LEVELS = 32
+# Values per column kept to estimate the median when fitting on chunks
+MEDIAN_SAMPLE_SIZE = 100_000
+
+
+def _plain(value):
+    # numpy scalars -> Python values for JSON
+    return value.item() if hasattr(value, "item") else value
+
+
+def _sorted_levels(levels):
+    # Same order as pd.get_dummies; mixed types fall back to their text
+    try:
+        return sorted(levels)
+    except TypeError:
+        return sorted(levels, key=str)
+
+
+class _FitState:
+    """
+    Mergeable per-chunk statistics: counts, sums, a uniform sample per numeric column
+    (for the median) and value counts per categorical column.
+    """
+
+    def __init__(self, numeric_cols, categorical_cols, seed):
+        self.numeric_cols = numeric_cols
+        self.categorical_cols = categorical_cols
+        self.rng = np.random.default_rng(seed)
+        self.count = np.zeros(len(numeric_cols))
+        self.total = np.zeros(len(numeric_cols))
+        self.sample = [np.empty(0) for _ in numeric_cols]
+        self.sample_keys = [np.empty(0) for _ in numeric_cols]
+        self.nulls = {col: 0 for col in categorical_cols}
+        self.counts = {col: None for col in categorical_cols}
+
+    def update(self, chunk):
+        X = chunk[self.numeric_cols].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = ~np.isnan(X)
+        self.count += valid.sum(axis=0)
+        self.total += np.where(valid, X, 0.0).sum(axis=0)
+        for j in range(len(self.numeric_cols)):
+            # Reservoir by random keys: the sample keeps the values with the smallest keys,
+            # which is a uniform sample of everything seen so far
+            values = X[valid[:, j], j]
+            keys = np.concatenate([self.sample_keys[j], self.rng.random(len(values))])
+            values = np.concatenate([self.sample[j], values])
+            if len(values) > MEDIAN_SAMPLE_SIZE:
+                keep = np.argpartition(keys, MEDIAN_SAMPLE_SIZE)[:MEDIAN_SAMPLE_SIZE]
+                keys, values = keys[keep], values[keep]
+            self.sample[j], self.sample_keys[j] = values, keys
+        for col in self.categorical_cols:
+            s = chunk[col]
+            self.nulls[col] += int(s.isna().sum())
+            counts = s.value_counts(dropna=True)
+            counts.index = counts.index.astype(object)
+            previous = self.counts[col]
+            self.counts[col] = counts if previous is None else previous.add(counts, fill_value=0)
+
+
+class Preprocessor:
+    """
+    Imputes missing values and encodes categorical columns with settings fitted once.
+
+    `numeric`: "median", "mean", "zero", "drop" (drop the row) or "keep" (leave NaN).
+    `categorical`: "mode", "missing" (a separate "missing" level), "drop" or "keep".
+    `encoding`: "onehot" (one bool column per level, named "<col>_<level>" like
+    pd.get_dummies, optionally without the first level), "codes" (one integer column,
+    -1 for missing or unseen) or "none" (values kept as they are).
+    `sparse`: True, False or "auto" (sparse one-hot blocks above SPARSE_MIN_LEVELS columns).
+    `max_levels` keeps only the most frequent levels per column; the others are
+    encoded like unseen values.
+    Other columns (booleans, dates) pass through unchanged; `other`: "keep" leaves
+    their missing values, "drop" drops those rows.
+    """
+
+    def __init__(self, numeric="median", categorical="mode", encoding="onehot", drop_first=False,
+                 sparse="auto", max_levels=None, seed=0, other="keep"):
+        if numeric not in NUMERIC_STRATEGIES:
+            raise ValueError(f"Unknown numeric strategy '{numeric}' (use one of {', '.join(NUMERIC_STRATEGIES)})")
+        if categorical not in CATEGORICAL_STRATEGIES:
+            raise ValueError(f"Unknown categorical strategy '{categorical}' "
+                             f"(use one of {', '.join(CATEGORICAL_STRATEGIES)})")
+        if encoding not in ENCODINGS:
+            raise ValueError(f"Unknown encoding '{encoding}' (use one of {', '.join(ENCODINGS)})")
+        if other not in OTHER_STRATEGIES:
+            raise ValueError(f"Unknown strategy '{other}' for other columns (use one of {', '.join(OTHER_STRATEGIES)})")
+        self.numeric = numeric
+        self.categorical = categorical
+        self.encoding = encoding
+        self.drop_first = drop_first
+        self.sparse = sparse
+        self.max_levels = max_levels
+        self.seed = seed
+        self.other = other
+        self.numeric_cols = None
+        self.categorical_cols = None
+        self.fill = None
+        self.levels = None
+
+    @property
+    def fitted(self):
+        return self.levels is not None
+
+    def fit(self, data):
+        """
+        Learns fill values and category levels from a DataFrame or an iterable of
+        DataFrame chunks. On a DataFrame the median is exact; on chunks it is taken from
+        a uniform sample of MEDIAN_SAMPLE_SIZE values per column.
+        """
+        if isinstance(data, pd.DataFrame):
+            self._set_columns(data)
+            data = self._drop_incomplete(data)
+            num = data[self.numeric_cols]
+            if self.numeric == "median":
+                fill = num.median()
+            elif self.numeric == "mean":
+                fill = num.mean()
+            else:
+                fill = pd.Series(0.0, index=self.numeric_cols)
+            state = _FitState([], self.categorical_cols, self.seed)
+            state.update(data)
+        else:
+            state = None
+            for chunk in data:
+                if state is None:
+                    self._set_columns(chunk)
+                    state = _FitState(self.numeric_cols, self.categorical_cols, self.seed)
+                state.update(self._drop_incomplete(chunk))
+            if state is None:
+                raise ValueError("No data to fit on")
+            with np.errstate(invalid="ignore", divide="ignore"):
+                if self.numeric == "median":
+                    values = [np.median(s) if len(s) else np.nan for s in state.sample]
+                elif self.numeric == "mean":
+                    values = state.total / state.count
+                else:
+                    values = np.zeros(len(self.numeric_cols))
+            fill = pd.Series(values, index=self.numeric_cols, dtype=np.float64)
+        self.fill = {}
+        if self.numeric in ("median", "mean", "zero"):
+            self.fill.update({col: _plain(value) for col, value in fill.items() if pd.notna(value)})
+        self.levels = {}
+        for col in self.categorical_cols:
+            counts = state.counts[col]
+            if counts is None:
+                counts = pd.Series(dtype=np.float64)
+            counts = counts[counts > 0]
+            if self.max_levels is not None and len(counts) > self.max_levels:
+                counts = counts.sort_values(ascending=False, kind="stable").iloc[:self.max_levels]
+            levels = _sorted_levels([_plain(level) for level in counts.index])
+            if self.categorical == "mode" and len(counts):
+                top = counts[counts == counts.max()].index
+                self.fill[col] = _sorted_levels([_plain(level) for level in top])[0]
+            elif self.categorical == "missing" and state.nulls[col]:
+                self.fill[col] = MISSING_LABEL
+                if MISSING_LABEL not in levels:
+                    levels.append(MISSING_LABEL)
+            self.levels[col] = levels
+        return self
+
+    def _set_columns(self, df):
+        kinds = {col: column_kind(df[col].dtype) for col in df.columns}
+        self.numeric_cols = [col for col, kind in kinds.items() if kind == "numeric"]
+        self.categorical_cols = [col for col, kind in kinds.items() if kind == "categorical"]
+
+    def _drop_incomplete(self, df):
+        # Rows missing a value in a column with the "drop" strategy (fitting skips them too)
+        drop = (self.numeric_cols if self.numeric == "drop" else []) + \
+               (self.categorical_cols if self.categorical == "drop" else [])
+        if self.other == "drop":
+            encoded = set(self.numeric_cols) | set(self.categorical_cols)
+            drop += [col for col in df.columns if col not in encoded]
+        drop = [col for col in drop if col in df.columns]
+        return df.dropna(subset=drop) if drop else df
+
+    def transform(self, df):
+        """
+        Applies the fitted imputation and encoding to `df`. Non-categorical columns keep
+        their order and the encoded columns follow them, as with pd.get_dummies.
+        """
+        if not self.fitted:
+            raise ValueError("Preprocessor is not fitted; call fit() first")
+        df = self._drop_incomplete(df)
+        # All numeric fills in one call; categorical fills happen on the codes below
+        numeric_fill = {col: value for col, value in self.fill.items()
+                        if col in self.numeric_cols and col in df.columns}
+        if numeric_fill:
+            df = df.fillna(numeric_fill)
+
+        encoded_cols = [col for col in self.categorical_cols if col in df.columns]
+        if self.encoding == "none":
+            for col in encoded_cols:
+                if col in self.fill:
+                    s = df[col]
+                    if isinstance(s.dtype, pd.CategoricalDtype) and self.fill[col] not in s.cat.categories:
+                        s = s.cat.add_categories([self.fill[col]])
+                    df = df.assign(**{col: s.fillna(self.fill[col])})
+            return df
+
+        parts = [df[[col for col in df.columns if col not in encoded_cols]]]
+        for col in encoded_cols:
+            codes = self.codes(df[col])
+            if self.encoding == "codes":
+                parts.append(pd.DataFrame({col: codes}, index=df.index))
+            else:
+                parts.append(self._one_hot(col, codes, df.index))
+        return pd.concat(parts, axis=1)
+
+    def codes(self, s):
+        """
+        Integer codes of a categorical Series under the fitted levels (the smallest
+        integer type that fits); missing values take the fill level's code, and
+        unseen or unfilled values are -1.
+        """
+        levels = self.levels[s.name]
+        # Unseen values become missing first; pandas no longer accepts them in the constructor
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            codes = s.cat.set_categories(levels).cat.codes.to_numpy()
+        else:
+            codes = pd.Categorical(s.where(s.isin(levels)), categories=levels).codes
+        fill = self.fill.get(s.name)
+        if fill is not None:
+            missing = s.isna().to_numpy()
+            if missing.any():
+                codes = codes.copy()
+                codes[missing] = levels.index(fill)
+        return codes
+
+    def _one_hot(self, col, codes, index):
+        levels = self.levels[col]
+        start = 1 if self.drop_first else 0
+        names = [f"{col}_{level}" for level in levels[start:]]
+        k = len(names)
+        rows = np.flatnonzero(codes >= start)
+        cols = codes[rows].astype(np.intp) - start
+        sparse = self.sparse if self.sparse != "auto" else k > SPARSE_MIN_LEVELS
+        if sparse:
+            # Imported here so that importing the app does not load scipy
+            import scipy.sparse as sp
+            # Only the set cells are stored: n values instead of n * k
+            matrix = sp.csc_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(len(codes), k))
+            block = pd.DataFrame.sparse.from_spmatrix(matrix, index=index, columns=names)
+            return block.astype(pd.SparseDtype(bool, False))
+        dense = np.zeros((len(codes), k), dtype=bool)
+        dense[rows, cols] = True
+        return pd.DataFrame(dense, index=index, columns=names)
+
+    def fit_transform(self, df):
+        return self.fit(df).transform(df)
+
+    def transform_chunks(self, chunks):
+        """
+        Transforms an iterable of DataFrame chunks lazily, one chunk at a time.
+        """
+        for chunk in chunks:
+            yield self.transform(chunk)
+
+    def to_dict(self):
+        return {
+            "settings": {"numeric": self.numeric, "categorical": self.categorical, "encoding": self.encoding,
+                         "drop_first": self.drop_first, "sparse": self.sparse, "max_levels": self.max_levels,
+                         "seed": self.seed, "other": self.other},
+            "numeric_cols": self.numeric_cols,
+            "categorical_cols": self.categorical_cols,
+            "fill": self.fill,
+            "levels": self.levels,
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        preprocessor = cls(**state["settings"])
+        preprocessor.numeric_cols = state["numeric_cols"]
+        preprocessor.categorical_cols = state["categorical_cols"]
+        preprocessor.fill = state["fill"]
+        preprocessor.levels = state["levels"]
+        return preprocessor
+
+    def save(self, path):
+        """
+        Writes the settings and fitted state to a JSON file.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, default=_plain)
+        os.replace(tmp_path, path)
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+def preprocess_csv(path, preprocessor=None, chunksize=100_000):
+    """
+    Preprocesses a CSV without loading its text at once: an unfitted preprocessor is
+    fitted on a first streaming pass, then every chunk is transformed as it is read.
+    Only the encoded result (integer codes or sparse one-hot columns for wide
+    categoricals) is held in memory. Returns (df, preprocessor).
+    """
+    preprocessor = preprocessor or Preprocessor()
+    if not preprocessor.fitted:
+        preprocessor.fit(pd.read_csv(path, chunksize=chunksize))
+    parts = list(preprocessor.transform_chunks(pd.read_csv(path, chunksize=chunksize)))
+    df = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame()
+    print(f"🧹 Preprocessed {len(df)} rows in chunks of {chunksize}")
+    return df, preprocessor
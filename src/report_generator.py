@@ -1,5 +1,8 @@
 import os
 import html
+import threading
+from dataclasses import dataclass, field
+from src.metrics import instrument, timed
 
 # Get project root
 try:
@@ -9,11 +12,7 @@ except NameError:
 
 REPORT_PATH = os.path.join(BASE_DIR, "results", "report.html")
 
-def initialize_report_html(file_path=REPORT_PATH):
-    """
-    Initializes a new HTML report file with header and styles.
-    """
-    html_header = """
+HTML_HEADER = """
     <html>
     <head>
         <title>Stats Court Report</title>
@@ -97,82 +96,209 @@ def initialize_report_html(file_path=REPORT_PATH):
     <body>
         <div class="header">Stats Court Report</div>
     """
+
+def initialize_report_html(file_path=REPORT_PATH):
+    """
+    Initializes a new HTML report file with header and styles.
+    """
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
     with open(file_path, "w", encoding="utf-8") as f:
-        f.write(html_header)
+        f.write(HTML_HEADER)
     print(f"Initialized new report at: {file_path}")
 
-def append_to_report_html(
-    hypothesis,
-    test_name,
-    stat,
-    p_value,
-    conclusion,
-    interpretation,
-    plot_path=None,
-    file_path=REPORT_PATH
-):
+def fmt(value):
+    return f"{value:.4f}" if isinstance(value, (float, int)) else str(value)
+
+@dataclass
+class TestResult:
     """
-    Appends a test result block to the HTML report.
+    One test's outcome, independent of how it is rendered.
+    `details` holds extra labelled values shown in the result block and `table`
+    optional rows (dicts keyed by column) shown as a table under them, limited to
+    `table_columns` when given.
     """
-    def fmt(value):
-        return f"{value:.4f}" if isinstance(value, (float, int)) else str(value)
-
-    # Escape HTML for safety
-    hypothesis = html.escape(hypothesis)
-    test_name = html.escape(test_name)
-    conclusion = html.escape(conclusion)
-    interpretation = html.escape(interpretation)
+    hypothesis: str
+    test_name: str
+    stat: object
+    p_value: object
+    conclusion: str
+    interpretation: str
+    plot_path: str = None
+    details: dict = field(default_factory=dict)
+    table: list = None
+    table_columns: list = None
 
+def render_result_block(result, plot_prefix="/plots/"):
+    """
+    Renders a TestResult as an HTML report block; the image links to `plot_prefix` + file name.
+    """
     html_block = f"""
     <div class="report-block">
-        <p><span class="label">Hypothesis:</span> <strong>{hypothesis}</strong></p>
-        <p><span class="label">Test Used:</span> {test_name}</p>
-        <p><span class="label">Test Statistic:</span> {fmt(stat)}</p>
-        <p><span class="label">p-value:</span> {fmt(p_value)}</p>
-        <p><span class="label">Conclusion:</span> <strong>{conclusion}</strong></p>
-        <p><span class="label">Interpretation:</span> {interpretation}</p>
+        <p><span class="label">Hypothesis:</span> <strong>{html.escape(result.hypothesis)}</strong></p>
+        <p><span class="label">Test Used:</span> {html.escape(result.test_name)}</p>
+        <p><span class="label">Test Statistic:</span> {html.escape(fmt(result.stat))}</p>
+        <p><span class="label">p-value:</span> {html.escape(fmt(result.p_value))}</p>
+        <p><span class="label">Conclusion:</span> <strong>{html.escape(result.conclusion)}</strong></p>
+        <p><span class="label">Interpretation:</span> {html.escape(result.interpretation)}</p>
     """
+    for label, value in result.details.items():
+        html_block += f"""    <p><span class="label">{html.escape(label)}:</span> {html.escape(fmt(value))}</p>
+    """
+
+    if result.table:
+        html_block += render_block_table(result.table, result.table_columns)
 
-    if plot_path:
-        filename = os.path.basename(plot_path)
+    if result.plot_path:
+        filename = os.path.basename(result.plot_path)
         html_block += f"""
-        <img src="/plots/{filename}" alt="plot" />
+        <img src="{html.escape(plot_prefix + filename)}" alt="plot" />
         """
 
     html_block += "</div>\n"
+    return html_block
 
-    with open(file_path, "a", encoding="utf-8") as f:
-        f.write(html_block)
-
-    print("📎 Appended new test with plot to report.")
+def render_block_table(rows, columns=None):
+    """
+    Renders a result block's table (e.g. one row per segment); the columns default
+    to the keys of the first row.
+    """
+    columns = columns or list(rows[0])
+    table_html = "<table>\n<tr>" + "".join(f"<th>{html.escape(str(c))}</th>" for c in columns) + "</tr>\n"
+    for row in rows:
+        cells = []
+        for column in columns:
+            value = row.get(column)
+            if value is None:
+                cells.append("-")
+            elif isinstance(value, float):
+                cells.append(fmt(value))
+            elif isinstance(value, int):
+                cells.append(f"{value:,}")
+            else:
+                cells.append(str(value))
+        table_html += "<tr>" + "".join(f"<td>{html.escape(cell)}</td>" for cell in cells) + "</tr>\n"
+    return table_html + "</table>\n"
 
-def insert_summary_table(test_summaries, file_path=REPORT_PATH):
+def render_summary_table(test_summaries):
     """
-    Inserts a summary table at the top of the HTML report (after <body>).
-    Optionally closes the HTML document.
+    Renders the summary rows as an HTML table.
     """
-    table_html = """
+    # Screening runs add an adjusted p-value column; single tests add effect size and power
+    show_adjusted = any("Adjusted p-value" in test for test in test_summaries)
+    show_effects = any("Effect size" in test for test in test_summaries)
+    table_html = f"""
     <h2>Summary of Tests</h2>
     <table>
         <tr>
             <th>Hypothesis</th>
             <th>Test</th>
             <th>p-value</th>
+            {"<th>Adjusted p-value</th>" if show_adjusted else ""}
+            {"<th>Effect size</th><th>Power</th><th>Rows for 80% power</th>" if show_effects else ""}
             <th>Verdict</th>
         </tr>
     """
     for test in test_summaries:
         p_val = f"{test['p-value']:.4f}" if isinstance(test['p-value'], (float, int)) else "-"
+        adjusted = ""
+        if show_adjusted:
+            q_val = test.get("Adjusted p-value")
+            adjusted = f"<td>{q_val:.4f}</td>" if isinstance(q_val, (float, int)) else "<td>-</td>"
+        effects = ""
+        if show_effects:
+            power, rows = test.get("Power"), test.get("Rows needed")
+            effects = (f"<td>{html.escape(str(test.get('Effect size', '-')))}</td>"
+                       f"<td>{f'{power:.3f}' if isinstance(power, float) else '-'}</td>"
+                       f"<td>{f'{rows:,}' if isinstance(rows, int) else '-'}</td>")
         table_html += f"""
         <tr>
             <td>{html.escape(str(test['Hypothesis']))}</td>
             <td>{html.escape(str(test['Test']))}</td>
             <td>{p_val}</td>
+            {adjusted}
+            {effects}
             <td><strong>{html.escape(str(test['Verdict']))}</strong></td>
         </tr>
         """
     table_html += "</table><hr/>"
+    return table_html
+
+def write_atomic(file_path, content):
+    """
+    Writes `content` to a temporary file and moves it into place, so readers
+    only ever see a complete report.
+    """
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    tmp_path = f"{file_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, file_path)
+
+class ReportBuilder:
+    """
+    Collects test results and summary rows in memory and writes the whole
+    report in one pass with `write()`.
+    """
+
+    def __init__(self, file_path=REPORT_PATH, plot_prefix="/plots/"):
+        self.file_path = file_path
+        self.plot_prefix = plot_prefix
+        self.results = []
+        self.summaries = []
+
+    def add_result(self, result, summary=None):
+        self.results.append(result)
+        if summary is not None:
+            summary.setdefault("Statistic", result.stat)
+            self.summaries.append(summary)
+
+    def add_summary(self, summary):
+        self.summaries.append(summary)
+
+    def render(self):
+        # The summary table goes right after <body>, above the result blocks
+        parts = [HTML_HEADER.replace("<body>", "<body>\n" + render_summary_table(self.summaries), 1)]
+        parts.extend(render_result_block(result, self.plot_prefix) for result in self.results)
+        parts.append("\n</body>\n</html>")
+        return "".join(parts)
+
+    def write(self):
+        with timed("report_write", results=len(self.results)):
+            write_atomic(self.file_path, self.render())
+        print(f"📝 Report with {len(self.results)} results written to: {self.file_path}")
+        return self.file_path
+
+@instrument("report_append")
+def append_to_report_html(
+    hypothesis,
+    test_name,
+    stat,
+    p_value,
+    conclusion,
+    interpretation,
+    plot_path=None,
+    file_path=REPORT_PATH
+):
+    """
+    Appends a test result block to the HTML report.
+    Prefer ReportBuilder when writing many blocks.
+    """
+    html_block = render_result_block(TestResult(
+        hypothesis, test_name, stat, p_value, conclusion, interpretation, plot_path
+    ))
+
+    with open(file_path, "a", encoding="utf-8") as f:
+        f.write(html_block)
+
+    print("📎 Appended new test with plot to report.")
+
+@instrument("report_summary")
+def insert_summary_table(test_summaries, file_path=REPORT_PATH):
+    """
+    Inserts a summary table at the top of the HTML report (after <body>).
+    Optionally closes the HTML document.
+    """
+    table_html = render_summary_table(test_summaries)
 
     # Inject summary after <body>
     try:
@@ -194,5 +320,3 @@ def insert_summary_table(test_summaries, file_path=REPORT_PATH):
         f.write(updated_content)
 
     print("Summary table added to top of report.")
-
-
@@ -0,0 +1,228 @@
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.stats import rankdata
+
+from src.batch_tests import welch_from_moments, chi2_statistic
+from src.utils import process_context
+
+# Upper bound on the size of one chunk of resampled index/value matrices
+RESAMPLE_MEMORY_BYTES = int(os.environ.get("STATS_COURT_RESAMPLE_MB", 64)) * 1024 * 1024
+
+
+# ---- Data preparation ----
+
+def prepare_data(kind, df, col1, col2, profile=None):
+    """
+    Extracts the arrays a resampled statistic needs, dropping missing values once.
+    kind is "welch_t" (col1 = group, col2 = target), "pearson", "spearman" or "chi2".
+    """
+    if kind == "welch_t":
+        if profile is not None and col1 in profile.codes:
+            codes = profile.codes[col1]
+        else:
+            codes = pd.factorize(df[col1])[0]
+        y = df[col2].to_numpy(dtype=np.float64, na_value=np.nan)
+        present = ~np.isnan(y)
+        return {"y1": y[(codes == 0) & present], "y2": y[(codes == 1) & present]}
+    if kind in ("pearson", "spearman"):
+        x = df[col1].to_numpy(dtype=np.float64, na_value=np.nan)
+        y = df[col2].to_numpy(dtype=np.float64, na_value=np.nan)
+        valid = ~np.isnan(x) & ~np.isnan(y)
+        x, y = x[valid], y[valid]
+        if kind == "spearman":
+            # Rank once; every resample then only needs a Pearson on ranks
+            x, y = rankdata(x), rankdata(y)
+        return {"x": x, "y": y}
+    if kind == "chi2":
+        encoded = profile.encoded(df, [col1, col2]) if profile is not None else None
+        a = encoded[col1][0] if encoded else pd.factorize(df[col1])[0]
+        b = encoded[col2][0] if encoded else pd.factorize(df[col2])[0]
+        valid = (a >= 0) & (b >= 0)
+        # Re-code so only categories that occur remain (expected counts stay positive)
+        a, b = np.unique(a[valid], return_inverse=True)[1], np.unique(b[valid], return_inverse=True)[1]
+        return {"a": a.astype(np.int64), "b": b.astype(np.int64), "k1": int(a.max()) + 1, "k2": int(b.max()) + 1}
+    raise ValueError(f"Unknown resampling statistic '{kind}'")
+
+
+# ---- Statistics on batches of resamples (one row per resample) ----
+
+def _welch_rows(v1, v2):
+    n1, n2 = v1.shape[1], v2.shape[1]
+    m1, m2 = v1.mean(axis=1), v2.mean(axis=1)
+    var1 = ((v1 - m1[:, None]) ** 2).sum(axis=1) / (n1 - 1)
+    var2 = ((v2 - m2[:, None]) ** 2).sum(axis=1) / (n2 - 1)
+    return welch_from_moments(n1, m1, var1, n2, m2, var2)[0]
+
+
+def _pearson_rows(xb, yb):
+    xc = xb - xb.mean(axis=1, keepdims=True)
+    yc = yb - yb.mean(axis=1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (xc * yc).sum(axis=1) / np.sqrt((xc * xc).sum(axis=1) * (yc * yc).sum(axis=1))
+
+
+def _chi2_rows(a, b_rows, k1, k2):
+    # Offset each resample's cells so one bincount builds every contingency table
+    rows = b_rows.shape[0]
+    flat = (np.arange(rows)[:, None] * (k1 * k2) + a * k2 + b_rows).ravel()
+    tables = np.bincount(flat, minlength=rows * k1 * k2).reshape(rows, k1, k2).astype(np.float64)
+    n = tables.sum(axis=(1, 2))
+    expected = tables.sum(axis=2)[:, :, None] * tables.sum(axis=1)[:, None, :] / n[:, None, None]
+    if (k1 - 1) * (k2 - 1) == 1:
+        diff = expected - tables
+        tables = tables + np.sign(diff) * np.minimum(0.5, np.abs(diff))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = np.where(expected > 0, (tables - expected) ** 2 / expected, 0.0)
+    return terms.sum(axis=(1, 2))
+
+
+def _permutation_chunk(kind, data, rows, rng):
+    if kind == "welch_t":
+        y1, y2 = data["y1"], data["y2"]
+        pooled = np.concatenate([y1, y2])
+        idx = rng.permuted(np.tile(np.arange(len(pooled), dtype=np.int32), (rows, 1)), axis=1)
+        values = pooled[idx]
+        return _welch_rows(values[:, :len(y1)], values[:, len(y1):])
+    if kind in ("pearson", "spearman"):
+        x, y = data["x"], data["y"]
+        idx = rng.permuted(np.tile(np.arange(len(y), dtype=np.int32), (rows, 1)), axis=1)
+        return _pearson_rows(np.broadcast_to(x, idx.shape), y[idx])
+    if kind == "chi2":
+        a, b = data["a"], data["b"]
+        b_rows = rng.permuted(np.tile(b, (rows, 1)), axis=1)
+        return _chi2_rows(a, b_rows, data["k1"], data["k2"])
+    raise ValueError(f"Unknown resampling statistic '{kind}'")
+
+
+def _bootstrap_chunk(kind, data, rows, rng):
+    if kind == "welch_t":
+        y1, y2 = data["y1"], data["y2"]
+        # Resample within each group so group sizes stay fixed
+        v1 = y1[rng.integers(0, len(y1), (rows, len(y1)), dtype=np.int32)]
+        v2 = y2[rng.integers(0, len(y2), (rows, len(y2)), dtype=np.int32)]
+        return _welch_rows(v1, v2)
+    if kind in ("pearson", "spearman"):
+        x, y = data["x"], data["y"]
+        idx = rng.integers(0, len(x), (rows, len(x)), dtype=np.int32)
+        xb, yb = x[idx], y[idx]
+        if kind == "spearman":
+            xb, yb = rankdata(xb, axis=1), rankdata(yb, axis=1)
+        return _pearson_rows(xb, yb)
+    if kind == "chi2":
+        a, b = data["a"], data["b"]
+        idx = rng.integers(0, len(a), (rows, len(a)), dtype=np.int32)
+        return _chi2_rows(a[idx], b[idx], data["k1"], data["k2"])
+    raise ValueError(f"Unknown resampling statistic '{kind}'")
+
+
+def _row_bytes(kind, data):
+    n = len(data.get("y1", [])) + len(data.get("y2", [])) + len(data.get("x", [])) + len(data.get("a", []))
+    # index matrix plus one or two gathered value matrices per row
+    return max(1, n) * 28
+
+
+def _resample_serial(kind, mode, data, n_resamples, seed, chunk_size):
+    rng = np.random.default_rng(seed)
+    chunk_fn = _permutation_chunk if mode == "permutation" else _bootstrap_chunk
+    if chunk_size is None:
+        chunk_size = max(1, RESAMPLE_MEMORY_BYTES // _row_bytes(kind, data))
+    out = np.empty(n_resamples)
+    done = 0
+    while done < n_resamples:
+        rows = min(chunk_size, n_resamples - done)
+        out[done:done + rows] = chunk_fn(kind, data, rows, rng)
+        done += rows
+    return out
+
+
+def resample(kind, mode, data, n_resamples, seed=None, chunk_size=None, n_jobs=1):
+    """
+    Draws `n_resamples` permutation or bootstrap replicates of a statistic.
+
+    Resamples are generated as batched index matrices of `chunk_size` rows
+    (sized from STATS_COURT_RESAMPLE_MB by default) and evaluated with NumPy,
+    so memory stays bounded. With `n_jobs > 1` the replicates are split across a
+    process pool, each worker with an independent stream spawned from `seed`.
+    """
+    if n_jobs is None or n_jobs <= 1:
+        return _resample_serial(kind, mode, data, n_resamples, seed, chunk_size)
+    seeds = np.random.SeedSequence(seed).spawn(n_jobs)
+    sizes = [n_resamples // n_jobs + (1 if i < n_resamples % n_jobs else 0) for i in range(n_jobs)]
+    # Runs from job threads of the web process, so its workers are not forked from it
+    with ProcessPoolExecutor(max_workers=n_jobs, mp_context=process_context(["src.resampling"])) as executor:
+        parts = executor.map(_resample_serial, [kind] * n_jobs, [mode] * n_jobs, [data] * n_jobs,
+                             sizes, seeds, [chunk_size] * n_jobs)
+        return np.concatenate(list(parts))
+
+
+def observed_statistic(kind, data):
+    if kind == "welch_t":
+        return float(_welch_rows(data["y1"][None, :], data["y2"][None, :])[0])
+    if kind in ("pearson", "spearman"):
+        return float(_pearson_rows(data["x"][None, :], data["y"][None, :])[0])
+    table = np.bincount(data["a"] * data["k2"] + data["b"], minlength=data["k1"] * data["k2"])
+    return chi2_statistic(table.reshape(data["k1"], data["k2"]))[0]
+
+
+def permutation_pvalue(kind, data, n_resamples=10000, **options):
+    """
+    Monte Carlo permutation p-value, (hits + 1) / (n_resamples + 1).
+    Two-sided for t and r, upper tail for chi-square.
+    """
+    observed = observed_statistic(kind, data)
+    null = resample(kind, "permutation", data, n_resamples, **options)
+    if kind == "chi2":
+        hits = np.count_nonzero(null >= observed - 1e-12)
+    else:
+        hits = np.count_nonzero(np.abs(null) >= abs(observed) - 1e-12)
+    return float((hits + 1) / (n_resamples + 1))
+
+
+def bootstrap_ci(kind, data, n_resamples=2000, confidence=0.95, **options):
+    """
+    Percentile bootstrap confidence interval for the statistic.
+    """
+    replicates = resample(kind, "bootstrap", data, n_resamples, **options)
+    tail = (1 - confidence) / 2 * 100
+    low, high = np.nanpercentile(replicates, [tail, 100 - tail])
+    return float(low), float(high)
+
+
+# ---- Config integration ----
+
+RESAMPLING_KEYS = ("permutations", "bootstrap")
+
+
+def resampling_details(df, test, profile=None):
+    """
+    Permutation p-value and bootstrap CI requested by a test config, as report details.
+    Config keys: "permutations", "bootstrap" (resample counts), "seed",
+    "chunk_size", "n_jobs" and "confidence".
+    """
+    if not any(test.get(key) for key in RESAMPLING_KEYS):
+        return {}
+    test_type = test.get("type")
+    if test_type == "chi2":
+        kind, col1, col2, label = "chi2", test["col1"], test["col2"], "chi-square"
+    elif test_type == "ttest":
+        kind, col1, col2, label = "welch_t", test["cat"], test["num"], "t"
+    elif test_type == "correlation":
+        kind = test.get("method", "pearson")
+        col1, col2, label = test["col1"], test["col2"], "r"
+    else:
+        return {}
+
+    data = prepare_data(kind, df, col1, col2, profile)
+    options = {"seed": test.get("seed"), "chunk_size": test.get("chunk_size"), "n_jobs": test.get("n_jobs", 1)}
+    details = {}
+    if test.get("permutations"):
+        n = int(test["permutations"])
+        details[f"Permutation p-value ({n} resamples)"] = permutation_pvalue(kind, data, n, **options)
+    if test.get("bootstrap"):
+        n = int(test["bootstrap"])
+        confidence = test.get("confidence", 0.95)
+        low, high = bootstrap_ci(kind, data, n, confidence, **options)
+        details[f"Bootstrap {confidence:.0%} CI for {label} ({n} resamples)"] = f"[{low:.4f}, {high:.4f}]"
+    return details
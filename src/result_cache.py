@@ -0,0 +1,164 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+import pandas as pd
+from src import metrics
+from src.utils import plot_style
+
+try:
+    BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+except NameError:
+    BASE_DIR = os.path.abspath(os.path.join(os.getcwd(), ".."))
+
+CACHE_DIR = os.path.join(BASE_DIR, "results", "cache")
+MAX_CACHE_BYTES = int(os.environ.get("STATS_COURT_CACHE_BYTES", 256 * 1024 * 1024))
+
+# Bump when the cached payload format, the statistics or the plots change
+CACHE_VERSION = 3
+
+CACHE_STATS = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+def dataset_fingerprint(df, cols):
+    """
+    Hashes the names, dtypes and values of the columns a test reads.
+    Other columns of the dataset do not affect the fingerprint.
+    """
+    h = hashlib.sha256()
+    for col in cols:
+        h.update(str(col).encode("utf-8"))
+        h.update(str(df[col].dtype).encode("utf-8"))
+        h.update(pd.util.hash_pandas_object(df[col], index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+def normalize_config(test):
+    """
+    Canonical JSON for a test config; free-text fields do not change the result.
+    """
+    relevant = {k: v for k, v in test.items() if k != "hypothesis"}
+    return json.dumps(relevant, sort_keys=True, default=str)
+
+
+def cache_key(df, cols, test, accumulator=None):
+    """
+    Key of a test's result. With an accumulator (see `src.accumulators`) its state stands
+    in for the rows it has seen, so only the rows appended since are hashed.
+    """
+    h = hashlib.sha256()
+    h.update(f"v{CACHE_VERSION}".encode("utf-8"))
+    if accumulator is not None:
+        h.update(json.dumps(accumulator.to_dict(), sort_keys=True, default=str).encode("utf-8"))
+        df = df.iloc[accumulator.rows_seen:]
+    h.update(dataset_fingerprint(df, cols).encode("utf-8"))
+    h.update(normalize_config(test).encode("utf-8"))
+    # Cached plots are only reused with the same image format and resolution
+    h.update(plot_style().encode("utf-8"))
+    return h.hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def _copy_atomic(src, dst):
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    tmp_path = f"{dst}.{os.getpid()}.{threading.get_ident()}.tmp"
+    shutil.copyfile(src, tmp_path)
+    os.replace(tmp_path, dst)
+
+
+def get_cached(key, plot_path=None):
+    """
+    Returns the cached payload for `key`, or None on a miss.
+    If the entry has a plot it is copied to `plot_path`; an entry whose plot
+    was never rendered counts as a miss so the caller redraws it.
+    """
+    entry_path = _entry_path(key)
+    try:
+        with open(entry_path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (FileNotFoundError, ValueError):
+        CACHE_STATS["misses"] += 1
+        metrics.inc("cache_requests_total", result="miss")
+        return None
+
+    if plot_path and entry.get("plot_file"):
+        cached_plot = os.path.join(CACHE_DIR, entry["plot_file"])
+        if not os.path.exists(cached_plot):
+            # The plot was still rendering when the entry was stored; adopt it now if it exists
+            source = entry.get("plot_source")
+            if not source or not os.path.exists(source):
+                CACHE_STATS["misses"] += 1
+                metrics.inc("cache_requests_total", result="miss")
+                return None
+            _copy_atomic(source, cached_plot)
+        if os.path.abspath(cached_plot) != os.path.abspath(plot_path):
+            _copy_atomic(cached_plot, plot_path)
+
+    os.utime(entry_path)  # mtime doubles as the LRU clock
+    CACHE_STATS["hits"] += 1
+    metrics.inc("cache_requests_total", result="hit")
+    return entry["payload"]
+
+
+def put_cached(key, payload, plot_path=None):
+    """
+    Stores a result payload (any JSON-serializable value) and, optionally, its plot.
+    Plots that are rendered later in the background are picked up on the next hit.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    entry = {"payload": payload, "plot_file": None, "plot_source": None}
+    if plot_path:
+        entry["plot_file"] = key + os.path.splitext(plot_path)[1]
+        entry["plot_source"] = plot_path
+        if os.path.exists(plot_path):
+            _copy_atomic(plot_path, os.path.join(CACHE_DIR, entry["plot_file"]))
+
+    entry_path = _entry_path(key)
+    tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, entry_path)
+    evict()
+
+
+def evict(max_bytes=None):
+    """
+    Removes least recently used entries until the cache fits in `max_bytes`.
+    """
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    if not os.path.isdir(CACHE_DIR):
+        return
+    entries = {}
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".tmp"):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        key = name.split(".", 1)[0]
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        size, mtime, files = entries.get(key, (0, 0.0, []))
+        if name.endswith(".json"):
+            mtime = st.st_mtime
+        entries[key] = (size + st.st_size, mtime, files + [path])
+
+    total = sum(size for size, _, _ in entries.values())
+    for key, (size, _, files) in sorted(entries.items(), key=lambda item: item[1][1]):
+        if total <= max_bytes:
+            break
+        for path in files:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+        CACHE_STATS["evictions"] += 1
+
+
+def get_cache_stats():
+    return dict(CACHE_STATS)
@@ -0,0 +1,133 @@
+import os
+import numpy as np
+import pandas as pd
+
+# Rows kept in the preview sample, and the dataset size from which one is built
+SAMPLE_ROWS = int(os.environ.get("STATS_COURT_SAMPLE_ROWS", 100_000))
+# Stratify on the categorical column with the most levels up to this many
+MAX_STRATA = 50
+
+
+class StratifiedReservoir:
+    """
+    Streaming stratified sample of row positions: every row gets a uniform random key
+    and each stratum keeps the `size` smallest keys seen so far (a reservoir per stratum).
+    `positions()` then allocates `size` rows across strata in proportion to their counts,
+    at least one per stratum, so the sample is close to self-weighting and rare groups
+    are never lost.
+    """
+
+    def __init__(self, size=SAMPLE_ROWS, seed=None):
+        self.size = size
+        self.rng = np.random.default_rng(seed)
+        self.rows = 0
+        self.counts = {}
+        self.kept = {}   # stratum -> (keys, positions)
+
+    def add(self, strata_values):
+        """
+        Adds the next chunk of rows, given their stratum labels (or just a length
+        for an unstratified sample).
+        """
+        if isinstance(strata_values, int):
+            codes, uniques = np.zeros(strata_values, dtype=np.intp), [None]
+        else:
+            codes, uniques = pd.factorize(strata_values, use_na_sentinel=False)
+        n = len(codes)
+        keys = self.rng.random(n)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.cumsum(np.bincount(codes, minlength=len(uniques)))[:-1]
+        for stratum, local in zip(uniques, np.split(order, bounds)):
+            stratum = None if stratum is None or pd.isna(stratum) else stratum
+            self.counts[stratum] = self.counts.get(stratum, 0) + len(local)
+            k, pos = keys[local], local + self.rows
+            if stratum in self.kept:
+                old_keys, old_pos = self.kept[stratum]
+                k, pos = np.concatenate([old_keys, k]), np.concatenate([old_pos, pos])
+            if len(k) > self.size:
+                keep = np.argpartition(k, self.size)[:self.size]
+                k, pos = k[keep], pos[keep]
+            self.kept[stratum] = (k, pos)
+        self.rows += n
+
+    def positions(self):
+        """
+        Sorted row positions of the sample.
+        """
+        if self.rows <= self.size:
+            return np.arange(self.rows)
+        strata = list(self.counts)
+        quota = np.array([self.counts[s] for s in strata], dtype=np.float64) * self.size / self.rows
+        alloc = np.maximum(np.floor(quota).astype(int), 1)
+        # Hand out what is left by largest remainder
+        leftover = self.size - alloc.sum()
+        if leftover > 0:
+            alloc[np.argsort(-(quota - np.floor(quota)))[:leftover]] += 1
+        parts = []
+        for stratum, n in zip(strata, alloc):
+            keys, pos = self.kept[stratum]
+            parts.append(pos[np.argsort(keys)[:n]])
+        return np.sort(np.concatenate(parts))
+
+
+def strata_column(profile):
+    """
+    The categorical column to stratify on: the one with the most levels, up to MAX_STRATA.
+    """
+    best, best_levels = None, 1
+    for col in profile.categorical_cols:
+        levels = profile.nunique(col) or 0
+        if best_levels < levels <= MAX_STRATA:
+            best, best_levels = col, levels
+    return best
+
+
+def build_sample(df, profile, size=SAMPLE_ROWS, seed=0, chunksize=1_000_000):
+    """
+    Builds the preview sample of `df` chunk by chunk. Returns (sample, info) where `info`
+    has the total row count and the stratification column, or (None, None) when the
+    dataset is small enough to test in full.
+    """
+    if len(df) <= size:
+        return None, None
+    strata = strata_column(profile)
+    reservoir = StratifiedReservoir(size, seed)
+    for start in range(0, len(df), chunksize):
+        stop = min(start + chunksize, len(df))
+        reservoir.add(df[strata].iloc[start:stop] if strata else stop - start)
+    sample = df.iloc[reservoir.positions()].reset_index(drop=True)
+    info = {"total_rows": len(df), "sample_rows": len(sample), "strata": strata, "seed": seed}
+    print(f"🎲 Built a {len(sample)}-row preview sample of {len(df)} rows (strata: {strata})")
+    return sample, info
+
+
+def sample_details(sample, info, test, confidence=0.95):
+    """
+    Report details for a test run on the sample: its size and a confidence interval
+    for the effect the test measures, so the preview shows how precise it is.
+    """
+    from scipy import stats
+    from src.resampling import prepare_data, bootstrap_ci
+    from src.effect_sizes import fisher_ci
+
+    details = {"Sample": f"{info['sample_rows']:,} of {info['total_rows']:,} rows"
+                         + (f" (stratified by {info['strata']})" if info.get("strata") else "")}
+    label = f"{confidence:.0%} CI"
+    test_type = test.get("type")
+    if test_type == "ttest":
+        data = prepare_data("welch_t", sample, test["cat"], test["num"])
+        y1, y2 = data["y1"], data["y2"]
+        a, b = y1.var(ddof=1) / len(y1), y2.var(ddof=1) / len(y2)
+        dof = (a + b) ** 2 / (a ** 2 / (len(y1) - 1) + b ** 2 / (len(y2) - 1))
+        diff, half = y1.mean() - y2.mean(), stats.t.ppf(0.5 + confidence / 2, dof) * np.sqrt(a + b)
+        details[f"{label} for the mean difference"] = f"[{diff - half:.4f}, {diff + half:.4f}]"
+    elif test_type == "correlation":
+        data = prepare_data(test.get("method", "pearson"), sample, test["col1"], test["col2"])
+        r = np.corrcoef(data["x"], data["y"])[0, 1]
+        low, high = fisher_ci(r, len(data["x"]), confidence, test.get("method", "pearson"))
+        details[f"{label} for r"] = f"[{low:.4f}, {high:.4f}]"
+    elif test_type == "chi2":
+        data = prepare_data("chi2", sample, test["col1"], test["col2"])
+        low, high = bootstrap_ci("chi2", data, 200, confidence, seed=info.get("seed"))
+        details[f"{label} for chi-square (bootstrap)"] = f"[{low:.4f}, {high:.4f}]"
+    return details
@@ -0,0 +1,180 @@
+"""
+Segmented test runs: a single-pair config with "by": <column> is evaluated within every
+level of the segment column.
+
+The segment column is factorized once and each test's sufficient statistics are
+computed for all segments in the same bincount pass, using combined
+(segment, level) codes for the grouped tests, a 3-D contingency count for chi2 and
+per-segment co-moments for correlations. The per-segment statistics then run as one
+vectorized call instead of one test (and one figure) per segment.
+"""
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from src.batch_tests import chi2_statistic, contingency_from_codes, _t_pvalue
+from src.group_stats import GroupSummary, GROUP_METHODS, GROUP_TESTS, group_codes, group_moments, welch_t
+from src.effect_sizes import ttest_effect, chi2_effect, correlation_effect, anova_effect
+from src.plot_renderer import boxplot_stats
+from src.hypothesis_tests import make_plot
+
+SEGMENT_TESTS = ("chi2", "ttest", "correlation", "anova")
+# Segments drawn in the small-multiples figure (the largest ones); the table lists all
+MAX_PANELS = 16
+
+
+def _panel_segments(n, limit=MAX_PANELS):
+    # Indices of the largest segments, in segment order
+    order = np.argsort(-np.asarray(n), kind="stable")[:limit]
+    return sorted(i for i in order if n[i] > 0)
+
+
+def _segmented_chi2(df, seg, levels, col1, col2, profile, plot=True):
+    codes1, levels1 = group_codes(df, col1, profile)
+    codes2, levels2 = group_codes(df, col2, profile)
+    k1, k2 = len(levels1), len(levels2)
+    s = len(levels)
+    # (segment, level1) pairs as one code, so a single bincount fills every segment's table
+    combined = np.where(seg >= 0, seg.astype(np.int64) * k1 + codes1, -1)
+    combined[codes1 < 0] = -1
+    tables = contingency_from_codes(combined, s * k1, codes2, k2, drop_empty=False).reshape(s, k1, k2)
+    rows, panels = [], {}
+    for i in range(s):
+        keep_rows, keep_cols = tables[i].sum(axis=1) > 0, tables[i].sum(axis=0) > 0
+        table = tables[i][keep_rows][:, keep_cols]
+        n = int(table.sum())
+        if min(table.shape) < 2:
+            rows.append({"segment": levels[i], "n": n, "stat": None, "p": None, "effect": None})
+            continue
+        chi2, dof = chi2_statistic(table)
+        rows.append({"segment": levels[i], "n": n, "stat": chi2, "p": None, "effect": chi2_effect(table),
+                     "dof": dof})
+        if plot:
+            panels[i] = {"contingency": pd.DataFrame(
+                table, index=pd.Index(np.asarray(levels1, dtype=object)[keep_rows], name=col1),
+                columns=pd.Index(np.asarray(levels2, dtype=object)[keep_cols], name=col2))}
+    # One survival-function call for every segment
+    tested = [row for row in rows if row["stat"] is not None]
+    p_values = stats.chi2.sf([row["stat"] for row in tested], [row.pop("dof") for row in tested])
+    for row, p in zip(tested, np.atleast_1d(p_values)):
+        row["p"] = float(p)
+    shown = _panel_segments([r["n"] if i in panels else 0 for i, r in enumerate(rows)])
+    return rows, ("heatmap", [(levels[i], panels[i]) for i in shown], {})
+
+
+def _segmented_groups(df, seg, levels, test, profile, plot=True):
+    cat_col, num_col = test["cat"], test["num"]
+    method = "welch_t" if test["type"] == "ttest" else test.get("method", "anova")
+    if method != "welch_t" and method not in GROUP_METHODS:
+        raise ValueError(f"Unknown ANOVA method '{method}'")
+    codes, group_levels = group_codes(df, cat_col, profile)
+    k, s = len(group_levels), len(levels)
+    if method == "welch_t" and k != 2:
+        raise ValueError("T-test requires exactly 2 groups")
+    # One moment pass over combined (segment, group) codes; rows of the reshaped
+    # summary are segments, so every test below is vectorized across them
+    combined = np.where((seg >= 0) & (codes >= 0), seg.astype(np.int64) * k + codes, -1)
+    y = df[num_col].to_numpy(dtype=np.float64, na_value=np.nan)
+    n, mean, ss, c, v = group_moments(combined, y, s * k)
+    rank_sum = tie_sum = None
+    if method == "kruskal":
+        # Ranks and ties within each segment
+        segment_of = c // k
+        ranks = pd.Series(v).groupby(segment_of).rank().to_numpy()
+        rank_sum = np.bincount(c, weights=ranks, minlength=s * k).reshape(s, k)
+        ties = pd.Series(v).groupby([segment_of, v]).size()
+        t = ties.to_numpy(dtype=np.float64)
+        tie_sum = np.bincount(ties.index.get_level_values(0), weights=t ** 3 - t, minlength=s)
+    summary = GroupSummary(group_levels, list(range(s)), n.reshape(s, k), mean.reshape(s, k),
+                           ss.reshape(s, k), rank_sum, tie_sum)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if method == "welch_t":
+            stat, p, _ = welch_t(summary)
+        else:
+            stat, p, _ = GROUP_TESTS[method](summary)
+    counts = summary.n.sum(axis=1)
+    rows = []
+    for i in range(s):
+        testable = (summary.n[i] > 1).sum() >= 2 and np.isfinite(stat[i])
+        if not testable:
+            rows.append({"segment": levels[i], "n": int(counts[i]), "stat": None, "p": None, "effect": None})
+            continue
+        effect = ttest_effect(summary, i) if method == "welch_t" else anova_effect(summary, i, method, float(stat[i]))
+        rows.append({"segment": levels[i], "n": int(counts[i]), "stat": float(stat[i]), "p": float(p[i]),
+                     "effect": effect})
+    if not plot:
+        return rows, ("quantile_boxplot", [], {})
+    shown = _panel_segments(counts)
+    # Quartiles for every (segment, group) from one groupby; only the summaries are drawn
+    data = pd.DataFrame({"segment": seg, cat_col: df[cat_col].to_numpy(), num_col: y})
+    data = data[np.isin(seg, shown)]
+    panels = [(levels[i], {"box_stats": boxplot_stats(part, cat_col, num_col)})
+              for i, part in data.groupby("segment", sort=True)]
+    return rows, ("quantile_boxplot", panels, {"x": cat_col, "y": num_col})
+
+
+def _segmented_correlation(df, seg, levels, col1, col2, method, plot=True):
+    x = df[col1].to_numpy(dtype=np.float64, na_value=np.nan)
+    y = df[col2].to_numpy(dtype=np.float64, na_value=np.nan)
+    valid = (seg >= 0) & ~np.isnan(x) & ~np.isnan(y)
+    s_codes, x, y = seg[valid].astype(np.intp), x[valid], y[valid]
+    s = len(levels)
+    if method == "spearman":
+        x = pd.Series(x).groupby(s_codes).rank().to_numpy()
+        y = pd.Series(y).groupby(s_codes).rank().to_numpy()
+    # Per-segment co-moments around each segment's means
+    n = np.bincount(s_codes, minlength=s).astype(np.float64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        dx = x - (np.bincount(s_codes, weights=x, minlength=s) / n)[s_codes]
+        dy = y - (np.bincount(s_codes, weights=y, minlength=s) / n)[s_codes]
+        sxx = np.bincount(s_codes, weights=dx * dx, minlength=s)
+        syy = np.bincount(s_codes, weights=dy * dy, minlength=s)
+        sxy = np.bincount(s_codes, weights=dx * dy, minlength=s)
+        r = sxy / np.sqrt(sxx * syy)
+        p = _t_pvalue(r, n)
+    rows = []
+    for i in range(s):
+        if n[i] < 3 or not np.isfinite(r[i]):
+            rows.append({"segment": levels[i], "n": int(n[i]), "stat": None, "p": None, "effect": None})
+            continue
+        rows.append({"segment": levels[i], "n": int(n[i]), "stat": float(r[i]), "p": float(p[i]),
+                     "effect": correlation_effect(r[i], n[i], method)})
+    if not plot:
+        return rows, ("scatter", [], {})
+    shown = _panel_segments(n)
+    order = np.argsort(s_codes, kind="stable")
+    bounds = np.cumsum(n.astype(np.int64))
+    panels = [(levels[i], {"x": x[order[bounds[i] - int(n[i]):bounds[i]]],
+                           "y": y[order[bounds[i] - int(n[i]):bounds[i]]]}) for i in shown]
+    return rows, ("scatter", panels, {"xlabel": col1, "ylabel": col2})
+
+
+def segmented_test(df, test, profile=None, save_path=None, defer_plot=False):
+    """
+    Evaluates a chi2, ttest, correlation or anova config within every level of
+    `test["by"]` and draws one small-multiples figure of the largest segments.
+    Returns one dict per segment with segment, n, stat, p and effect (None for
+    segments too small to test).
+    """
+    test_type = test.get("type")
+    if test_type not in SEGMENT_TESTS:
+        raise ValueError(f"'by' is not supported for {test_type} tests")
+    by = test["by"]
+    plot = bool(save_path)
+    seg, levels = group_codes(df, by, profile)
+    levels = [str(level) for level in levels]
+    if test_type == "chi2":
+        rows, (kind, panels, shared) = _segmented_chi2(df, seg, levels, test["col1"], test["col2"], profile, plot)
+        title = f"{test['col1']} vs {test['col2']} by {by}"
+    elif test_type == "correlation":
+        rows, (kind, panels, shared) = _segmented_correlation(df, seg, levels, test["col1"], test["col2"],
+                                                              test.get("method", "pearson"), plot)
+        title = f"{test['col1']} vs {test['col2']} by {by}"
+    else:
+        rows, (kind, panels, shared) = _segmented_groups(df, seg, levels, test, profile, plot)
+        title = f"{test['num']} by {test['cat']}, per {by}"
+    if plot:
+        if sum(1 for row in rows if row["n"]) > MAX_PANELS:
+            title += f" (largest {len(panels)} segments)"
+        make_plot("small_multiples", save_path, defer_plot, panel_kind=kind, panels=panels, title=title, **shared)
+    return rows
@@ -4,9 +4,19 @@ import numpy as np
 
 # Ensure src modules can be found
 sys.path.append(os.path.abspath(os.path.join(os.getcwd(), '..')))
-from src.hypothesis_tests import categorical_associations, t_test, correlation_test
-from src.report_generator import append_to_report_html, initialize_report_html, insert_summary_table
-from src.utils import save_plot_if_needed, RESULT_PATH
+from src.hypothesis_tests import categorical_associations, t_test, correlation_test, anova_test
+from src.batch_tests import config_columns, is_batch_config, run_batch, expand_columns
+from src.group_stats import group_summary, GROUP_METHODS
+from src.segments import segmented_test
+from src.plot_renderer import render_deferred
+from src.result_cache import cache_key, get_cached, put_cached
+from src.multiple_testing import screen, screening_batch, CORRECTIONS
+from src.resampling import resampling_details
+from src.sampling import sample_details
+from src.effect_sizes import power_analysis, effect_details, effect_label
+from src.report_generator import ReportBuilder, TestResult, REPORT_PATH
+from src.utils import PLOT_FORMAT
+from src.metrics import instrument
 
 # Determine base and plot directories
 try:
@@ -17,22 +27,276 @@ except NameError:
 PLOT_PATH = os.path.join(BASE_DIR, "results", "plots")
 os.makedirs(PLOT_PATH, exist_ok=True)  # Ensure plot directory exists
 
-def run_tests_from_config(df, config_list):
+# Columns of the per-segment table of a segmented ("by") run
+SEGMENT_COLUMNS = ["Segment", "n", "Statistic", "p-value", "Effect size", "Power", "Rows needed", "Verdict"]
+
+def batch_summary(result):
     """
-    Runs statistical tests on the DataFrame `df` according to `config_list` instructions.
-    Generates plots, appends results to an HTML report, and inserts a summary table.
+    Converts a result dict from `src.batch_tests` into a summary table row.
     """
-    initialize_report_html()
-    summaries = []
+    if result["type"] == "chi2":
+        hypothesis = f"There is an association between {result['col1']} and {result['col2']}"
+        test_name = "Chi-square"
+    elif result["type"] == "ttest":
+        hypothesis = f"There is a difference in the mean of {result['num']} across {result['cat']}"
+        test_name = "T-test"
+    else:
+        hypothesis = f"There is a correlation between {result['col1']} and {result['col2']}"
+        test_name = f"{result['method'].title()} Correlation"
+    p = result["p"]
+    return {
+        "Hypothesis": hypothesis,
+        "Test": test_name,
+        "Statistic": result["stat"],
+        "p-value": p,
+        "Verdict": "Reject H₀" if p < 0.05 else "Fail to Reject H₀"
+    }
 
+def config_labels(test):
+    """
+    Hypothesis and test name of a single-pair config, as shown in the report.
+    """
+    test_type = test.get("type")
+    if test_type == "chi2":
+        return f"There is an association between {test['col1']} and {test['col2']}", "Chi-square"
+    if test_type == "ttest":
+        return f"There is a difference in the mean of {test['num']} across {test['cat']}", "T-test"
+    if test_type == "anova":
+        method = test.get("method", "anova")
+        return (f"There is a difference in {test['num']} across the groups of {test['cat']}",
+                GROUP_METHODS.get(method, method))
+    method = test.get("method", "pearson")
+    return f"There is a correlation between {test['col1']} and {test['col2']}", f"{method.title()} Correlation"
+
+def referenced_columns(config_list, profile, df=None):
+    """
+    Every column a config reads, in order of first use. Column selectors such as
+    "all_numeric" are resolved from the profile, so no data has to be loaded.
+    """
+    columns = []
     for test in config_list:
+        if test.get("type") == "screen":
+            test = screening_batch(test)
+        columns.extend(col for col in config_columns(df, test, profile) if isinstance(col, str))
+    return list(dict.fromkeys(columns))
+
+def plot_file(filename, fast=False, plot_dir=PLOT_PATH):
+    """
+    Full path of a plot in the configured image format; fast-mode plots get their own
+    file next to the full-data one.
+    """
+    root = os.path.splitext(filename)[0]
+    return os.path.join(plot_dir, f"{root}_sample.{PLOT_FORMAT}" if fast else f"{root}.{PLOT_FORMAT}")
+
+def add_power_analysis(measured):
+    """
+    Adds effect sizes, achieved power and the rows needed for the target power to each
+    result block and summary row, solving all of the run's tests in one vectorized call.
+    """
+    if not measured:
+        return
+    achieved, needed = power_analysis([effect for _, _, effect in measured])
+    for (result, summary, effect), power, rows in zip(measured, achieved, needed):
+        if effect is None:
+            continue
+        # Segment rows have no result block of their own
+        if result is not None:
+            result.details = {**result.details, **effect_details(effect, power, rows)}
+        summary["Effect size"] = effect_label(effect)
+        summary["Power"] = float(power) if np.isfinite(power) else None
+        summary["Rows needed"] = int(rows) if np.isfinite(rows) else None
+
+def cached_test(df, cols, test, plot_path, run_test, profile=None, store=None):
+    """
+    Looks the test up in the result cache before calling `run_test(accumulator)`.
+    With an AccumulatorStore the test's stored accumulator (see `src.accumulators`) keys
+    the cache together with the appended rows, is passed to `run_test` and saved after.
+    Returns (stat, p, verdict, interpretation, details, effect, hit); on a hit the cached
+    plot has already been copied to `plot_path`. `details` holds any permutation p-value
+    or bootstrap CI the config asked for (see `src.resampling`) and `effect` the test's
+    effect size (see `src.effect_sizes`).
+    """
+    acc = store.get(test) if store is not None else None
+    key = cache_key(df, cols, test, acc)
+    cached = get_cached(key, plot_path)
+    if cached is not None:
+        print("⚡ Result served from cache")
+        return (cached["stat"], cached["p"], cached["verdict"], cached["interpretation"],
+                cached.get("details", {}), cached.get("effect"), True)
+    stat, p, verdict, interpretation, _, effect = run_test(acc)
+    if acc is not None:
+        store.save(acc)
+    details = resampling_details(df, test, profile)
+    payload = {
+        "stat": float(stat), "p": float(p), "verdict": verdict, "interpretation": interpretation,
+        "details": details, "effect": effect
+    }
+    put_cached(key, payload, plot_path)
+    if acc is not None:
+        # The updated state now covers every row, so the next run looks up this key
+        put_cached(cache_key(df, cols, test, acc), payload, plot_path)
+    return stat, p, verdict, interpretation, details, effect, False
+
+@instrument("run_tests")
+def run_tests_from_config(df, config_list, defer_plots=False, profile=None, report_path=REPORT_PATH,
+                          progress=None, accumulators=None, sample=None, plot_dir=PLOT_PATH, plot_prefix="/plots/"):
+    """
+    Runs statistical tests on the DataFrame `df` according to `config_list` instructions.
+    Generates plots and builds the HTML report (result blocks plus a summary table)
+    in memory, writing it once at the end. Returns the ReportBuilder, whose `results`
+    and `summaries` hold the structured outcomes.
+
+    With `defer_plots=True` the statistics and report are written first and the plots
+    are handed to a process pool afterwards (see `src.plot_renderer`); the report links
+    resolve as soon as each image exists, or on first request through `/plots/<filename>`.
+
+    `profile` is the dataset's ColumnProfile (see `src.column_profile`); when given, its
+    column lists and categorical codes are reused instead of rescanning `df`.
+
+    `accumulators` is the dataset's AccumulatorStore (see `src.accumulators`); when given, chi2,
+    t-test and Pearson statistics are updated from the rows appended since the last run instead
+    of being recomputed from scratch.
+
+    `sample` is the dataset's preview sample as (DataFrame, info) (see `src.sampling`). Tests with
+    "fast": true run on it instead, draw binned/quantile plots, and report the sample size and a
+    confidence interval; run the config again without "fast" for full precision.
+
+    Plots are written to `plot_dir` and linked from the report as `plot_prefix + filename`
+    (the Flask `/plots/` route by default).
+
+    `progress(index)` is called before each test (and once more with the number of tests
+    at the end); exceptions it raises, such as a cancellation, stop the run.
+
+    Single-pair configs may add "permutations" and/or "bootstrap" resample counts (with an
+    optional "seed", "chunk_size", "n_jobs" and "confidence"); the permutation p-value and
+    bootstrap CI from `src.resampling` are shown in the test's result block.
+
+    {"type": "anova", "cat": ..., "num": ..., "method": "anova" | "welch_anova" | "kruskal"} compares
+    a numeric column across every level of a categorical one; "num" may be a list (or "all_numeric"),
+    in which case the group statistics of all targets are computed in one pass (see `src.group_stats`).
+
+    Any single-pair chi2, ttest, correlation or anova config may add "by": <column> to run the
+    test within every level of that column (see `src.segments`); the report gets one block with
+    a per-segment table and a small-multiples plot, and the summary one row per segment.
+
+    Configs that target many columns at once (e.g. {"type": "correlation", "cols": "all_numeric"})
+    are evaluated by the vectorized engine in `src.batch_tests` and go straight to the summary table.
+    """
+    report = ReportBuilder(report_path, plot_prefix)
+    plot_paths = []
+    # (result, summary row, effect) of every single test, for one power analysis at the end
+    measured = []
+
+    def add_result(result, summary, effect):
+        report.add_result(result, summary)
+        measured.append((result, summary, effect))
+
+    for index, test in enumerate(config_list):
+        if progress:
+            progress(index)
         print(f"Running test: {test}")
+        # Fast mode runs on the preview sample; its codes and accumulators belong to the full data
+        fast = bool(test.get("fast")) and sample is not None
+        data, data_profile, store = (sample[0], None, None) if fast else (df, profile, accumulators)
+        # Tests answered from accumulators draw their plots from the sample instead of every row
+        plot_sample = sample[0] if sample is not None and not fast else None
         try:
             test_type = test.get("type")
             if not test_type:
                 print("Test config missing 'type'. Skipping.")
                 continue
 
+            # --- Screening with multiple-testing correction ---
+            if test_type == "screen":
+                key = cache_key(data, config_columns(data, screening_batch(test), data_profile), test)
+                results = get_cached(key)
+                if results is None:
+                    results = screen(data, test, data_profile)
+                    put_cached(key, results)
+                alpha = test.get("alpha", 0.05)
+                correction = CORRECTIONS[test.get("correction", "fdr_bh")]
+                significant = [r for r in results if r["significant"]]
+                top = significant[:test.get("top_k", 20)]
+                report.add_result(TestResult(
+                    hypothesis=f"Screening of every eligible {test.get('test', 'correlation')} pair",
+                    test_name=f"{correction} corrected screen",
+                    stat=f"{len(significant)} of {len(results)} significant",
+                    p_value=f"adjusted p < {alpha}",
+                    conclusion=f"Showing top {len(top)} in the summary table",
+                    interpretation=f"p-values are adjusted with the {correction} procedure over all "
+                                   f"{len(results)} tests; no per-test plots are drawn."
+                ))
+                for result in top:
+                    summary = batch_summary(result)
+                    summary["Adjusted p-value"] = result["q"]
+                    summary["Verdict"] = "Reject H₀"
+                    report.add_summary(summary)
+                print(f"✅ screened {len(results)} tests, {len(significant)} significant")
+                continue
+
+            # --- Segmented runs: one single-pair test within every level of "by" ---
+            if test.get("by"):
+                by = test["by"]
+                pair = ([test.get("cat"), test.get("num")] if test_type in ("ttest", "anova")
+                        else [test.get("col1"), test.get("col2")])
+                if is_batch_config(test) or not all(isinstance(col, str) for col in pair):
+                    print(f"Segmented {test_type} config needs a single column pair. Skipping.")
+                    continue
+                hypothesis, test_name = config_labels(test)
+                filename = f"{test_type}_{pair[0]}_{pair[1]}_by_{by}.png".replace(" ", "_")
+                full_plot_path = plot_file(filename, fast, plot_dir)
+                key = cache_key(data, pair + [by], test)
+                rows = get_cached(key, full_plot_path)
+                if rows is not None:
+                    print("⚡ Result served from cache")
+                else:
+                    rows = segmented_test(data, test, data_profile, save_path=full_plot_path, defer_plot=defer_plots)
+                    put_cached(key, rows, full_plot_path)
+                    plot_paths.append(full_plot_path)
+                segments = []
+                for row in rows:
+                    p = row["p"]
+                    verdict = "Not enough data" if p is None else "Reject H₀" if p < 0.05 else "Fail to Reject H₀"
+                    summary = {
+                        "Hypothesis": f"{hypothesis} [{by} = {row['segment']}]",
+                        "Test": test_name,
+                        "Statistic": row["stat"],
+                        "p-value": p,
+                        "Verdict": verdict,
+                        "Segment": row["segment"],
+                        "n": row["n"],
+                    }
+                    # The same dicts fill the block's table, so the power analysis shows up in both
+                    segments.append(summary)
+                    report.add_summary(summary)
+                    measured.append((None, summary, row["effect"]))
+                tested = [row for row in rows if row["p"] is not None]
+                significant = sum(row["p"] < 0.05 for row in tested)
+                report.add_result(TestResult(
+                    hypothesis=f"{hypothesis}, within each level of {by}",
+                    test_name=f"{test_name} by {by}",
+                    stat=f"{len(tested)} of {len(rows)} segments tested",
+                    p_value=f"{significant} with p < 0.05",
+                    conclusion=f"Reject H₀ in {significant} of {len(tested)} segments",
+                    interpretation=f"Each level of {by} is tested on its own rows; the p-values are not "
+                                   f"adjusted for the number of segments.",
+                    plot_path=full_plot_path, table=segments, table_columns=SEGMENT_COLUMNS
+                ))
+                print(f"✅ {test_type} results for {len(rows)} segments of {by} added")
+                continue
+
+            # --- Batched (all-pairs) tests ---
+            if is_batch_config(test):
+                key = cache_key(data, config_columns(data, test, data_profile), test)
+                results = get_cached(key)
+                if results is None:
+                    results = run_batch(data, test, data_profile)
+                    put_cached(key, results)
+                for result in results:
+                    report.add_summary(batch_summary(result))
+                print(f"✅ {len(results)} batched {test_type} tests added to summary")
+                continue
+
             # --- Chi-square Test ---
             if test_type == "chi2":
                 col1 = test.get("col1")
@@ -41,23 +305,31 @@ def run_tests_from_config(df, config_list):
                     print("Chi2 test config missing columns. Skipping.")
                     continue
                 filename = f"chi2_{col1}_vs_{col2}.png".replace(" ", "_")
-                full_plot_path = os.path.join(PLOT_PATH, filename)
-                stat, p, verdict, interpretation, _ = categorical_associations(
-                    df, col1, col2, return_all=True, save_path=full_plot_path
+                full_plot_path = plot_file(filename, fast, plot_dir)
+                stat, p, verdict, interpretation, details, effect, hit = cached_test(
+                    data, [col1, col2], test, full_plot_path,
+                    lambda acc: categorical_associations(
+                        data, col1, col2, return_all=True, save_path=full_plot_path, defer_plot=defer_plots,
+                        profile=data_profile, accumulator=acc
+                    ), data_profile, store
                 )
-                append_to_report_html(
+                if fast:
+                    details = {**details, **sample_details(*sample, test)}
+                add_result(TestResult(
                     hypothesis=f"There is an association between {col1} and {col2}",
                     test_name="Chi-square Test",
                     stat=stat, p_value=p, conclusion=verdict,
-                    interpretation=interpretation, plot_path=full_plot_path
-                )
-                print(f"✅ chi2 test report appended")
-                summaries.append({
+                    interpretation=interpretation, plot_path=full_plot_path,
+                    details=details
+                ), {
                     "Hypothesis": f"There is an association between {col1} and {col2}",
                     "Test": "Chi-square",
                     "p-value": p,
                     "Verdict": verdict
-                })
+                }, effect)
+                if not hit:
+                    plot_paths.append(full_plot_path)
+                print(f"✅ chi2 test result added")
 
             # --- T-test ---
             elif test_type == "ttest":
@@ -67,23 +339,31 @@ def run_tests_from_config(df, config_list):
                     print("T-test config missing columns. Skipping.")
                     continue
                 filename = f"ttest_{num_col}_by_{cat_col}.png".replace(" ", "_")
-                full_plot_path = os.path.join(PLOT_PATH, filename)
-                stat, p, verdict, interpretation, _ = t_test(
-                    df, cat_col, num_col, return_all=True, save_path=full_plot_path
+                full_plot_path = plot_file(filename, fast, plot_dir)
+                stat, p, verdict, interpretation, details, effect, hit = cached_test(
+                    data, [cat_col, num_col], test, full_plot_path,
+                    lambda acc: t_test(
+                        data, cat_col, num_col, return_all=True, save_path=full_plot_path, defer_plot=defer_plots,
+                        profile=data_profile, accumulator=acc, fast_plot=fast, plot_df=plot_sample
+                    ), data_profile, store
                 )
-                append_to_report_html(
+                if fast:
+                    details = {**details, **sample_details(*sample, test)}
+                add_result(TestResult(
                     hypothesis=f"There is a difference in the mean of {num_col} across {cat_col}",
                     test_name="T-test",
                     stat=stat, p_value=p, conclusion=verdict,
-                    interpretation=interpretation, plot_path=full_plot_path
-                )
-                print(f"✅ ttest report appended")
-                summaries.append({
+                    interpretation=interpretation, plot_path=full_plot_path,
+                    details=details
+                ), {
                     "Hypothesis": f"There is a difference in the mean of {num_col} across {cat_col}",
                     "Test": "T-test",
                     "p-value": p,
                     "Verdict": verdict
-                })
+                }, effect)
+                if not hit:
+                    plot_paths.append(full_plot_path)
+                print(f"✅ ttest result added")
 
             # --- Correlation Test ---
             elif test_type == "correlation":
@@ -94,37 +374,89 @@ def run_tests_from_config(df, config_list):
                     print("Correlation test config missing columns. Skipping.")
                     continue
                 filename = f"correlation_{col1}_vs_{col2}_{method}.png".replace(" ", "_")
-                full_plot_path = os.path.join(PLOT_PATH, filename)
-                stat, p, verdict, interpretation, _ = correlation_test(
-                    df, col1, col2, method=method, save_path=full_plot_path
+                full_plot_path = plot_file(filename, fast, plot_dir)
+                stat, p, verdict, interpretation, details, effect, hit = cached_test(
+                    data, [col1, col2], test, full_plot_path,
+                    lambda acc: correlation_test(
+                        data, col1, col2, method=method, save_path=full_plot_path, defer_plot=defer_plots,
+                        accumulator=acc, fast_plot=fast, plot_df=plot_sample
+                    ), data_profile, store
                 )
-                append_to_report_html(
+                if fast:
+                    details = {**details, **sample_details(*sample, test)}
+                add_result(TestResult(
                     hypothesis=f"There is a correlation between {col1} and {col2}",
                     test_name=f"{method.title()} Correlation",
                     stat=stat, p_value=p, conclusion=verdict,
-                    interpretation=interpretation, plot_path=full_plot_path
-                )
-                print(f"✅ correlation test report appended")
-                summaries.append({
+                    interpretation=interpretation, plot_path=full_plot_path,
+                    details=details
+                ), {
                     "Hypothesis": f"There is a correlation between {col1} and {col2}",
                     "Test": f"{method.title()} Correlation",
                     "p-value": p,
                     "Verdict": verdict
-                })
+                }, effect)
+                if not hit:
+                    plot_paths.append(full_plot_path)
+                print(f"✅ correlation test result added")
+            # --- One-way ANOVA / Welch ANOVA / Kruskal–Wallis ---
+            elif test_type == "anova":
+                cat_col = test.get("cat")
+                method = test.get("method", "anova")
+                if not cat_col or not test.get("num"):
+                    print("ANOVA config missing columns. Skipping.")
+                    continue
+                if method not in GROUP_METHODS:
+                    print(f"Unknown ANOVA method '{method}'. Skipping.")
+                    continue
+                # "num" may list several targets; their group statistics come from one pass
+                targets = [col for col in expand_columns(data, test["num"], data_profile) if col != cat_col]
+                shared = {}
+
+                def summary():
+                    if "summary" not in shared:
+                        shared["summary"] = group_summary(data, cat_col, targets, data_profile, ranks=method == "kruskal")
+                    return shared["summary"]
+
+                for num_col in targets:
+                    filename = f"{method}_{num_col}_by_{cat_col}.png".replace(" ", "_")
+                    full_plot_path = plot_file(filename, fast, plot_dir)
+                    stat, p, verdict, interpretation, details, effect, hit = cached_test(
+                        data, [cat_col, num_col], {**test, "num": num_col}, full_plot_path,
+                        lambda acc: anova_test(
+                            data, cat_col, num_col, method, return_all=True, save_path=full_plot_path,
+                            defer_plot=defer_plots, profile=data_profile, summary=summary(), fast_plot=fast
+                        ), data_profile
+                    )
+                    if fast:
+                        details = {**details, **sample_details(*sample, test)}
+                    add_result(TestResult(
+                        hypothesis=f"There is a difference in {num_col} across the groups of {cat_col}",
+                        test_name=GROUP_METHODS[method],
+                        stat=stat, p_value=p, conclusion=verdict,
+                        interpretation=interpretation, plot_path=full_plot_path,
+                        details=details
+                    ), {
+                        "Hypothesis": f"There is a difference in {num_col} across the groups of {cat_col}",
+                        "Test": GROUP_METHODS[method],
+                        "p-value": p,
+                        "Verdict": verdict
+                    }, effect)
+                    if not hit:
+                        plot_paths.append(full_plot_path)
+                print(f"✅ {len(targets)} {method} results added")
             else:
                 print(f"Unknown test type '{test_type}'. Skipping.")
 
         except Exception as e:
             print(f"Error in test {test}:\n   {e}")
 
-    insert_summary_table(summaries)
-
-
-
-
-
-
-
-
-
+    add_power_analysis(measured)
+    report.write()
+    if progress:
+        progress(len(config_list))
 
+    if defer_plots and plot_paths:
+        render_deferred(plot_paths)
+        print(f"🖼️ Queued {len(plot_paths)} plots for background rendering")
+    return report
@@ -0,0 +1,103 @@
+import json
+import unittest
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from src.accumulators import (Accumulator, ContingencyAccumulator, GroupMomentsAccumulator,
+                              CoMomentAccumulator, from_dict)
+
+
+def sample_frame(n=600, seed=0):
+    # A large offset on y checks that merged moments keep their precision
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=n)
+    df = pd.DataFrame({
+        "x": np.round(x, 1),
+        "y": 1e6 + x + rng.normal(size=n),
+        "g": rng.choice(["a", "b", "c"], size=n),
+        "h": rng.choice(["u", "v"], size=n),
+    })
+    for col in df.columns:
+        df.loc[rng.random(n) < 0.1, col] = np.nan
+    return df
+
+
+def shards(df, *bounds):
+    edges = [0, *bounds, len(df)]
+    return [df.iloc[a:b] for a, b in zip(edges, edges[1:])]
+
+
+class AccumulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.df = sample_frame()
+
+    def merged(self, cls, col1, col2, *bounds):
+        parts = [cls(col1, col2).update(part) for part in shards(self.df, *bounds)]
+        acc = parts[0]
+        for part in parts[1:]:
+            acc.merge(part)
+        return acc
+
+    def test_base_class_is_abstract(self):
+        with self.assertRaises(TypeError):
+            Accumulator("g", "h")
+
+    def test_contingency_merge_matches_single_pass(self):
+        single = ContingencyAccumulator("g", "h").update(self.df)
+        merged = self.merged(ContingencyAccumulator, "g", "h", 100, 101, 350)
+        pd.testing.assert_frame_equal(merged.table(), single.table())
+        pd.testing.assert_frame_equal(single.table(), pd.crosstab(self.df["g"], self.df["h"]), check_names=False)
+        expected = stats.chi2_contingency(pd.crosstab(self.df["g"], self.df["h"]))
+        self.assertAlmostEqual(merged.chi2()[0], expected.statistic, places=10)
+        self.assertEqual(merged.rows_seen, len(self.df))
+
+    def test_group_moments_merge_matches_single_pass(self):
+        single = GroupMomentsAccumulator("g", "y").update(self.df).group_summary()
+        merged = self.merged(GroupMomentsAccumulator, "g", "y", 50, 300).group_summary()
+        self.assertEqual(merged.levels, single.levels)
+        np.testing.assert_array_equal(merged.n, single.n)
+        np.testing.assert_allclose(merged.mean, single.mean, rtol=1e-14)
+        np.testing.assert_allclose(merged.ss, single.ss, rtol=1e-9)
+        for i, level in enumerate(single.levels):
+            values = self.df.loc[self.df["g"] == level, "y"].dropna()
+            self.assertEqual(single.n[0, i], len(values))
+            self.assertAlmostEqual(single.mean[0, i], values.mean(), places=6)
+            self.assertAlmostEqual(single.ss[0, i] / (len(values) - 1), values.var(), places=8)
+
+    def test_comoment_merge_matches_single_pass(self):
+        single = CoMomentAccumulator("x", "y").update(self.df)
+        merged = self.merged(CoMomentAccumulator, "x", "y", 1, 200, 201)
+        pair = self.df[["x", "y"]].dropna()
+        expected = stats.pearsonr(pair["x"], pair["y"])
+        for acc in (single, merged):
+            r, p, n = acc.pearson()
+            self.assertEqual(n, len(pair))
+            self.assertAlmostEqual(r, expected.statistic, places=10)
+            self.assertAlmostEqual(p, expected.pvalue, places=8)
+
+    def test_update_to_scans_appended_rows(self):
+        grown = ContingencyAccumulator("g", "h").update_to(self.df.iloc[:250]).update_to(self.df)
+        self.assertEqual(grown.rows_seen, len(self.df))
+        pd.testing.assert_frame_equal(grown.table(), ContingencyAccumulator("g", "h").update(self.df).table())
+        grown = CoMomentAccumulator("x", "y").update_to(self.df.iloc[:250]).update_to(self.df)
+        r, _, n = CoMomentAccumulator("x", "y").update(self.df).pearson()
+        self.assertAlmostEqual(grown.pearson()[0], r, places=10)
+        self.assertEqual(grown.pearson()[2], n)
+        with self.assertRaises(ValueError):
+            grown.update_to(self.df.iloc[:10])
+
+    def test_round_trip_through_json(self):
+        for acc in (ContingencyAccumulator("g", "h").update(self.df),
+                    GroupMomentsAccumulator("g", "y").update(self.df),
+                    CoMomentAccumulator("x", "y").update(self.df)):
+            restored = from_dict(json.loads(json.dumps(acc.to_dict())))
+            self.assertIs(type(restored), type(acc))
+            self.assertEqual(restored.to_dict(), acc.to_dict())
+            self.assertEqual(restored.key(), acc.key())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from src.batch_tests import correlation_matrix, batch_correlation, batch_chi2, batch_t_tests
+
+
+def sample_frame(n=400, seed=0):
+    # Rounded values give ties; every numeric column has its own missing rows
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=n)
+    df = pd.DataFrame({
+        "x": np.round(x, 1),
+        "y": np.round(x + rng.normal(size=n), 1),
+        "z": rng.integers(0, 5, size=n).astype(float),
+        "g": rng.choice(["a", "b"], size=n),
+        "h": rng.choice(["u", "v", "w"], size=n),
+    })
+    for col, frac in (("x", 0.1), ("y", 0.2), ("z", 0.05), ("g", 0.05), ("h", 0.1)):
+        df.loc[rng.random(n) < frac, col] = np.nan
+    return df
+
+
+class CorrelationMatrixTest(unittest.TestCase):
+
+    def setUp(self):
+        self.df = sample_frame()
+        self.cols = ["x", "y", "z"]
+
+    def check_against(self, method, scipy_test):
+        r, p, n = correlation_matrix(self.df, self.cols, method=method)
+        for i, a in enumerate(self.cols):
+            for j, b in enumerate(self.cols):
+                if i == j:
+                    continue
+                pair = self.df[[a, b]].dropna()
+                expected = scipy_test(pair[a], pair[b])
+                self.assertEqual(n[i, j], len(pair))
+                self.assertAlmostEqual(r[i, j], expected.statistic, places=10)
+                self.assertAlmostEqual(p[i, j], expected.pvalue, places=8)
+
+    def test_pearson_matches_scipy(self):
+        self.check_against("pearson", stats.pearsonr)
+
+    def test_spearman_ranks_each_pair_on_its_complete_rows(self):
+        self.check_against("spearman", stats.spearmanr)
+
+    def test_spearman_matches_pandas(self):
+        r, _, _ = correlation_matrix(self.df, self.cols, method="spearman")
+        np.testing.assert_allclose(r, self.df[self.cols].corr(method="spearman").to_numpy(), atol=1e-12)
+
+    def test_pairs_come_back_in_order(self):
+        results = batch_correlation(self.df, self.cols, method="spearman", pairs=[("z", "x"), ("y", "x")])
+        self.assertEqual([(res["col1"], res["col2"]) for res in results], [("z", "x"), ("y", "x")])
+        pair = self.df[["z", "x"]].dropna()
+        self.assertAlmostEqual(results[0]["stat"], stats.spearmanr(pair["z"], pair["x"]).statistic, places=10)
+
+
+class BatchTestsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.df = sample_frame(seed=1)
+
+    def test_chi2_matches_scipy(self):
+        for a, b in (("g", "h"), ("h", "g")):
+            result, = batch_chi2(self.df, [(a, b)])
+            table = pd.crosstab(self.df[a], self.df[b])
+            expected = stats.chi2_contingency(table)
+            self.assertAlmostEqual(result["stat"], expected.statistic, places=10)
+            self.assertAlmostEqual(result["p"], expected.pvalue, places=10)
+            self.assertEqual(result["dof"], expected.dof)
+            self.assertEqual(result["n"], table.to_numpy().sum())
+
+    def test_chi2_2x2_uses_yates_correction(self):
+        df = self.df.assign(k=np.where(self.df["x"] > 0, "hi", "lo"))
+        result, = batch_chi2(df, [("g", "k")])
+        expected = stats.chi2_contingency(pd.crosstab(df["g"], df["k"]), correction=True)
+        self.assertAlmostEqual(result["stat"], expected.statistic, places=10)
+
+    def test_welch_t_matches_scipy(self):
+        results = batch_t_tests(self.df, ["x", "y", "z"], ["g"])
+        self.assertEqual([res["num"] for res in results], ["x", "y", "z"])
+        for res in results:
+            groups = [self.df.loc[self.df["g"] == level, res["num"]].dropna()
+                      for level in pd.unique(self.df["g"].dropna())]
+            expected = stats.ttest_ind(*groups, equal_var=False)
+            self.assertAlmostEqual(res["stat"], expected.statistic, places=10)
+            self.assertAlmostEqual(res["p"], expected.pvalue, places=10)
+            self.assertEqual(res["n"], sum(len(g) for g in groups))
+
+    def test_non_binary_categories_are_skipped(self):
+        self.assertEqual(batch_t_tests(self.df, ["x"], ["h"]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
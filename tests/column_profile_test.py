@@ -0,0 +1,40 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.column_profile import hyperloglog_estimate, estimate_nunique, build_profile
+
+
+class CardinalityTest(unittest.TestCase):
+
+    def test_hyperloglog_within_error_bound(self):
+        rng = np.random.default_rng(0)
+        for distinct in (10, 1_000, 50_000, 300_000):
+            values = pd.Series(rng.integers(0, distinct, size=2 * distinct).astype(str))
+            values[rng.random(len(values)) < 0.05] = None
+            exact = values.nunique()
+            # About 1% standard error at the default precision; allow four of them
+            self.assertLess(abs(hyperloglog_estimate(values) - exact) / exact, 0.04, distinct)
+
+    def test_missing_values_are_not_counted(self):
+        self.assertEqual(hyperloglog_estimate(pd.Series([None, np.nan], dtype=object)), 0)
+        self.assertEqual(hyperloglog_estimate(pd.Series(["a", None, "a", "b"])), 2)
+
+    def test_estimate_is_exact_below_threshold(self):
+        s = pd.Series(np.arange(1_000) % 37)
+        self.assertEqual(estimate_nunique(s), (37, True))
+        nunique, exact = estimate_nunique(s, threshold=100)
+        self.assertFalse(exact)
+        self.assertLess(abs(nunique - 37), 2)
+
+    def test_profile_codes_match_factorize(self):
+        df = pd.DataFrame({"c": ["b", "a", None, "b"], "x": [1.0, 2.0, np.nan, 4.0]})
+        profile = build_profile(df)
+        codes, levels = pd.factorize(df["c"])
+        np.testing.assert_array_equal(profile.codes["c"], codes)
+        self.assertEqual(list(profile.levels["c"]), list(levels))
+
+
+if __name__ == "__main__":
+    unittest.main()
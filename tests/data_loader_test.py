@@ -0,0 +1,60 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.preprocessing import Preprocessor
+from src.data_loader import clean_raw_data, read_csv_chunked
+from tests.preprocessing_test import sample_frame
+
+
+class CleanRawDataTest(unittest.TestCase):
+
+    def test_matches_dropna_get_dummies(self):
+        df = sample_frame()
+        expected = pd.get_dummies(df.dropna(), drop_first=True)
+        cleaned = clean_raw_data(df)
+        self.assertEqual(list(cleaned.columns), list(expected.columns))
+        pd.testing.assert_frame_equal(cleaned, expected, check_dtype=False)
+
+    def test_fitted_preprocessor_keeps_the_columns(self):
+        df = sample_frame()
+        preprocessor = Preprocessor(numeric="drop", categorical="drop", other="drop", drop_first=True).fit(df)
+        other = df[df["c"] != "blue"]
+        self.assertEqual(list(clean_raw_data(other, preprocessor).columns), list(clean_raw_data(df).columns))
+
+
+class ReadCsvChunkedTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.path = os.path.join(tmp, "data.csv")
+
+    def test_matches_read_csv(self):
+        # "late" is empty in the first chunks; "mixed" parses as numbers until its second chunk
+        n = 250
+        rng = np.random.default_rng(3)
+        late = np.full(n, None, dtype=object)
+        late[200:] = rng.choice(["x", "y"], size=n - 200)
+        mixed = np.arange(n).astype(object)
+        mixed[150] = "unknown"
+        pd.DataFrame({"num": rng.normal(size=n), "late": late, "mixed": mixed,
+                      "text": rng.choice(["a", "b", "c"], size=n)}).to_csv(self.path, index=False)
+        df, columns, preview = read_csv_chunked(self.path, chunksize=100)
+        expected = pd.read_csv(self.path)
+        self.assertEqual(len(preview), 5)
+        for col in ("late", "mixed", "text"):
+            self.assertIsInstance(df[col].dtype, pd.CategoricalDtype, col)
+            self.assertEqual(df[col].astype(object).where(df[col].notna(), None).tolist(),
+                             expected[col].astype(object).where(expected[col].notna(), None).tolist())
+            self.assertEqual(columns[col]["nunique"], expected[col].nunique())
+            self.assertEqual(columns[col]["nulls"], expected[col].isna().sum())
+        np.testing.assert_array_equal(df["num"].to_numpy(), expected["num"].to_numpy())
+
+
+if __name__ == "__main__":
+    unittest.main()
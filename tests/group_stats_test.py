@@ -0,0 +1,89 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from src.column_profile import build_profile
+from src.group_stats import group_summary, one_way_anova, welch_anova, kruskal_wallis, welch_t, grouped_tests
+
+
+def sample_frame(n=500, seed=0):
+    # Unequal group spreads (for Welch), rounded values (ties) and missing rows
+    rng = np.random.default_rng(seed)
+    g = rng.choice(["a", "b", "c", "d"], size=n, p=[0.4, 0.3, 0.2, 0.1])
+    scale = pd.Series(g).map({"a": 1.0, "b": 2.0, "c": 0.5, "d": 3.0}).to_numpy()
+    df = pd.DataFrame({
+        "g": g,
+        "y": np.round(rng.normal(size=n) * scale + (g == "b"), 1),
+        "z": rng.integers(0, 4, size=n).astype(float),
+    })
+    for col in df.columns:
+        df.loc[rng.random(n) < 0.1, col] = np.nan
+    return df
+
+
+def groups(df, target):
+    return [df.loc[df["g"] == level, target].dropna().to_numpy() for level in pd.unique(df["g"].dropna())]
+
+
+def reference_welch_anova(samples):
+    # Welch (1951), written out directly
+    k = len(samples)
+    n = np.array([len(s) for s in samples], dtype=float)
+    mean = np.array([s.mean() for s in samples])
+    w = n / np.array([s.var(ddof=1) for s in samples])
+    weighted_mean = np.sum(w * mean) / w.sum()
+    tmp = np.sum((1 - w / w.sum()) ** 2 / (n - 1))
+    f = np.sum(w * (mean - weighted_mean) ** 2) / (k - 1) / (1 + 2 * (k - 2) / (k ** 2 - 1) * tmp)
+    df2 = (k ** 2 - 1) / (3 * tmp)
+    return f, stats.f.sf(f, k - 1, df2), df2
+
+
+class GroupStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.df = sample_frame()
+        self.targets = ["y", "z"]
+
+    def test_one_way_anova_matches_scipy(self):
+        f, p, _ = one_way_anova(group_summary(self.df, "g", self.targets))
+        for i, target in enumerate(self.targets):
+            expected = stats.f_oneway(*groups(self.df, target))
+            self.assertAlmostEqual(f[i], expected.statistic, places=10)
+            self.assertAlmostEqual(p[i], expected.pvalue, places=10)
+
+    def test_welch_anova_matches_reference(self):
+        f, p, (_, df2) = welch_anova(group_summary(self.df, "g", self.targets))
+        for i, target in enumerate(self.targets):
+            expected = reference_welch_anova(groups(self.df, target))
+            np.testing.assert_allclose([f[i], p[i], df2[i]], expected, rtol=1e-10)
+
+    def test_kruskal_matches_scipy_with_ties(self):
+        h, p, _ = kruskal_wallis(group_summary(self.df, "g", self.targets, ranks=True))
+        for i, target in enumerate(self.targets):
+            expected = stats.kruskal(*groups(self.df, target))
+            self.assertAlmostEqual(h[i], expected.statistic, places=10)
+            self.assertAlmostEqual(p[i], expected.pvalue, places=10)
+
+    def test_kruskal_needs_ranks(self):
+        with self.assertRaises(ValueError):
+            kruskal_wallis(group_summary(self.df, "g", self.targets))
+
+    def test_welch_t_matches_scipy(self):
+        df = self.df[self.df["g"].isin(["a", "b"])]
+        t, p, _ = welch_t(group_summary(df, "g", self.targets))
+        for i, target in enumerate(self.targets):
+            expected = stats.ttest_ind(*groups(df, target), equal_var=False)
+            self.assertAlmostEqual(t[i], expected.statistic, places=10)
+            self.assertAlmostEqual(p[i], expected.pvalue, places=10)
+
+    def test_profile_codes_give_the_same_results(self):
+        profile = build_profile(self.df)
+        for method in ("anova", "welch_anova", "kruskal"):
+            self.assertEqual(grouped_tests(self.df, "g", self.targets, method=method, profile=profile),
+                             grouped_tests(self.df, "g", self.targets, method=method))
+
+
+if __name__ == "__main__":
+    unittest.main()
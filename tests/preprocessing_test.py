@@ -0,0 +1,100 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from src.preprocessing import Preprocessor, preprocess_csv
+
+
+def sample_frame(n=300, seed=0):
+    # Missing values in every kind of column, including bool and datetime
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        "x": np.round(rng.normal(size=n), 1),
+        "k": rng.integers(0, 10, size=n).astype(float),
+        "c": rng.choice(["red", "green", "blue"], size=n).astype(object),
+        "d": rng.choice(["p", "q"], size=n).astype(object),
+        "flag": pd.array(rng.random(n) < 0.5, dtype="boolean"),
+        "when": pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365, size=n), unit="D"),
+    })
+    for col in df.columns:
+        df.loc[rng.random(n) < 0.05, col] = None
+    return df
+
+
+def chunks(df, size):
+    return (df.iloc[i:i + size] for i in range(0, len(df), size))
+
+
+class PreprocessorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.df = sample_frame(seed=1)
+
+    def test_chunked_fit_matches_frame_fit(self):
+        for settings in ({"numeric": "median", "categorical": "mode"},
+                         {"numeric": "mean", "categorical": "missing"},
+                         {"numeric": "drop", "categorical": "drop", "other": "drop", "drop_first": True},
+                         {"numeric": "zero", "categorical": "keep", "encoding": "codes"}):
+            on_frame = Preprocessor(**settings).fit(self.df)
+            on_chunks = Preprocessor(**settings).fit(chunks(self.df, 64))
+            self.assertEqual(on_chunks.levels, on_frame.levels, settings)
+            self.assertEqual(on_chunks.fill.keys(), on_frame.fill.keys(), settings)
+            for col, value in on_frame.fill.items():
+                if isinstance(value, float):
+                    self.assertAlmostEqual(on_chunks.fill[col], value, places=10)
+                else:
+                    self.assertEqual(on_chunks.fill[col], value)
+            whole = on_frame.transform(self.df)
+            pieces = pd.concat(on_frame.transform_chunks(chunks(self.df, 64)))
+            pd.testing.assert_frame_equal(pieces, whole)
+
+    def test_median_fill_matches_pandas(self):
+        preprocessor = Preprocessor().fit(self.df)
+        self.assertEqual(preprocessor.fill["x"], self.df["x"].median())
+        self.assertEqual(preprocessor.fill["c"], self.df["c"].mode().iloc[0])
+        out = preprocessor.transform(self.df)
+        self.assertFalse(out[["x", "k"]].isna().any().any())
+
+    def test_unseen_levels_encode_as_zero_rows(self):
+        preprocessor = Preprocessor(categorical="keep").fit(self.df)
+        out = preprocessor.transform(pd.DataFrame({"x": [1.0], "k": [2.0], "c": ["purple"], "d": ["p"],
+                                                   "flag": [True], "when": [pd.Timestamp("2024-02-01")]}))
+        self.assertFalse(out.filter(like="c_").any(axis=None))
+        self.assertTrue(out["d_p"].iloc[0])
+
+    def test_sparse_blocks_match_dense(self):
+        dense = Preprocessor(sparse=False).fit_transform(self.df)
+        sparse = Preprocessor(sparse=True).fit_transform(self.df)
+        dense_again = sparse.astype({col: bool for col in sparse.columns
+                                     if isinstance(sparse[col].dtype, pd.SparseDtype)})
+        pd.testing.assert_frame_equal(dense_again, dense)
+
+    def test_save_load_round_trip(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        preprocessor = Preprocessor(numeric="mean", categorical="missing", max_levels=2).fit(self.df)
+        restored = Preprocessor.load(preprocessor.save(os.path.join(tmp, "preprocessor.json")))
+        self.assertEqual(restored.to_dict(), preprocessor.to_dict())
+        pd.testing.assert_frame_equal(restored.transform(self.df), preprocessor.transform(self.df))
+
+
+class PreprocessCsvTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+        self.path = os.path.join(tmp, "data.csv")
+
+    def test_preprocess_csv_matches_frame(self):
+        sample_frame(seed=2).drop(columns=["flag", "when"]).to_csv(self.path, index=False)
+        df, preprocessor = preprocess_csv(self.path, Preprocessor(numeric="mean"), chunksize=50)
+        expected = Preprocessor(numeric="mean").fit_transform(pd.read_csv(self.path))
+        pd.testing.assert_frame_equal(df, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()